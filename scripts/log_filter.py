@@ -26,10 +26,12 @@ from typing import Union
 # Internal
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
+from whatthelog.definitions import CACHE_DIR
+from whatthelog.log_reader import LogReader
 from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
 from whatthelog.syntaxtree.syntax_tree import SyntaxTree
 from whatthelog.auto_printer import AutoPrinter
-from whatthelog.utils import get_peak_mem, bytes_tostring, blocks
+from whatthelog.utils import get_peak_mem, bytes_tostring
 
 
 #****************************************************************************************************
@@ -39,6 +41,9 @@ from whatthelog.utils import get_peak_mem, bytes_tostring, blocks
 pool_size_default = 8
 chunk_size_default = 300000
 
+# Syntax tree of the current worker process, set once by the pool initializer
+worker_tree: Union[SyntaxTree, None] = None
+
 #****************************************************************************************************
 # Utility Functions
 #****************************************************************************************************
@@ -46,6 +51,13 @@ chunk_size_default = 300000
 def check_line(tree: SyntaxTree, line: str) -> Union[str, None]:
     return None if tree.search(line) else line
 
+def init_worker(tree: SyntaxTree) -> None:
+    global worker_tree
+    worker_tree = tree
+
+def check_line_worker(line: str) -> Union[str, None]:
+    return check_line(worker_tree, line)
+
 def print(msg): AutoPrinter.static_print(msg)
 
 
@@ -72,43 +84,36 @@ def main(argv):
 
     # --- Parse prefix tree ---
     print("Parsing configuration file...")
-    parser = SyntaxTreeFactory()
+    parser = SyntaxTreeFactory(CACHE_DIR)
     tree = parser.parse_file(config_filename)
 
-    # --- Count lines in file ---
-    print("Parsing logs file...")
-    with open(log_filename, 'r') as f:
-
-        line_total = sum(bl.count("\n") for bl in blocks(f))
-        print(f"[ Log Filter ] - Counted {line_total} lines")
-
     # --- Run filtering ---
     print("Filtering logs...")
-    with open(log_filename, 'r') as f:
+    reader = LogReader(log_filename)
+    lines = iter(reader)
+    with Pool(subprocesses, initializer=init_worker, initargs=(tree,)) as p:
 
         output = []
         finished = False
-        pbar = tqdm(total=line_total, file=sys.stdout, leave=False)
+        pbar = tqdm(total=reader.size, unit='B', unit_scale=True, file=sys.stdout, leave=False)
         while not finished:
 
             # --- Parse chunk of lines ---
             slice = []
             for x in range(chunk_size):
                 try:
-                    slice.append(str(next(f)))
+                    slice.append(next(lines))
                 except StopIteration:
                     finished = True
                     break
 
             # --- Filter chunk in subprocesses ---
-            with Pool(subprocesses) as p:
-                zipped = [(tree, line) for line in slice]
-                output += p.starmap(check_line, zipped)
-
-            if finished:
-                pbar.close()
-            else:
-                pbar.update(chunk_size)
+            output += p.map(check_line_worker, slice, chunksize=max(1, len(slice) // (subprocesses * 4)))
+
+            # --- Progress is reported in bytes read, no counting pass is needed ---
+            pbar.update(reader.offset - pbar.n)
+
+        pbar.close()
 
     # --- Remove nulls from result ---
     print("Removing filtered logs...")
@@ -20,7 +20,7 @@ import pathlib
 import random
 import sys
 from time import time
-from typing import List
+from typing import List, Tuple, Union
 import tracemalloc
 from tqdm import tqdm
 
@@ -33,6 +33,8 @@ sys.path.insert(0, "./../")
 # Internal
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
+from whatthelog.definitions import CACHE_DIR
+from whatthelog.log_reader import LogReader
 from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
 from whatthelog.syntaxtree.syntax_tree import SyntaxTree
 from whatthelog.auto_printer import AutoPrinter
@@ -44,6 +46,9 @@ from whatthelog.utils import get_peak_mem, bytes_tostring
 
 pool_size_default = 8
 config_default = os.path.join(pathlib.Path(__file__).parent.absolute(), "../resources/config.json")
+
+# Syntax tree of the current worker process, set once by the pool initializer
+worker_tree: Union[SyntaxTree, None] = None
 # random.seed(os.environ['random_seed'] if 'random_seed' in os.environ else 5)
 
 
@@ -180,18 +185,26 @@ def r_swap(lines: List[str], tree: SyntaxTree):
 
 
 def process_file(input_file: str, output_file: str, tree: SyntaxTree) -> None:
-    with open(input_file, 'r') as f:
-        lines = f.readlines()
-        n_mutations = random.randint(1, 3)
-        mutations = [random.choice([delete_one, swap, r_swap]) for _ in range(n_mutations)]
+    lines = list(LogReader(input_file))
+    n_mutations = random.randint(1, 3)
+    mutations = [random.choice([delete_one, swap, r_swap]) for _ in range(n_mutations)]
 
-        for func in mutations:
-            func(lines, tree)
+    for func in mutations:
+        func(lines, tree)
 
     with open(output_file, 'w+') as f:
         f.writelines(lines)
 
 
+def init_worker(tree: SyntaxTree) -> None:
+    global worker_tree
+    worker_tree = tree
+
+
+def process_file_worker(files: Tuple[str, str]) -> None:
+    process_file(files[0], files[1], worker_tree)
+
+
 def produce_false_trace(input_file: str, output_file: str, syntax_tree: SyntaxTree, state_model: PrefixTree) -> None:
     """
     Produces a log that guarantees a false trace will be created.
@@ -200,8 +213,16 @@ def produce_false_trace(input_file: str, output_file: str, syntax_tree: SyntaxTr
     :param syntax_tree: The syntax tree used to match an individual log entry.
     :param state_model: The state model used to validate a trace.
     """
-    with open(input_file, 'r') as f:
-        lines = f.readlines()
+    lines = list(LogReader(input_file))
+    n_mutations = random.randint(1, 3)
+    mutations = [random.choice([delete_one, swap, r_swap]) for _ in range(n_mutations)]
+
+    # Apply random mutations
+    for func in mutations:
+        func(lines, syntax_tree)
+
+    # While the produced log is still accepted, continue scrambling it
+    while match_trace(state_model, lines, syntax_tree):
         n_mutations = random.randint(1, 3)
         mutations = [random.choice([delete_one, swap, r_swap]) for _ in range(n_mutations)]
 
@@ -209,15 +230,6 @@ def produce_false_trace(input_file: str, output_file: str, syntax_tree: SyntaxTr
         for func in mutations:
             func(lines, syntax_tree)
 
-        # While the produced log is still accepted, continue scrambling it
-        while match_trace(state_model, lines.copy(), syntax_tree):
-            n_mutations = random.randint(1, 3)
-            mutations = [random.choice([delete_one, swap, r_swap]) for _ in range(n_mutations)]
-
-            # Apply random mutations
-            for func in mutations:
-                func(lines, syntax_tree)
-
     # Write to the output file
     with open(output_file, 'w+') as f:
         f.writelines(lines)
@@ -244,28 +256,19 @@ def main(argv):
 
     # --- Parse prefix tree ---
     print("[ Log Filter ] - Parsing configuration file...")
-    parser = SyntaxTreeFactory()
+    parser = SyntaxTreeFactory(CACHE_DIR)
     tree = parser.parse_file(config_file)
 
     # --- Run filtering ---
     print("[ Log Filter ] - Filtering logs...")
-    finished = False
+    output_files = [os.path.join(output_dir, os.path.basename(name)) for name in files]
     pbar = tqdm(total=len(files), file=sys.stdout, leave=False)
-    while not finished:
-
-        curr_n_files = min(pool_size, len(files))
-        curr_files = [files.pop(0) for _ in range(curr_n_files)]
-
-        if curr_n_files < pool_size:
-            finished = True
-
-        output_files = [os.path.join(output_dir, os.path.basename(name)) for name in curr_files]
-
-        # --- Filter chunk in subprocesses ---
-        with Pool(curr_n_files) as p:
-            p.starmap(process_file, zip(curr_files, output_files, [tree for _ in range(curr_n_files)]))
 
-        pbar.update(curr_n_files)
+    # --- Filter files in subprocesses, sending the syntax tree once per worker ---
+    with Pool(int(pool_size), initializer=init_worker, initargs=(tree,)) as p:
+        for _ in p.imap_unordered(process_file_worker, zip(files, output_files)):
+            pbar.update(1)
+    pbar.close()
 
     print(f"[ Log Filter ] - Done!")
     print(f"[ Log Filter ] - Time elapsed: {timedelta(seconds=time() - start_time)}")
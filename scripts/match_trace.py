@@ -1,27 +1,25 @@
-import random
-import os
-from typing import List, Union
+from itertools import chain
+from typing import Iterable, Iterator, List, Union
 
 from whatthelog.prefixtree.graph import Graph
 from whatthelog.prefixtree.prefix_tree import State
 from whatthelog.syntaxtree.syntax_tree import SyntaxTree
 
-# random.seed(os.environ['random_seed'] if 'random_seed' in os.environ else 5)
-
 
 def template_matches_state(template: str, state: State) -> bool:
-    return template in state.properties.log_templates
+    return state.properties.has_template(template)
 
 
 def match_trace(
         model: Graph,
-        trace: List[str],
+        trace: Iterable[str],
         syntax_tree: SyntaxTree) -> Union[List[State], None]:
     """
     Checks if a given trace matches a path in the prefix tree.
-    First, the first line is checked against the node of the prefix tree.
-    If it fits, a successor that matches the next line is picked and the list
-    is traversed recursively.
+    All the states matching the current line are tracked at once, so that
+    non-deterministic models are matched exactly rather than by picking a random successor.
+    The lines are consumed one at a time, so any iterable can be matched, e.g. a LogReader.
+    The input is never modified.
 
     :param model: The prefix tree in which states need to be matched.
     :param trace: The lines to be matched against the tree.
@@ -30,81 +28,22 @@ def match_trace(
              those states are returned in order. If no match is found, None is returned.
     """
 
-    if len(trace) == 0:
+    lines = iter(trace)
+    first = next(lines, None)
+    if first is None:
         # If the trace is empty, then it has been fully parsed
         return []
 
-    # Check which state the current line belongs to
-    template = syntax_tree.search(trace[0])
-
-    # If no state is found, return None
-    if template is None:
-        return None
-
-    # Get the root's children
-    root_children = list(
-        filter(lambda s: template_matches_state(template.name, s),
-               model.get_outgoing_states(model.start_node)))
-
-    # If no suitable option, return
-    if len(root_children) == 0:
-        return None
-
-    # Randomly pick first suitable state
-    current_state: State = random.choice(root_children)
-
-    # Check if the template matches the root of the state tree
-    if template_matches_state(template.name, current_state):
-
-        # If the trace is exactly one line long, return the root state if it is terminal
-        if len(trace) == 1:
-            return [current_state] if [s for s in model.get_outgoing_states(current_state) if s.is_terminal] else None
-
-        # Remove the checked line from trace
-        trace[:] = trace[1:]
-
-        # Find the state for the second line
-        template = syntax_tree.search(trace[0])
-
-        # If no state is found, raise an exception
-        if template is None:
-            return None
-
-        # Check if any of the children of current node contain the template in their state
-        children: List[State] = model.get_outgoing_states(current_state)
-        successor: List[State] = list(filter(
-            lambda next_state: template_matches_state(template.name, next_state),
-            children))
-
-        if len(successor) == 0:
-            # If none found, the trace cannot be matched
-            return None
-        else:
-            # Pick a random suitable next node
-            # TODO: Should this be removed through an invariant in the prefix tree?
-            next_node: State = random.choice(successor)
-
-            # Continue the search recursively
-            tail: List[State] = match_trace_rec(next_node, model, trace[1:], syntax_tree)
-
-            if tail is None:
-                # If the search failed, return none
-                return None
-            else:
-                # If it was successful, prepend the current state
-                tail.insert(0, current_state)
-                return tail
+    return model.find_path(get_templates(chain([first], lines), syntax_tree))
 
 
 def match_trace_rec(
         current_state: State,
         model: Graph,
-        trace: List[str],
+        trace: Iterable[str],
         syntax_tree: SyntaxTree) -> Union[List[State], None]:
     """
-    Recursive helper for the match_trace function. This function recursively
-    finds the next state in the prefix tree for a the first line in the trace
-    if any exists.
+    Helper for the match_trace function, matching the trace starting from the given state.
 
     :param current_state: The current state of the prefix tree
     :param model: The prefix tree in which states need to be matched.
@@ -113,34 +52,20 @@ def match_trace_rec(
     :return: If the trace corresponds to a sequence of states in the prefix tree,
              those states are returned in order. If no match is found, None is returned.
     """
-    res = [current_state]
-
-    while len(trace) != 0:
-        # Find the template of the first line in the syntax tree
-        template = syntax_tree.search(trace[0])
 
-        # If no state is found, raise an exception
-        if template is None:
-            return None
+    tail = model.find_path(get_templates(trace, syntax_tree), current_state)
+    return [current_state] + tail if tail is not None else None
 
-        # Check if any of the children of current node contain the template in their state
-        children: List[State] = model.get_outgoing_states(current_state)
-        successor: List[State] = list(
-            filter(lambda next_state: template_matches_state(template.name, next_state), children))
 
-        if len(successor) == 0:
-            # If none found, the trace cannot be matched
-            return None
-        else:
-            # Pick a random suitable next node
-            current_state = random.choice(successor)
-
-            # Append result to the list of states
-            res.append(current_state)
+def get_templates(trace: Iterable[str], syntax_tree: SyntaxTree) -> Iterator[Union[str, None]]:
+    """
+    Lazily retrieves the name of the template of each line in a trace.
 
-            # Remove first trace
-            trace = trace[1:]
+    :param trace: The lines of the trace.
+    :param syntax_tree: The syntax tree used to validate the lines.
+    :return: An iterator over the names of the templates, yielding None for lines not matched by the syntax tree.
+    """
 
-    if [state.is_terminal for state in model.get_outgoing_states(current_state) if state.is_terminal]:
-        return res
-    return None
+    for line in trace:
+        template = syntax_tree.search(line)
+        yield template.name if template is not None else None
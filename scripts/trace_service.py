@@ -0,0 +1,90 @@
+# ****************************************************************************************************
+# Imports
+# ****************************************************************************************************
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+import asyncio
+from os import path
+import sys
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Internal
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from whatthelog.auto_printer import AutoPrinter
+from whatthelog.definitions import CACHE_DIR
+from whatthelog.trace_service import TraceService
+
+
+def print(msg): AutoPrinter.static_print(msg)
+
+
+# ****************************************************************************************************
+# Main Code
+# ****************************************************************************************************
+
+async def run(service: TraceService, sources, follow: bool) -> None:
+    """
+    Serves the given sources and prints the events of the completed traces until all the sources end.
+    Sources prefixed with 'unix:' are Unix socket paths to listen on, and never end.
+    :param service: the trace service
+    :param sources: the files and sockets to serve
+    :param follow: whether to keep following files at their end
+    """
+
+    servers = []
+    sessions = []
+    for source in sources:
+        if source.startswith("unix:"):
+            servers.append(await service.serve_unix(source[len("unix:"):]))
+        else:
+            sessions.append(asyncio.ensure_future(service.tail_file(source, follow)))
+
+    async def consume():
+        while True:
+            print(str(await service.events.get()))
+
+    consumer = asyncio.ensure_future(consume())
+    try:
+        await asyncio.gather(*sessions)
+        if servers:
+            # Sockets are served until the process is interrupted
+            await asyncio.Event().wait()
+        while not service.events.empty():
+            await asyncio.sleep(0)
+    finally:
+        consumer.cancel()
+        for server in servers:
+            server.close()
+
+
+def main(argv):
+
+    assert len(argv) >= 3, "Not enough arguments supplied!"
+
+    # --- Parse CLI args ---
+    follow = "--follow" in argv
+    argv = [arg for arg in argv if arg != "--follow"]
+    model_filename = argv[0]
+    config_filename = argv[1]
+    sources = argv[2:]
+
+    assert path.exists(model_filename), "Model file not found!"
+    assert path.exists(config_filename), "Config file not found!"
+
+    # --- Load model and syntax tree once ---
+    print("Loading model...")
+    service = TraceService.load(model_filename, config_filename, CACHE_DIR)
+
+    print("Serving traces...")
+    try:
+        asyncio.run(run(service, sources, follow))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,52 @@
+# ****************************************************************************************************
+# Imports
+# ****************************************************************************************************
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+import sys
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Internal
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from whatthelog.auto_printer import AutoPrinter
+from whatthelog.definitions import CACHE_DIR
+from whatthelog.prefixtree.prefix_tree_factory import PrefixTreeFactory
+
+
+def print(msg): AutoPrinter.static_print(msg)
+
+
+# ****************************************************************************************************
+# Main Code
+# ****************************************************************************************************
+
+def main(argv):
+
+    assert len(argv) >= 3, "Not enough arguments supplied!"
+
+    # --- Parse CLI args ---
+    remove_trivial_loops = "--remove-trivial-loops" in argv
+    argv = [arg for arg in argv if arg != "--remove-trivial-loops"]
+    # Seconds since the last modification of a trace file before it is inserted
+    settle_time = 60.0
+    for arg in [arg for arg in argv if arg.startswith("--settle-time=")]:
+        settle_time = float(arg.split("=", 1)[1])
+    argv = [arg for arg in argv if not arg.startswith("--settle-time=")]
+    tree_filename = argv[0]
+    traces_dir = argv[1]
+    config_filename = argv[2]
+    processes = int(argv[3]) if len(argv) > 3 else 1
+
+    # --- Insert the new traces and persist the tree ---
+    tree = PrefixTreeFactory.update_prefix_tree(tree_filename, traces_dir, config_filename,
+                                                remove_trivial_loops, processes, cache_dir=CACHE_DIR,
+                                                settle_time=settle_time)
+    print(f"Tree has {tree.size()} states.")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,5 +1,6 @@
 import pytest
 import os
+import shutil
 
 from whatthelog.markovchain.masm import MarkovChain
 from whatthelog.definitions import PROJECT_ROOT
@@ -125,3 +126,26 @@ def test_merge_state(masm: MarkovChain):
     assert len(masm.transitionMatrix[0]) == 2
     # View guidelines in the paper
     assert masm.transitionMatrix == [[0.75, 0.2], [0.6, 0.3]]
+
+
+def test_parallel(masm: MarkovChain):
+    matrix = masm.parallel(os.listdir(masm.traces_dir))
+
+    # Every trace starts at the root and ends in the terminal state
+    assert sum(matrix[masm.states['root']]) == len(os.listdir(masm.traces_dir))
+    assert sum(row[masm.states['terminal']] for row in matrix) == len(os.listdir(masm.traces_dir))
+
+
+def test_count_transitions_duplicates(masm: MarkovChain, tmp_path):
+    files = os.listdir(masm.traces_dir)
+    counts, deduplicator = masm.count_transitions(files)
+
+    for file in files:
+        for copy in range(3):
+            shutil.copy(os.path.join(masm.traces_dir, file), tmp_path.joinpath(f"{file}_{copy}"))
+    masm.traces_dir = str(tmp_path) + '/'
+    duplicated_counts, duplicated_deduplicator = masm.count_transitions(os.listdir(masm.traces_dir))
+
+    assert (duplicated_counts == 3 * counts).all()
+    assert duplicated_deduplicator.traces == 3 * deduplicator.traces
+    assert len(duplicated_deduplicator) == len(deduplicator)
@@ -0,0 +1,81 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from whatthelog.exceptions import NonDeterminismException
+from whatthelog.log_reader import LogReader
+from whatthelog.prefixtree.compiled_graph import CompiledGraph
+from whatthelog.prefixtree.graph import Graph
+from whatthelog.prefixtree.prefix_tree import PrefixTree
+from whatthelog.prefixtree.prefix_tree_factory import PrefixTreeFactory
+from whatthelog.prefixtree.state import State
+from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
+
+PROJECT_ROOT = Path(os.path.abspath(os.path.dirname(__file__))).parent.parent
+
+
+@pytest.fixture
+def graph() -> Graph:
+    start = State(["start"])
+    terminal = State(["terminal"], True)
+    graph = Graph(start, terminal)
+
+    a = State(["a"])
+    b = State(["b", "c"])
+    graph.add_state(a)
+    graph.add_state(b)
+
+    graph.add_edge(start, a)
+    graph.add_edge(a, b)
+    graph.add_edge(b, b)
+    graph.add_edge(b, terminal)
+
+    return graph
+
+
+def test_compile(graph: Graph):
+    compiled = graph.compile()
+
+    assert compiled.table.dtype == np.int32
+    assert compiled.table.shape[0] == 4
+    assert list(compiled.accepting) == [False, False, False, True]
+    assert compiled.start == 0
+
+    assert compiled.match(CompiledGraph.encode(["a", "b", "c", "b"]))
+    assert not compiled.match(CompiledGraph.encode(["a"]))
+    assert not compiled.match(CompiledGraph.encode(["b"]))
+    assert not compiled.match(CompiledGraph.encode(["a", "never seen"]))
+    assert not compiled.match(CompiledGraph.encode([]))
+
+
+def test_match_many(graph: Graph):
+    traces = [["a", "b"], ["a"], [], ["a", "c", "c", "c"], ["a", "b", "a"], ["a", "b", "terminal"]]
+
+    result = graph.compile().match_many([CompiledGraph.encode(trace) for trace in traces])
+
+    assert list(result) == [True, False, False, True, False, False]
+
+
+def test_compile_nondeterministic(graph: Graph):
+    graph.add_state(State(["a"]))
+    graph.add_edge(graph.start_node, graph.states[4])
+
+    with pytest.raises(NonDeterminismException):
+        graph.compile()
+
+
+def test_match_traces():
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/traces")
+    config_path = PROJECT_ROOT.joinpath("resources/config.json")
+    tree: PrefixTree = PrefixTreeFactory().get_prefix_tree(traces_path, config_path)
+    syntax_tree = SyntaxTreeFactory().parse_file(config_path)
+
+    traces = [CompiledGraph.encode_lines(LogReader(traces_path.joinpath(name)), syntax_tree)
+              for name in sorted(os.listdir(traces_path))]
+    traces.append(traces[0][:-1])
+
+    result = tree.compile().match_many(traces)
+
+    assert list(result) == [True] * (len(traces) - 1) + [False]
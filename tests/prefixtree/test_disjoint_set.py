@@ -0,0 +1,43 @@
+from whatthelog.prefixtree.disjoint_set import DisjointSet
+
+
+def test_find():
+    sets = DisjointSet()
+
+    assert sets.find(3) == 3
+    assert 3 in sets
+    assert 4 not in sets
+    assert len(sets) == 1
+
+
+def test_union():
+    sets = DisjointSet()
+
+    sets.union(0, 1)
+    sets.union(2, 3)
+    assert sets.find(0) == sets.find(1)
+    assert sets.find(0) != sets.find(2)
+
+    sets.union(3, 1)
+    assert len({sets.find(i) for i in range(4)}) == 1
+
+
+def test_leader():
+    sets = DisjointSet()
+
+    sets.union(5, 1)
+    sets.union(2, 3)
+    sets.union(4, 2)
+    assert sets.union(4, 5) == 4
+
+    assert all(sets.leader(i) == 4 for i in range(1, 6))
+    assert list(sets.leaders.values()) == [4]
+
+
+def test_clear():
+    sets = DisjointSet()
+    sets.union(0, 1)
+    sets.clear()
+
+    assert len(sets) == 0
+    assert sets.find(1) == 1
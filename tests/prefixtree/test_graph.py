@@ -1,12 +1,15 @@
+import pickle
+import random
 from copy import deepcopy
 from typing import List
 
 import pytest
 
-from whatthelog.exceptions import StateDoesNotExistException
+from whatthelog.exceptions import StateDoesNotExistException, NonDeterminismException
 from whatthelog.prefixtree.edge_properties import EdgeProperties
 from whatthelog.prefixtree.graph import Graph
 from whatthelog.prefixtree.state import State
+from whatthelog.prefixtree.template_vocabulary import TemplateVocabulary
 
 
 @pytest.fixture
@@ -215,7 +218,7 @@ def test_complex_merge_2(graph_2: Graph):
     graph_2.full_merge_states(graph_2.states[0],
                               graph_2.states[1])
 
-    new_node = graph_2.states[2]
+    new_node = graph_2.states[0]
 
     assert len(graph_2) == 3
     assert new_node.properties.log_templates == ["0", "1"]
@@ -225,7 +228,7 @@ def test_complex_merge_3(graph_2: Graph):
     graph_2.full_merge_states(graph_2.states[0],
                               graph_2.states[3])
 
-    new_node = graph_2.states[1]
+    new_node = list(graph_2.states.values())[0]
 
     assert len(graph_2) == 1
     assert set(new_node.properties.log_templates) == {"0", "1", "2"}
@@ -239,7 +242,7 @@ def test_complex_merge_4(graph_2: Graph):
 
     graph_2.full_merge_states(graph_2.states[0],
                               graph_2.states[3])
-    new_node = graph_2.states[4]
+    new_node = list(graph_2.states.values())[0]
     assert len(graph_2) == 1
     assert set(new_node.properties.log_templates) == {"0", "1", "2"}
 
@@ -364,3 +367,330 @@ def test_merge_bug():
     graph.merge_states(child1, root)
 
     print(graph.get_outgoing_states(child1))
+
+
+def test_edges_rewire():
+    graph = Graph()
+    states = [State([str(i)]) for i in range(4)]
+    for state in states:
+        graph.add_state(state)
+
+    graph.add_edge(states[0], states[1], EdgeProperties(["a"]))
+    graph.add_edge(states[1], states[2], EdgeProperties(["b"]))
+    graph.add_edge(states[3], states[2], EdgeProperties(["c"]))
+    graph.add_edge(states[2], states[2])
+
+    graph.edges.change_parent_of_children(1, 2)
+    graph.edges.change_children_of_parents(2, 1)
+
+    assert graph.edges.list == ["0.1.['a']", "1.1.['b']", "3.1.['c']"]
+    assert graph.edges[1, 1] == "['b']"
+    assert graph.edges.find_children(2) is None
+    assert graph.edges.get_parents(1) == [0, 1, 3]
+    assert len(graph.edges) == 3
+
+
+def test_edges_reverse_index(graph_2: Graph):
+    graph_2.full_merge_states(graph_2.states[0], graph_2.states[3])
+
+    edges = graph_2.edges
+    for start, row in edges.rows.items():
+        for end in row:
+            assert start in edges.columns[end]
+    for end, column in edges.columns.items():
+        for start in column:
+            assert end in edges.rows[start]
+
+    state = list(graph_2.states.values())[0]
+    assert graph_2.get_incoming_states(state) == [state]
+
+
+def test_merge_many_states(graph: Graph):
+    expected = deepcopy(graph)
+    expected.merge_states(expected.states[0], expected.states[1])
+    expected.merge_states(expected.states[0], expected.states[3])
+    expected.merge_states(expected.states[2], expected.states[4])
+
+    graph.merge_many_states([(graph.states[0], graph.states[1]),
+                             (graph.states[1], graph.states[3]),
+                             (graph.states[2], graph.states[4])])
+
+    assert len(graph) == 2
+    assert graph.edges.list == expected.edges.list
+    assert graph.states[0].properties.log_templates == ["0", "1", "3"]
+    assert graph.states[2].properties.log_templates == ["2", "4"]
+    assert graph.get_outgoing_states(graph.states[0]) == [graph.states[0], graph.states[2]]
+
+
+def test_lazy_merge_states(graph: Graph):
+    expected = deepcopy(graph)
+    expected.merge_states(expected.states[0], expected.states[1])
+    expected.merge_states(expected.states[0], expected.states[3])
+
+    state0, state1, state3 = graph.states[0], graph.states[1], graph.states[3]
+    graph.lazy_merge_states(state1, state3)
+    graph.lazy_merge_states(state0, state1)
+    assert len(graph.states) == 5
+
+    assert graph.get_outgoing_states(state0) == [state0, graph.states[2], graph.states[4]]
+    assert len(graph.pending_merges) == 0
+    assert len(graph) == 3
+    assert graph.edges.list == expected.edges.list
+    assert set(state0.properties.log_templates) == {"0", "1", "3"}
+
+
+def test_lazy_merge_start_node():
+    start, other, state = State(["start"]), State(["other"]), State(["x"])
+    terminal = State(["end"], is_terminal=True)
+    graph = Graph(start, terminal)
+    graph.add_state(other)
+    graph.add_state(state)
+    graph.add_edge(start, state)
+    graph.add_edge(state, terminal)
+
+    # The start node is merged away, the matching methods must look up the state it was merged into
+    graph.lazy_merge_states(other, start)
+
+    assert graph.match_log_template_trace(["x"])
+    assert graph.start_node is other
+
+    another = State(["another"])
+    graph.add_state(another)
+    graph.lazy_merge_states(another, other)
+    assert graph.find_path(["x"]) == [state]
+    assert graph.start_node is another
+
+
+def test_determinize_long_chains():
+    root = State(["root"])
+    graph = Graph(root)
+
+    length = 3000
+    for _ in range(2):
+        parent = root
+        for i in range(length):
+            child = State([str(i)])
+            graph.add_state(child)
+            graph.add_edge(parent, child)
+            parent = child
+
+    new_root, merged = graph.merge_equivalent_children(root)
+
+    assert merged
+    assert new_root is root
+    assert len(graph) == length + 1
+    assert all(len(graph.get_outgoing_states(state)) <= 1 for state in graph.states.values())
+
+
+def test_determinize_many_equivalent_children():
+    root = State(["root"])
+    graph = Graph(root)
+
+    children = 4000
+    for i in range(children):
+        child = State(["a"])
+        leaf = State([str(i % 50)])
+        graph.add_state(child)
+        graph.add_state(leaf)
+        graph.add_edge(root, child)
+        graph.add_edge(child, leaf)
+
+    assert graph.determinize(root) is root
+    assert len(graph) == 52
+    assert len(graph.get_outgoing_states(graph.get_outgoing_states(root)[0])) == 50
+
+
+def test_determinize_propagates_to_parents():
+    states = [State([template]) for template in ["2", "1", "1", "1", "1", "1", "1"]]
+    graph = Graph(states[0])
+    for state in states[1:]:
+        graph.add_state(state)
+    for start, end in [(0, 1), (0, 2), (2, 3), (2, 4), (0, 5), (3, 6), (6, 5)]:
+        graph.add_edge(states[start], states[end])
+
+    graph.full_merge_states_with_children(states[4])
+
+    assert len(graph) == 4
+    assert graph.get_outgoing_states(states[0]) == [states[1]]
+    assert graph.get_outgoing_states(states[1]) == [states[3]]
+    assert graph.get_outgoing_states(states[3]) == [states[6]]
+    assert graph.get_outgoing_states(states[6]) == [states[1]]
+
+
+def reference_determinize(graph: Graph, state: State) -> State:
+    """
+    Recursive determinization the worklist one replaced, run on the same graph API.
+    """
+
+    def merge_equivalent_children(current: State):
+        def find_duplicates():
+            children = graph.get_outgoing_states(current)
+            templates = [child.properties.log_templates for child in children]
+            duplicates = []
+            for i, x in enumerate(templates):
+                j = next(k for k, other in enumerate(templates) if any(item in other for item in x))
+                if i != j:
+                    duplicates.append((children[i], children[j]))
+            return duplicates
+
+        merged = False
+        duplicates = find_duplicates()
+        has_nondeterminism = len(duplicates) > 0
+        while len(duplicates) > 0:
+            s1, s2 = duplicates.pop()
+            if s1 is current:
+                current = s2
+            graph.merge_states(s2, s1)
+            merged = True
+            duplicates = find_duplicates()
+
+        if has_nondeterminism:
+            for child in graph.get_outgoing_states_not_self(current):
+                merge_equivalent_children(child)
+
+        return current, merged
+
+    new_state, _ = merge_equivalent_children(state)
+    parents = graph.get_incoming_states(new_state)
+    while len(parents) > 0:
+        current, changed = merge_equivalent_children(parents.pop())
+        if changed:
+            new_state = current
+            parents = graph.get_incoming_states(current)
+    return new_state
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_determinize_matches_reference(seed: int):
+    generator = random.Random(seed)
+
+    for _ in range(50):
+        size = generator.randrange(4, 30)
+        templates = [str(generator.randrange(generator.randrange(2, 6))) for _ in range(size)]
+        edges = {(generator.randrange(i), i) for i in range(1, size)}
+        edges |= {(generator.randrange(size), generator.randrange(size)) for _ in range(generator.randrange(size))}
+        first, second = generator.sample(range(size), 2)
+
+        graphs = []
+        for _ in range(2):
+            states = [State([template]) for template in templates]
+            graph = Graph(states[0])
+            for state in states[1:]:
+                graph.add_state(state)
+            for start, end in sorted(edges):
+                graph.add_edge(states[start], states[end])
+            graph.merge_states(states[first], states[second])
+            graphs.append((graph, states[first]))
+
+        (graph, state), (expected, expected_state) = graphs
+        try:
+            expected_result = reference_determinize(expected, expected_state)
+        except StateDoesNotExistException:
+            # The recursive version fails on states merged away while it runs
+            continue
+
+        result = graph.determinize(state)
+
+        assert graph.state_indices_by_id[id(result)] == expected.state_indices_by_id[id(expected_result)]
+        assert graph.edges.list == expected.edges.list
+        assert {index: s.properties.log_templates for index, s in graph.states.items()} == \
+               {index: s.properties.log_templates for index, s in expected.states.items()}
+
+
+def test_transitions(graph: Graph):
+    transitions = graph.get_transitions()
+    zero, one = TemplateVocabulary.get_id("0"), TemplateVocabulary.get_id("1")
+
+    assert transitions[0] == {one: 1, TemplateVocabulary.get_id("2"): 2, TemplateVocabulary.get_id("4"): 4}
+    assert graph.get_transitions() is transitions
+    assert graph.match_log_template_trace(["1", "3"])
+    assert not graph.match_log_template_trace(["1", "2"])
+
+    graph.add_edge(graph.states[3], graph.states[0])
+    assert graph.transitions is transitions
+    assert transitions[3] == {zero: 0}
+    assert graph.match_log_template_trace(["1", "3", "0", "4"])
+
+    graph.add_edge(graph.states[0], graph.states[0])
+    graph.merge_states(graph.states[0], graph.states[1])
+    assert graph.transitions is None
+    assert graph.get_transitions()[0][zero] == 0
+    assert graph.get_transitions()[0][one] == 0
+
+    restored = pickle.loads(pickle.dumps(graph))
+    assert restored.transitions is None
+    assert restored.get_transitions() == graph.get_transitions()
+
+
+def test_add_state_after_merge(graph: Graph):
+    graph.get_transitions()
+    graph.merge_states(graph.states[1], graph.states[3])
+    graph.get_transitions()
+
+    # The index of the merged state is never reused, so no live state is replaced
+    state = State(["5"])
+    graph.add_state(state)
+    graph.add_edge(graph.states[4], state)
+
+    assert graph.state_indices_by_id[id(state)] == 5
+    assert graph.states[4].properties.log_templates == ["4"]
+    assert graph.get_transitions()[4] == {TemplateVocabulary.get_id("5"): 5}
+    assert graph.get_transitions()[0][TemplateVocabulary.get_id("4")] == 4
+
+    restored = pickle.loads(pickle.dumps(graph))
+    restored.add_state(State(["6"]))
+    assert sorted(restored.states) == [0, 1, 2, 4, 5, 6]
+
+
+def test_is_accepting():
+    start, state, terminal = State(["0"]), State(["1"]), State(["end"], is_terminal=True)
+    graph = Graph(start, terminal)
+    graph.add_state(state)
+    graph.add_edge(start, state)
+
+    assert not graph.is_accepting(0)
+    graph.add_edge(state, terminal)
+    assert graph.is_accepting(2)
+    assert graph.accepting == {2}
+
+    graph.merge_states(start, state)
+    assert graph.transitions is None
+    assert graph.is_accepting(0)
+    assert graph.compile().accepting.tolist() == [True, False]
+
+
+def test_transitions_nondeterministic(graph: Graph):
+    graph.add_state(State(["1", "5"]))
+    graph.add_edge(graph.states[0], graph.states[5])
+
+    assert graph.get_transitions()[0][TemplateVocabulary.get_id("1")] == Graph.nondeterministic
+    assert graph.match_log_template_trace(["5"])
+    with pytest.raises(NonDeterminismException):
+        graph.match_log_template_trace(["1"])
+
+
+def test_find_path_nondeterministic():
+    start = State(["start"])
+    terminal = State(["terminal"], True)
+    graph = Graph(start, terminal)
+
+    a1, a2, b, c = State(["a"]), State(["a"]), State(["b"]), State(["c", "b"])
+    for state in [a1, a2, b, c]:
+        graph.add_state(state)
+    graph.add_edge(start, a1)
+    graph.add_edge(start, a2)
+    graph.add_edge(a1, b)
+    graph.add_edge(a2, c)
+    graph.add_edge(b, terminal)
+    graph.add_edge(c, terminal)
+    graph.add_edge(c, c)
+
+    assert graph.find_path(["a", "c"]) == [a2, c]
+    assert graph.find_path(["a", "c", "b", "c"]) == [a2, c, c, c]
+    assert graph.find_path(["a", "b"]) == [a1, b]
+    assert graph.find_path(["a", "b", "b"]) == [a2, c, c]
+    assert graph.find_path(["a"]) is None
+    assert graph.find_path(["a", "d"]) is None
+    assert graph.find_path(["b"], a1) == [b]
+    assert graph.find_path([], b) == []
+    assert graph.find_path([]) is None
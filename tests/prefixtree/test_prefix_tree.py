@@ -3,6 +3,7 @@ import pytest
 from whatthelog.exceptions import InvalidTreeException
 from whatthelog.prefixtree.prefix_tree import PrefixTree
 from whatthelog.prefixtree.state import State
+from whatthelog.prefixtree.template_vocabulary import TemplateVocabulary
 
 @pytest.fixture()
 def tree():
@@ -115,3 +116,67 @@ def test_merge_different_roots(tree: PrefixTree):
     with pytest.raises(InvalidTreeException):
         other = PrefixTree(State(["other"]))
         tree.merge(other)
+
+
+def test_merge_terminal_and_loops():
+    tree = PrefixTree(State(["root"]), State(["end"], True))
+    child1 = State(["child1"])
+    tree.add_child(child1, tree.get_root())
+    tree.add_edge(child1, tree.get_terminal())
+
+    other = PrefixTree(State(["root"]), State(["end"], True))
+    other_child1 = State(["child1"])
+    other_child2 = State(["child2"])
+    other.add_child(other_child1, other.get_root())
+    other.add_child(other_child2, other_child1)
+    other.add_edge(other_child2, other_child2)
+    other.add_edge(other_child2, other.get_terminal())
+    other.add_edge(other_child1, other.get_terminal())
+
+    tree.merge(other)
+
+    assert len(tree) == 4
+    assert tree.get_children(child1) == [tree.get_terminal(), other_child2]
+    assert tree.get_children(other_child2) == [tree.get_terminal(), other_child2]
+
+
+def test_get_child(tree: PrefixTree):
+    root = tree.get_root()
+    child1 = State(["child1"])
+    child2 = State(["child2", "child1"])
+    tree.add_child(child1, root)
+
+    assert tree.get_child(root, TemplateVocabulary.get_id("child1")) is child1
+    assert tree.get_child(root, TemplateVocabulary.get_id("child2")) is None
+
+    tree.add_child(child2, root)
+
+    assert tree.get_child(root, TemplateVocabulary.get_id("child2")) is child2
+    assert tree.get_child(root, TemplateVocabulary.get_id("child1")) is child1
+    assert tree.get_child(child1, TemplateVocabulary.get_id("child1")) is None
+
+
+def test_trace_counts():
+    tree = PrefixTree(State(["root"]), State(["end"], is_terminal=True))
+    child = State(["child"])
+    tree.add_child(child, tree.get_root())
+
+    assert tree.get_trace_count(child) == 0
+
+    tree.add_trace_end(child)
+    tree.add_trace_end(child, 2)
+    assert tree.get_trace_count(child) == 3
+
+    other = PrefixTree(State(["root"]), State(["end"], is_terminal=True))
+    other_child = State(["child"])
+    other_leaf = State(["leaf"])
+    other.add_child(other_child, other.get_root())
+    other.add_child(other_leaf, other_child)
+    other.add_trace_end(other_child, 4)
+    other.add_trace_end(other_leaf, 5)
+
+    tree.merge(other)
+
+    assert tree.get_trace_count(child) == 7
+    assert tree.get_trace_count(other_leaf) == 5
+    assert tree.get_trace_count(tree.get_root()) == 0
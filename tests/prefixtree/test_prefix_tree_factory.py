@@ -1,10 +1,16 @@
 import os
+import shutil
+import time
 from pathlib import Path
 
 import pytest
 
+from whatthelog.exceptions import InvalidTreeException
+from whatthelog.log_reader import LogReader
 from whatthelog.prefixtree.prefix_tree import PrefixTree
 from whatthelog.prefixtree.prefix_tree_factory import PrefixTreeFactory
+from whatthelog.prefixtree.state import State
+from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
 
 PROJECT_ROOT = Path(os.path.abspath(os.path.dirname(__file__))).parent.parent
 
@@ -73,6 +79,24 @@ def test_pickle(tree: PrefixTree):
     os.remove(pickle_file_path)
 
 
+def test_unpickle_legacy_tree():
+    # Pickled by the former implementation, which stored template names and string edge entries
+    pt = PrefixTreeFactory.unpickle_tree(PROJECT_ROOT.joinpath("tests/resources/legacy_tree.p"))
+    tree = PrefixTreeFactory().get_prefix_tree(PROJECT_ROOT.joinpath("tests/resources/traces"),
+                                               PROJECT_ROOT.joinpath("resources/config.json"))
+    syntax_tree = SyntaxTreeFactory().parse_file(PROJECT_ROOT.joinpath("resources/config.json"))
+
+    assert pt.size() == tree.size()
+    assert len(pt.edges) == len(tree.edges)
+    assert pt.edges.get_parents(2) == [0]
+    for name in sorted(os.listdir(PROJECT_ROOT.joinpath("tests/resources/traces"))):
+        assert pt.match_trace(LogReader(PROJECT_ROOT.joinpath("tests/resources/traces", name)), syntax_tree)
+
+    state = State(["new"])
+    pt.add_state(state)
+    assert pt.state_indices_by_id[id(state)] == pt.size() - 1
+
+
 def test_remove_trivial_loops_single_file():
     traces_path = "tests/resources/traces_single"
     tree = PrefixTreeFactory().get_prefix_tree(
@@ -95,3 +119,176 @@ def test_remove_trivial_loops_several():
 
 
 
+
+
+@pytest.mark.parametrize("remove_trivial_loops", [False, True])
+def test_parallel(remove_trivial_loops: bool):
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/testlogs")
+    config_path = PROJECT_ROOT.joinpath("resources/config.json")
+
+    sequential = PrefixTreeFactory.get_prefix_tree(traces_path, config_path, remove_trivial_loops)
+    parallel = PrefixTreeFactory.get_prefix_tree(traces_path, config_path, remove_trivial_loops, processes=3)
+
+    def paths(tree: PrefixTree):
+        result = []
+        stack = [(tree.get_root(), ())]
+        while stack:
+            state, path = stack.pop()
+            for child in tree.get_children(state):
+                result.append(path + (tuple(child.properties.log_templates),))
+                if child is not state and not child.is_terminal:
+                    stack.append((child, result[-1]))
+        return sorted(result)
+
+    assert parallel.size() == sequential.size()
+    assert len(parallel.edges) == len(sequential.edges)
+    assert paths(parallel) == paths(sequential)
+
+
+@pytest.mark.parametrize("processes", [1, 3])
+def test_duplicate_traces(tmp_path: Path, processes: int):
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/testlogs")
+    config_path = PROJECT_ROOT.joinpath("resources/config.json")
+
+    filenames = sorted(os.listdir(traces_path))
+    for i, filename in enumerate(filenames):
+        for copy in range(i % 3 + 1):
+            shutil.copy(traces_path.joinpath(filename), tmp_path.joinpath(f"{filename}_{copy}"))
+
+    unique = PrefixTreeFactory.get_prefix_tree(traces_path, config_path)
+    duplicated = PrefixTreeFactory.get_prefix_tree(tmp_path, config_path, processes=processes)
+
+    assert duplicated.size() == unique.size()
+    assert len(duplicated.edges) == len(unique.edges)
+    assert sum(duplicated.get_trace_count(state) for state in duplicated.states.values()) == \
+           sum(i % 3 + 1 for i in range(len(filenames)))
+
+
+def test_update_prefix_tree(tmp_path: Path):
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/testlogs")
+    config_path = PROJECT_ROOT.joinpath("resources/config.json")
+    tree_file = tmp_path.joinpath("tree.pickle")
+    new_traces_path = tmp_path.joinpath("traces")
+    new_traces_path.mkdir()
+
+    filenames = sorted(os.listdir(traces_path))
+    for filename in filenames[:3]:
+        shutil.copy(traces_path.joinpath(filename), new_traces_path)
+
+    tree = PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path, settle_time=0)
+    assert os.path.isfile(tree_file)
+    assert os.path.isfile(str(tree_file) + ".manifest.json")
+    assert sum(tree.get_trace_count(state) for state in tree.states.values()) == 3
+
+    for filename in filenames[3:]:
+        shutil.copy(traces_path.joinpath(filename), new_traces_path)
+
+    tree = PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path, settle_time=0)
+    full = PrefixTreeFactory.get_prefix_tree(traces_path, config_path)
+    assert tree.size() == full.size()
+    assert len(tree.edges) == len(full.edges)
+    assert sum(tree.get_trace_count(state) for state in tree.states.values()) == len(filenames)
+
+    # Files already inserted are skipped, and the persisted tree is the updated one
+    tree = PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path, settle_time=0)
+    assert sum(tree.get_trace_count(state) for state in tree.states.values()) == len(filenames)
+    assert PrefixTreeFactory.unpickle_tree(tree_file).size() == full.size()
+
+    with pytest.raises(InvalidTreeException):
+        PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path, remove_trivial_loops=True,
+                                             settle_time=0)
+
+
+def test_update_prefix_tree_changed_file(tmp_path: Path):
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/testlogs")
+    config_path = PROJECT_ROOT.joinpath("resources/config.json")
+    tree_file = tmp_path.joinpath("tree.pickle")
+    new_traces_path = tmp_path.joinpath("traces")
+    new_traces_path.mkdir()
+
+    filename = sorted(os.listdir(traces_path))[0]
+    shutil.copy(traces_path.joinpath(filename), new_traces_path)
+    PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path, settle_time=0)
+
+    # Appending the trace to itself changes its size
+    with open(traces_path.joinpath(filename), 'r') as source, open(new_traces_path.joinpath(filename), 'a') as f:
+        f.write(source.read())
+
+    tree = PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path, settle_time=0)
+    rebuilt = PrefixTreeFactory.get_prefix_tree(new_traces_path, config_path)
+
+    # The tree is rebuilt, so that the truncated trace is no longer accepted
+    assert sum(tree.get_trace_count(state) for state in tree.states.values()) == 1
+    assert tree.size() == rebuilt.size()
+    assert tree.edges.list == rebuilt.edges.list
+
+
+def test_update_prefix_tree_config_changed(tmp_path: Path):
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/testlogs")
+    config_path = tmp_path.joinpath("config.json")
+    tree_file = tmp_path.joinpath("tree.pickle")
+    shutil.copy(PROJECT_ROOT.joinpath("resources/config.json"), config_path)
+
+    PrefixTreeFactory.update_prefix_tree(tree_file, traces_path, config_path)
+
+    with open(config_path, 'a') as f:
+        f.write("\n")
+
+    with pytest.raises(InvalidTreeException):
+        PrefixTreeFactory.update_prefix_tree(tree_file, traces_path, config_path)
+
+
+def test_update_prefix_tree_deferred(tmp_path: Path):
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/testlogs")
+    config_path = PROJECT_ROOT.joinpath("resources/config.json")
+    tree_file = tmp_path.joinpath("tree.pickle")
+    new_traces_path = tmp_path.joinpath("traces")
+    new_traces_path.mkdir()
+
+    filenames = sorted(os.listdir(traces_path))
+    for filename in filenames[:2]:
+        shutil.copy(traces_path.joinpath(filename), new_traces_path)
+    settled = time.time() - 3600
+    os.utime(new_traces_path.joinpath(filenames[0]), (settled, settled))
+
+    # The file modified just now may still be written, so it is left for a later update
+    tree = PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path)
+    assert sum(tree.get_trace_count(state) for state in tree.states.values()) == 1
+
+    # An inserted file still being written does not trigger a rebuild until it settles
+    with open(traces_path.joinpath(filenames[0]), 'r') as source, \
+            open(new_traces_path.joinpath(filenames[0]), 'a') as f:
+        f.write(source.read())
+    tree = PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path)
+    assert sum(tree.get_trace_count(state) for state in tree.states.values()) == 1
+
+    for filename in filenames[:2]:
+        os.utime(new_traces_path.joinpath(filename), (settled, settled))
+    tree = PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path)
+    rebuilt = PrefixTreeFactory.get_prefix_tree(new_traces_path, config_path)
+    assert sum(tree.get_trace_count(state) for state in tree.states.values()) == 2
+    assert tree.edges.list == rebuilt.edges.list
+
+
+def test_update_prefix_tree_interrupted(tmp_path: Path):
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/testlogs")
+    config_path = PROJECT_ROOT.joinpath("resources/config.json")
+    tree_file = tmp_path.joinpath("tree.pickle")
+    new_traces_path = tmp_path.joinpath("traces")
+    new_traces_path.mkdir()
+
+    filenames = sorted(os.listdir(traces_path))
+    shutil.copy(traces_path.joinpath(filenames[0]), new_traces_path)
+    PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path, settle_time=0)
+    shutil.copy(tree_file, tmp_path.joinpath("old.pickle"))
+
+    shutil.copy(traces_path.joinpath(filenames[1]), new_traces_path)
+    PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path, settle_time=0)
+
+    # The update died after replacing the manifest, leaving the previous tree in place
+    shutil.copy(tmp_path.joinpath("old.pickle"), tree_file)
+
+    tree = PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path, settle_time=0)
+    assert sum(tree.get_trace_count(state) for state in tree.states.values()) == 2
+    tree = PrefixTreeFactory.update_prefix_tree(tree_file, new_traces_path, config_path, settle_time=0)
+    assert sum(tree.get_trace_count(state) for state in tree.states.values()) == 2
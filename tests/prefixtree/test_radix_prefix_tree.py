@@ -0,0 +1,151 @@
+import os
+import pickle
+import random
+import shutil
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from whatthelog.prefixtree.prefix_tree import PrefixTree, TreeIterator
+from whatthelog.prefixtree.prefix_tree_factory import PrefixTreeFactory
+from whatthelog.prefixtree.radix_prefix_tree import RadixPrefixTree
+from whatthelog.prefixtree.state import State
+
+PROJECT_ROOT = Path(os.path.abspath(os.path.dirname(__file__))).parent.parent
+
+
+def classic_tree(traces: List[List[str]], remove_trivial_loops: bool = False) -> PrefixTree:
+    tree = PrefixTree(State([""]), State(["end"], is_terminal=True))
+    for trace in traces:
+        parent = tree.get_root()
+        for template in trace:
+            if remove_trivial_loops and parent.properties.log_templates[0] == template:
+                tree.add_edge(parent, parent)
+                continue
+            child = next((c for c in tree.get_children(parent) if c.properties.log_templates == [template]), None)
+            if child is None:
+                child = State([template])
+                tree.add_child(child, parent)
+            parent = child
+        tree.add_trace_end(parent)
+    return tree
+
+
+def assert_same_tree(tree1: PrefixTree, tree2: PrefixTree):
+    assert len(tree1) == len(tree2)
+    assert len(tree1.edges) == len(tree2.edges)
+
+    stack = [(tree1.get_root(), tree2.get_root())]
+    while stack:
+        state1, state2 = stack.pop()
+        assert state1.properties == state2.properties
+        assert tree1.get_trace_count(state1) == tree2.get_trace_count(state2)
+        children1 = tree1.get_children(state1)
+        children2 = tree2.get_children(state2)
+        assert [child.properties for child in children1] == [child.properties for child in children2]
+        for child1, child2 in zip(children1, children2):
+            if child1 is not state1 and child1 is not tree1.get_terminal():
+                stack.append((child1, child2))
+
+
+@pytest.fixture
+def traces() -> List[List[str]]:
+    return [["a", "b", "c", "d"],
+            ["a", "b", "x", "y"],
+            ["a", "b"],
+            ["z"]]
+
+
+def test_compression(traces: List[List[str]]):
+    tree = RadixPrefixTree()
+    for trace in traces:
+        tree.add_trace(trace)
+
+    root = tree.get_root()
+    assert [child.get_log_templates() for child in tree.get_children(root)] == [["a", "b"], ["z"]]
+
+    ab = tree.get_children(root)[0]
+    assert ab.is_final
+    assert tree.get_parent(ab) is root
+    assert [child.get_log_templates() for child in tree.get_children(ab)] == [["c", "d"], ["x", "y"]]
+    assert all(tree.get_parent(child) is ab for child in tree.get_children(ab))
+
+    assert tree.size() == 5
+    assert tree.expanded_size() == 9
+
+
+def test_tree_iterator(traces: List[List[str]]):
+    tree = RadixPrefixTree()
+    for trace in traces:
+        tree.add_trace(trace)
+
+    iterator = TreeIterator(tree)
+    nodes = []
+    with pytest.raises(StopIteration):
+        while True:
+            nodes.append(next(iterator))
+
+    assert [node.get_log_templates() for node in nodes] == [[""], ["a", "b"], ["z"], ["c", "d"], ["x", "y"]]
+
+
+def test_expand(traces: List[List[str]]):
+    tree = RadixPrefixTree()
+    for trace in traces:
+        tree.add_trace(trace)
+
+    expanded = tree.expand()
+    assert len(expanded) == tree.expanded_size()
+    assert_same_tree(expanded, classic_tree(traces))
+
+
+@pytest.mark.parametrize("remove_trivial_loops", [False, True])
+def test_expand_random(remove_trivial_loops: bool):
+    generator = random.Random(7)
+    traces = [[generator.choice("abc") for _ in range(generator.randint(0, 12))] for _ in range(200)]
+
+    tree = RadixPrefixTree()
+    for trace in traces:
+        tree.add_trace(trace, remove_trivial_loops)
+
+    assert tree.size() < tree.expanded_size()
+    assert_same_tree(tree.expand(), classic_tree(traces, remove_trivial_loops))
+
+
+def test_pickle(traces: List[List[str]]):
+    tree = RadixPrefixTree()
+    for trace in traces:
+        tree.add_trace(trace, remove_trivial_loops=True)
+    tree.add_trace(["a", "a", "b", "q"], remove_trivial_loops=True)
+
+    unpickled = pickle.loads(pickle.dumps(tree))
+
+    assert unpickled.size() == tree.size()
+    assert_same_tree(unpickled.expand(), tree.expand())
+
+
+def test_factory():
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/traces")
+    config_path = PROJECT_ROOT.joinpath("resources/config.json")
+
+    tree = PrefixTreeFactory.get_radix_prefix_tree(traces_path, config_path)
+
+    assert tree.size() < tree.expanded_size()
+    assert_same_tree(tree.expand(), PrefixTreeFactory.get_prefix_tree(traces_path, config_path))
+
+
+def test_factory_trace_counts(tmp_path: Path):
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/testlogs")
+    config_path = PROJECT_ROOT.joinpath("resources/config.json")
+
+    filenames = sorted(os.listdir(traces_path))
+    for i, filename in enumerate(filenames):
+        for copy in range(i % 3 + 1):
+            shutil.copy(traces_path.joinpath(filename), tmp_path.joinpath(f"{filename}_{copy}"))
+
+    expanded = PrefixTreeFactory.get_radix_prefix_tree(tmp_path, config_path).expand()
+    classic = PrefixTreeFactory.get_prefix_tree(tmp_path, config_path)
+
+    assert sum(expanded.get_trace_count(state) for state in expanded.states.values()) == \
+           sum(i % 3 + 1 for i in range(len(filenames)))
+    assert_same_tree(expanded, classic)
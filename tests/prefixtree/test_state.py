@@ -1,4 +1,9 @@
+import copyreg
+import pickle
+
 from whatthelog.prefixtree.state import State
+from whatthelog.prefixtree.state_properties import StateProperties
+from whatthelog.prefixtree.template_vocabulary import TemplateVocabulary
 
 
 def test_id():
@@ -23,3 +28,54 @@ def test_is_equivalent():
 
     assert x.is_equivalent(y)
     assert not x.is_equivalent(z)
+
+
+def test_is_equivalent_weak():
+    x = State(["a", "b"])
+    y = State(["c", "b"])
+    z = State(["c"])
+
+    assert x.is_equivalent_weak(y)
+    assert not x.is_equivalent_weak(z)
+
+
+def test_template_ids():
+    x = State(["a", "b"])
+    y = State(["b", "a"])
+
+    assert x.properties.template_ids == (TemplateVocabulary.get_id("a"), TemplateVocabulary.get_id("b"))
+    assert x.properties.log_templates == ["a", "b"]
+    assert x.properties.has_template("a")
+    assert not x.properties.has_template("never seen")
+    assert x.properties.has_template_id(TemplateVocabulary.get_id("b"))
+
+    assert x.is_equivalent(y)
+    assert x.properties.get_prop_hash() != y.properties.get_prop_hash()
+
+
+def test_properties_pickle():
+    x = State(["a", "b"])
+    properties = pickle.loads(pickle.dumps(x.properties))
+
+    assert properties == x.properties
+    assert properties.template_ids == x.properties.template_ids
+    assert properties.get_prop_hash() == x.properties.get_prop_hash()
+
+
+def test_properties_unpickle_legacy():
+
+    class LegacyProperties:
+        """
+        Pickles as the former dataclass, which held the template names in a slot.
+        """
+        def __init__(self, log_templates):
+            self.log_templates = log_templates
+
+        def __reduce__(self):
+            return copyreg._reconstructor, (StateProperties, object, None), (None, {'log_templates': self.log_templates})
+
+    properties = pickle.loads(pickle.dumps(LegacyProperties(["a", "b"])))
+
+    assert isinstance(properties, StateProperties)
+    assert properties.log_templates == ["a", "b"]
+    assert properties == State(["a", "b"]).properties
@@ -0,0 +1,46 @@
+import numpy as np
+
+from whatthelog.prefixtree.trace_deduplicator import TraceDeduplicator
+
+
+def test_add():
+    deduplicator = TraceDeduplicator()
+
+    key1 = deduplicator.add([0, 1, 2])
+    key2 = deduplicator.add(np.array([0, 1, 2], dtype=np.int32))
+    key3 = deduplicator.add([0, 1])
+    key4 = deduplicator.add([])
+
+    assert key1 == key2
+    assert len({key1, key3, key4}) == 3
+    assert len(key1) == 16
+    assert deduplicator.counts == {key1: 2, key3: 1, key4: 1}
+    assert deduplicator.traces == 4
+    assert len(deduplicator) == 3
+    assert deduplicator.ratio() == 4 / 3
+
+
+def test_update():
+    deduplicator1 = TraceDeduplicator()
+    deduplicator1.add([0, 1])
+    deduplicator1.add([0, 1])
+    deduplicator2 = TraceDeduplicator()
+    key = deduplicator2.add([0, 1])
+    deduplicator2.add([2])
+
+    deduplicator1.update(deduplicator2)
+
+    assert deduplicator1.traces == 4
+    assert len(deduplicator1) == 2
+    assert deduplicator1.counts[key] == 3
+
+
+def test_report():
+    deduplicator = TraceDeduplicator()
+    assert deduplicator.ratio() == 1.0
+    assert deduplicator.report() == "0 traces, 0 distinct template sequences (dedup ratio 1.00, 0.0% redundant)"
+
+    for _ in range(4):
+        deduplicator.add([1, 2])
+
+    assert deduplicator.report() == "4 traces, 1 distinct template sequences (dedup ratio 4.00, 75.0% redundant)"
@@ -0,0 +1,89 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from whatthelog.log_reader import LogReader
+from whatthelog.prefixtree.graph import Graph
+from whatthelog.prefixtree.prefix_tree_factory import PrefixTreeFactory
+from whatthelog.prefixtree.state import State
+from whatthelog.prefixtree.trace_monitor import TraceMonitor, MonitorStatus
+from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
+
+PROJECT_ROOT = Path(os.path.abspath(os.path.dirname(__file__))).parent.parent
+
+
+@pytest.fixture
+def graph() -> Graph:
+    start = State(["start"])
+    terminal = State(["terminal"], True)
+    graph = Graph(start, terminal)
+
+    a1, a2, b, c = State(["a"]), State(["a"]), State(["b"]), State(["c"])
+    for state in [a1, a2, b, c]:
+        graph.add_state(state)
+    graph.add_edge(start, a1)
+    graph.add_edge(start, a2)
+    graph.add_edge(a1, b)
+    graph.add_edge(a2, c)
+    graph.add_edge(b, terminal)
+    graph.add_edge(c, c)
+    graph.add_edge(c, terminal)
+
+    return graph
+
+
+def test_feed_template(graph: Graph):
+    monitor = TraceMonitor(graph, None)
+
+    assert monitor.feed_template("a") is MonitorStatus.MATCHING
+    assert len(monitor.get_states()) == 2
+    assert monitor.feed_template("c") is MonitorStatus.TERMINAL
+    assert monitor.feed_template("c") is MonitorStatus.TERMINAL
+    assert monitor.is_accepted()
+
+    assert monitor.feed_template("b") is MonitorStatus.REJECTED
+    assert monitor.rejected_at == 4
+    assert monitor.feed_template("c") is MonitorStatus.REJECTED
+    assert monitor.get_states() == []
+
+    monitor.reset()
+    assert monitor.feed_template(None) is MonitorStatus.REJECTED
+    assert monitor.rejected_at == 1
+
+
+def test_feed():
+    traces_path = PROJECT_ROOT.joinpath("tests/resources/traces")
+    config_path = PROJECT_ROOT.joinpath("resources/config.json")
+    tree = PrefixTreeFactory().get_prefix_tree(traces_path, config_path)
+    monitor = TraceMonitor(tree, SyntaxTreeFactory().parse_file(config_path))
+
+    for name in os.listdir(traces_path):
+        monitor.reset()
+        lines = list(LogReader(traces_path.joinpath(name)))
+        statuses = [monitor.feed(line) for line in lines]
+
+        assert MonitorStatus.REJECTED not in statuses
+        assert statuses[-1] is MonitorStatus.TERMINAL
+
+        monitor.reset()
+        for line in lines[:-1]:
+            monitor.feed(line)
+        assert monitor.feed("not a log line") is MonitorStatus.REJECTED
+        assert monitor.rejected_at == len(lines)
+
+
+def test_reset_after_lazy_merge():
+    start, other, state = State(["start"]), State(["other"]), State(["x"])
+    terminal = State(["end"], is_terminal=True)
+    graph = Graph(start, terminal)
+    graph.add_state(other)
+    graph.add_state(state)
+    graph.add_edge(start, state)
+    graph.add_edge(state, terminal)
+
+    graph.lazy_merge_states(other, start)
+    monitor = TraceMonitor(graph, None)
+
+    assert monitor.feed_template("x") is MonitorStatus.TERMINAL
+    assert monitor.get_states() == [state]
@@ -290,3 +290,27 @@ def test_match_trace_no_successor_rec_2(state_tree, syntax_tree):
 
     res = match_trace(state_tree, trace, syntax_tree)
     assert expected_result == res, "Non-empty result" + res.__str__()
+
+
+def test_match_trace_iterable(state_tree, traces_t3, syntax_tree):
+    """
+    Tests that the match_trace functions accept any iterable and do not modify their input
+    """
+    root: State = state_tree.get_root()
+    t0 = state_tree.get_children(root)[0]
+    t2 = state_tree.get_children(t0)[0]
+    t3 = state_tree.get_children(t2)[0]
+
+    state_tree.add_child(State(["terminal"], True), t3)
+
+    for t in traces_t3:
+        original = copy.copy(t)
+
+        assert match_trace(state_tree, iter(t), syntax_tree) == [t0, t2, t3]
+        assert match_trace(state_tree, t, syntax_tree) == [t0, t2, t3]
+        assert state_tree.match_trace(iter(t), syntax_tree)
+        assert state_tree.match_trace(t, syntax_tree)
+        assert t == original
+
+    assert match_trace(state_tree, iter([]), syntax_tree) == []
+    assert not state_tree.match_trace(iter([]), syntax_tree)
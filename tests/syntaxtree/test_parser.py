@@ -1,5 +1,6 @@
 from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
 import os
+import shutil
 from pathlib import Path
 
 from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
@@ -28,3 +29,55 @@ def test_parse_file_complex():
     expected.insert(node2)
 
     assert tree == expected
+
+
+def test_parse_file_compiled():
+    tree = SyntaxTreeFactory().parse_file("tests/resources/test.json")
+
+    assert tree.is_compiled()
+    assert tree.search("[root]123 45[node3]").name == "node3"
+    assert tree.search("[root]123 45") is None
+
+
+def test_parse_file_cached(tmp_path):
+    config = tmp_path.joinpath("config.json")
+    shutil.copy("tests/resources/test.json", config)
+    cache_dir = tmp_path.joinpath("cache")
+
+    tree = SyntaxTreeFactory(cache_dir).parse_file(config)
+    assert len(os.listdir(cache_dir)) == 1
+
+    cached = SyntaxTreeFactory(cache_dir).parse_file(config)
+    assert cached == tree
+    assert cached.is_compiled()
+    assert cached.search("[root]123 45[node3]").name == "node3"
+    assert cached.search_many(["[root][node1]"]).tolist() == [0]
+
+
+def test_parse_file_cache_invalidated(tmp_path):
+    config = tmp_path.joinpath("config.json")
+    shutil.copy("tests/resources/test.json", config)
+    cache_dir = tmp_path.joinpath("cache")
+    SyntaxTreeFactory(cache_dir).parse_file(config)
+
+    shutil.copy("tests/resources/test_simple.json", config)
+    tree = SyntaxTreeFactory(cache_dir).parse_file(config)
+
+    assert len(os.listdir(cache_dir)) == 2
+    assert tree == SyntaxTree("node", "[node]", False)
+
+
+def test_parse_file_cache_stale(tmp_path):
+    config = tmp_path.joinpath("config.json")
+    shutil.copy("tests/resources/test.json", config)
+    cache_dir = tmp_path.joinpath("cache")
+    SyntaxTreeFactory(cache_dir).parse_file(config)
+
+    # A pickle referring to a module which no longer exists raises an ImportError when loaded
+    cache_file = cache_dir.joinpath(os.listdir(cache_dir)[0])
+    cache_file.write_bytes(b"cwhatthelog.removed_module\nRemovedClass\n.")
+
+    tree = SyntaxTreeFactory(cache_dir).parse_file(config)
+
+    assert tree.is_compiled()
+    assert tree.search("[root]123 45[node3]").name == "node3"
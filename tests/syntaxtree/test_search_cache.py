@@ -0,0 +1,75 @@
+import pytest
+
+from whatthelog.syntaxtree.search_cache import SearchCache
+from whatthelog.syntaxtree.syntax_tree import SyntaxTree
+
+
+@pytest.fixture()
+def tree():
+    tree = SyntaxTree("node", r"\d+ ", True)
+    tree.insert(SyntaxTree("short", r"id=\d{2}$", True))
+    tree.insert(SyntaxTree("value", r"value=\d+", True))
+    return tree
+
+
+def test_skeleton():
+    assert SearchCache.skeleton("2020-Mar-01 16:36:36.093 hash=A1B2 ok") == "#-Mar-# #:#:#.# hash=# ok"
+
+
+def test_skeleton_hex_letters():
+    assert SearchCache.skeleton("cafe face0 bad") == "cafe # bad"
+    assert SearchCache.skeleton("xdeadbeef1 deadbeefx") == "x# deadbeefx"
+
+    # Long runs of hex letters without a digit are rejected in linear time
+    letters = "abcdef" * 50000
+    assert SearchCache.skeleton(letters) == letters
+    assert SearchCache.skeleton(letters + "1 " + letters) == "# " + letters
+
+
+def test_search_hit(tree):
+    cache = SearchCache(tree)
+
+    assert cache.search("1 value=10").name == "value"
+    assert cache.search("2 value=200").name == "value"
+    assert cache.search("invalid") is None
+
+    assert cache.hits == 1
+    assert cache.misses == 2
+    assert len(cache) == 2
+
+
+def test_search_eviction(tree):
+    cache = SearchCache(tree, max_size=2)
+
+    cache.search("1 value=1")
+    cache.search("1 other")
+    cache.search("1 value=1")
+    cache.search("1 another")
+
+    assert cache.evictions == 1
+    assert cache.get_statistics() == {"hits": 1, "misses": 3, "evictions": 1, "mismatches": 0, "size": 2}
+
+    # The least recently used skeleton was evicted
+    cache.search("1 other")
+    assert cache.misses == 4
+
+
+def test_search_verify(tree):
+    cache = SearchCache(tree, verify=True)
+
+    assert cache.search("1 id=12").name == "short"
+    assert cache.search("1 id=123") is None
+    assert cache.mismatches == 1
+
+    unverified = SearchCache(tree)
+    unverified.search("1 id=12")
+    assert unverified.search("1 id=123").name == "short"
+
+
+def test_clear(tree):
+    cache = SearchCache(tree)
+    cache.search("1 value=1")
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.misses == 0
@@ -1,3 +1,6 @@
+import json
+
+import numpy as np
 import pytest
 
 from whatthelog.syntaxtree.syntax_tree import SyntaxTree
@@ -53,3 +56,262 @@ def test_search_regex_invalid(tree):
     tree.insert(nodeRight)
 
     assert tree.search("[node][regexNode]") is None
+
+
+def test_compile(tree):
+    tree.insert(SyntaxTree("nodeLeft", r"\[regexNode1+\]", True))
+    tree.insert(SyntaxTree("nodeRight", "[nodeRight]", False))
+    tree.compile()
+
+    assert tree.is_compiled()
+    assert tree.search("[node][regexNode11]").name == "nodeLeft"
+    assert tree.search("[node][nodeRight]").name == "nodeRight"
+    assert tree.search("[node][regexNode]") is None
+
+
+def test_compile_backtracking(tree):
+    inner = SyntaxTree("inner", "[a]", False)
+    inner.insert(SyntaxTree("innerLeaf", "[x]", False))
+    tree.insert(inner)
+    tree.insert(SyntaxTree("outer", "[a]", False))
+    tree.compile()
+
+    assert tree.search("[node][a][x]").name == "innerLeaf"
+    assert tree.search("[node][a][y]").name == "outer"
+
+
+def test_compile_atomic_prefix(tree):
+    child = SyntaxTree("child", "a+", True)
+    child.insert(SyntaxTree("leaf", "ab", False))
+    tree.insert(child)
+    tree.compile()
+
+    # The tree walk never backtracks into a matched prefix
+    assert tree.search("[node]aab") is None
+
+
+def test_insert_invalidates_compiled(tree):
+    child = SyntaxTree("child", "[child]", False)
+    tree.insert(child)
+    tree.compile()
+    assert tree.search("[node][child]").name == "child"
+
+    child.insert(SyntaxTree("grandchild", "[grandchild]", False))
+
+    assert not tree.is_compiled()
+    assert tree.search("[node][child][grandchild]").name == "grandchild"
+
+
+def test_compile_fallback(tree):
+    tree.insert(SyntaxTree("nodeLeft", "(?P<group>left)", True))
+    tree.insert(SyntaxTree("nodeRight", "(?P<group>right)", True))
+    tree.compile()
+
+    assert not tree.is_compiled()
+    assert tree.search("[node]right").name == "nodeRight"
+
+
+def test_compile_backreferences():
+    tree = SyntaxTree("root", "(a)", True)
+    tree.insert(SyntaxTree("leaf", r"(x)\1", True))
+
+    walked = [tree.search(line) for line in ["axx", "axa", "ax"]]
+    tree.compile()
+
+    assert not tree.is_compiled()
+    assert [tree.search(line) for line in ["axx", "axa", "ax"]] == walked
+    assert walked[0].name == "leaf"
+    assert walked[1] is None
+
+
+def test_compile_global_flags():
+    tree = SyntaxTree("root", "r", False)
+    tree.insert(SyntaxTree("lower", "a", False))
+    tree.insert(SyntaxTree("flagged", "(?i)z", True))
+
+    walked = [tree.search(line) for line in ["rA", "ra", "rZ"]]
+    tree.compile()
+
+    # The flag would make the whole combined pattern case-insensitive
+    assert not tree.is_compiled()
+    assert [tree.search(line) for line in ["rA", "ra", "rZ"]] == walked
+    assert walked[0] is None
+    assert walked[2].name == "flagged"
+
+
+def test_compile_scoped_flags():
+    tree = SyntaxTree("root", "r", False)
+    tree.insert(SyntaxTree("lower", "a", False))
+    tree.insert(SyntaxTree("flagged", "(?i:z)", True))
+    tree.compile()
+
+    assert tree.is_compiled()
+    assert tree.search("rA") is None
+    assert tree.search("rZ").name == "flagged"
+
+
+@pytest.mark.parametrize("prefix", [r"^def", r"\bdef", r"(?<!c)def", r"\Adef"])
+def test_search_looks_behind_stem(prefix: str):
+    tree = SyntaxTree("root", "abc", False)
+    child = SyntaxTree("child", prefix, True)
+    child.insert(SyntaxTree("leaf", "g", False))
+    tree.insert(child)
+
+    # Child patterns see the start of their stem as the start of the string
+    assert tree.search("abcdefg").name == "leaf"
+
+    tree.compile()
+    assert not tree.is_compiled()
+    assert tree.search("abcdefg").name == "leaf"
+
+
+def test_compile_looks_behind_root():
+    tree = SyntaxTree("root", r"^\bab", True)
+    tree.insert(SyntaxTree("leaf", "c", False))
+    tree.compile()
+
+    assert tree.is_compiled()
+    assert tree.search("abc").name == "leaf"
+
+
+def test_search_dispatch_order(tree):
+    tree.insert(SyntaxTree("literal1", "ab", False))
+    tree.insert(SyntaxTree("regex", r"a\w", True))
+    tree.insert(SyntaxTree("literal2", "ac", False))
+    tree.insert(SyntaxTree("literal3", "b", False))
+
+    assert tree.search("[node]ab").name == "literal1"
+    assert tree.search("[node]ac").name == "regex"
+    assert tree.search("[node]b").name == "literal3"
+    assert tree.search("[node]c") is None
+
+
+def test_search_dispatch_empty_stem(tree):
+    tree.insert(SyntaxTree("literal", "a", False))
+    tree.insert(SyntaxTree("empty", "", False))
+
+    assert tree.search("[node]").name == "empty"
+    assert tree.search("[node]a").name == "literal"
+
+
+def test_search_child_not_at_position(tree):
+    tree.insert(SyntaxTree("child", "[child]", False))
+
+    assert tree.search("[node] [child]") is None
+    assert tree.search("[child][node]") is None
+
+
+def test_get_vocabulary(tree):
+    inner = SyntaxTree("inner", "[inner]", False)
+    inner.insert(SyntaxTree("innerLeaf", "[innerLeaf]", False))
+    tree.insert(inner)
+    tree.insert(SyntaxTree("leaf", "[leaf]", False))
+
+    assert tree.get_vocabulary() == ["innerLeaf", "leaf"]
+    assert tree.get_template_id("leaf") == 1
+    assert tree.get_template_id("inner") == -1
+
+
+def test_search_many(tree):
+    tree.insert(SyntaxTree("nodeLeft", "[nodeLeft]", False))
+    tree.insert(SyntaxTree("nodeRight", "[nodeRight]", False))
+
+    result = tree.search_many(["[node][nodeRight]", "[invalid]", "[node][nodeLeft]"])
+
+    assert result.dtype == np.int32
+    assert result.tolist() == [1, -1, 0]
+    assert tree.search_many(iter(["[node][nodeLeft]"])).tolist() == [0]
+
+
+def test_search_many_after_insert(tree):
+    tree.insert(SyntaxTree("nodeRight", "[nodeRight]", False))
+    assert tree.search_many(["[node][nodeRight]"]).tolist() == [0]
+
+    tree.insert(SyntaxTree("nodeLeft", "[nodeLeft]", False))
+
+    assert tree.get_vocabulary() == ["nodeRight", "nodeLeft"]
+    assert tree.search_many(["[node][nodeLeft]"]).tolist() == [1]
+
+
+def test_statistics(tree):
+    tree.insert(SyntaxTree("nodeLeft", "[nodeLeft]", False))
+    tree.insert(SyntaxTree("nodeRight", r"\[nodeRight\]", True))
+    tree.compile()
+    tree.enable_statistics()
+
+    tree.search("[node][nodeRight]")
+    tree.search("[node][nodeLeft]")
+    tree.search("[invalid]")
+
+    statistics = tree.get_statistics()
+    assert statistics["reached"] == 3
+    assert statistics["matched"] == 2
+    assert [child["name"] for child in statistics["children"]] == ["nodeLeft", "nodeRight"]
+    assert statistics["children"][0]["reached"] == 2
+    assert statistics["children"][0]["matched"] == 1
+    assert statistics["children"][1]["reached"] == 1
+
+    tree.reset_statistics()
+    assert tree.get_statistics()["reached"] == 0
+
+
+def test_dump_statistics(tree, tmp_path):
+    tree.insert(SyntaxTree("child", "[child]", False))
+    tree.enable_statistics()
+    tree.search("[node][child]")
+
+    tree.dump_statistics(tmp_path.joinpath("statistics.json"))
+
+    with open(tmp_path.joinpath("statistics.json"), 'r') as f:
+        assert json.load(f)["children"][0]["matched"] == 1
+
+
+def test_reorder_children(tree):
+    tree.insert(SyntaxTree("a", "[a]", False))
+    tree.insert(SyntaxTree("b", "[b]", False))
+    tree.insert(SyntaxTree("regex", r"\[\w\]", True))
+    tree.insert(SyntaxTree("c", "[c]", False))
+    tree.compile()
+    tree.enable_statistics()
+    for _ in range(3):
+        tree.search("[node][b]")
+    for _ in range(2):
+        tree.search("[node][c]")
+
+    tree.reorder_children()
+
+    # Only disjoint literal siblings are reordered, the regex still shadows [c]
+    assert [child.name for child in tree.get_children()] == ["b", "a", "regex", "c"]
+    assert tree.is_compiled()
+    tree.enable_statistics(False)
+    assert tree.search("[node][c]").name == "regex"
+    assert tree.search("[node][a]").name == "a"
+
+
+def test_reorder_children_keeps_template_ids(tree):
+    tree.insert(SyntaxTree("a", "[a]", False))
+    tree.insert(SyntaxTree("b", "[b]", False))
+    tree.compile()
+    vocabulary = tree.get_vocabulary()
+    tree.enable_statistics()
+    tree.search("[node][b]")
+
+    tree.reorder_children()
+
+    assert [child.name for child in tree.get_children()] == ["b", "a"]
+    assert tree.get_vocabulary() == vocabulary
+    assert tree.get_template_id("a") == 0
+    assert tree.search_many(["[node][a]", "[node][b]"]).tolist() == [0, 1]
+
+
+def test_reorder_children_overlapping_prefixes(tree):
+    tree.insert(SyntaxTree("long", "[a]", False))
+    tree.insert(SyntaxTree("short", "[a", False))
+    tree.enable_statistics()
+    tree.search("[node][ab")
+    tree.search("[node][ac")
+
+    tree.reorder_children()
+
+    assert [child.name for child in tree.get_children()] == ["long", "short"]
+    assert tree.search("[node][a]").name == "long"
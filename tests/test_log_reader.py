@@ -0,0 +1,62 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from whatthelog.log_reader import LogReader
+
+
+LINES = ["first line\n", "second line\r\n", "third line"]
+
+
+@pytest.fixture()
+def content() -> bytes:
+    return "".join(LINES).encode('utf-8')
+
+
+def test_read_plain(tmp_path, content):
+    filepath = tmp_path.joinpath("trace")
+    filepath.write_bytes(content)
+
+    reader = LogReader(filepath)
+
+    assert list(reader) == ["first line\n", "second line\n", "third line"]
+    assert reader.offset == reader.size == len(content)
+
+
+@pytest.mark.parametrize("extension, compress", [(".gz", gzip.compress),
+                                                  (".bz2", bz2.compress),
+                                                  (".xz", lzma.compress)])
+def test_read_compressed(tmp_path, content, extension, compress):
+    filepath = tmp_path.joinpath("trace" + extension)
+    filepath.write_bytes(compress(content))
+
+    reader = LogReader(filepath)
+
+    assert list(reader) == ["first line\n", "second line\n", "third line"]
+    assert reader.offset == reader.size
+
+
+def test_read_empty(tmp_path):
+    filepath = tmp_path.joinpath("trace")
+    filepath.write_bytes(b"")
+
+    assert list(LogReader(filepath)) == []
+
+
+def test_raw_lines_offsets(tmp_path, content):
+    filepath = tmp_path.joinpath("trace")
+    filepath.write_bytes(content)
+    reader = LogReader(filepath)
+
+    offsets = []
+    for line in reader.raw_lines():
+        offsets.append(reader.offset)
+
+    assert offsets == [11, 24, 34]
+
+
+def test_read_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        LogReader(tmp_path.joinpath("missing"))
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import socket
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from whatthelog.log_reader import LogReader
+from whatthelog.prefixtree.prefix_tree import PrefixTree
+from whatthelog.prefixtree.prefix_tree_factory import PrefixTreeFactory
+from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
+from whatthelog.trace_service import TraceService, TraceEvent
+
+PROJECT_ROOT = Path(os.path.abspath(os.path.dirname(__file__))).parent
+TRACES_PATH = PROJECT_ROOT.joinpath("tests/resources/traces")
+CONFIG_PATH = PROJECT_ROOT.joinpath("resources/config.json")
+
+
+@pytest.fixture(scope="module")
+def model() -> PrefixTree:
+    return PrefixTreeFactory().get_prefix_tree(TRACES_PATH, CONFIG_PATH)
+
+
+@pytest.fixture
+def service(model: PrefixTree) -> TraceService:
+    return TraceService(model, SyntaxTreeFactory().parse_file(CONFIG_PATH), max_events=2)
+
+
+@pytest.fixture
+def traces():
+    return [list(LogReader(TRACES_PATH.joinpath(name))) for name in sorted(os.listdir(TRACES_PATH))]
+
+
+def drain(queue: asyncio.Queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+def test_tail_files(service: TraceService, traces, tmp_path: Path):
+    files = []
+    for i, trace in enumerate(traces):
+        filepath = tmp_path.joinpath(f"trace{i}")
+        # The second trace of each file deviates at its second line
+        filepath.write_text("".join(trace) + "\n" + trace[0] + "not a log line\n" + "".join(trace[2:]))
+        files.append(filepath)
+
+    async def run():
+        events = []
+
+        async def consume():
+            while True:
+                events.append(await service.events.get())
+
+        consumer = asyncio.ensure_future(consume())
+        await asyncio.gather(*[service.tail_file(filepath) for filepath in files])
+        await asyncio.sleep(0)
+        consumer.cancel()
+        return events
+
+    events = asyncio.run(run())
+
+    assert len(events) == 2 * len(files)
+    for filepath, trace in zip(files, traces):
+        assert TraceEvent(str(filepath), 0, True, len(trace)) in events
+        assert TraceEvent(str(filepath), 1, False, len(trace), 2) in events
+
+
+def test_tail_file_follow(service: TraceService, traces, tmp_path: Path):
+    filepath = tmp_path.joinpath("followed")
+    filepath.write_text("")
+    service.poll_interval = 0.01
+
+    async def run():
+        session = asyncio.ensure_future(service.tail_file(filepath, follow=True))
+
+        with open(filepath, 'a') as file:
+            file.write(traces[0][0][:5])
+            file.flush()
+            await asyncio.sleep(0.05)
+            file.write(traces[0][0][5:] + "".join(traces[0][1:]) + "\n")
+            file.flush()
+
+        event = await asyncio.wait_for(service.events.get(), 5)
+        session.cancel()
+        return event
+
+    assert asyncio.run(run()) == TraceEvent(str(filepath), 0, True, len(traces[0]))
+
+
+def test_line_limit(service: TraceService, traces, tmp_path: Path):
+    filepath = tmp_path.joinpath("long")
+    filepath.write_text(traces[0][0] + "x" * 300 + "\n" + "".join(traces[0][1:]))
+    service.line_limit = 200
+
+    asyncio.run(service.tail_file(filepath))
+
+    assert drain(service.events) == [TraceEvent(str(filepath), 0, False, len(traces[0]) + 1, 2)]
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix sockets not supported")
+def test_serve_unix(service: TraceService, traces):
+
+    async def run(socket_path: str):
+        server = await service.serve_unix(socket_path)
+
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write("".join(traces[0]).encode() + b"\n")
+        writer.write("".join(traces[1][:-1]).encode())
+        writer.write_eof()
+        answers = [line async for line in reader]
+        writer.close()
+
+        server.close()
+        await server.wait_closed()
+        return answers, drain(service.events)
+
+    with tempfile.TemporaryDirectory() as directory:
+        answers, events = asyncio.run(run(os.path.join(directory, "service.sock")))
+
+    assert len(answers) == 2
+    assert b"accepted" in answers[0]
+    assert [event.accepted for event in events] == [True, False]
+    assert events[1].rejected_at is None
+    assert events[1].lines == len(traces[1]) - 1
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix sockets not supported")
+def test_serve_unix_line_limit(service: TraceService, traces):
+    service.line_limit = 200
+
+    async def run(socket_path: str):
+        server = await service.serve_unix(socket_path)
+
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        # The long line is sent in two parts, so that its end is not yet received when the limit is exceeded
+        writer.write(traces[0][0].encode() + b"x" * 1000)
+        await writer.drain()
+        await asyncio.sleep(0.05)
+        writer.write(b"x" * 1000 + b"\n" + "".join(traces[0][1:]).encode())
+        writer.write_eof()
+        answers = [line async for line in reader]
+        writer.close()
+
+        server.close()
+        await server.wait_closed()
+        return answers, drain(service.events)
+
+    with tempfile.TemporaryDirectory() as directory:
+        answers, events = asyncio.run(run(os.path.join(directory, "service.sock")))
+
+    # The tail of the long line is discarded with it, rather than read as another line
+    assert len(answers) == 1
+    assert events == [TraceEvent(events[0].source, 0, False, len(traces[0]) + 1, 2)]
@@ -3,3 +3,6 @@ from pathlib import Path
 
 
 PROJECT_ROOT = Path(os.path.abspath(__file__)).parent.parent
+
+# Directory holding compiled artifacts, such as parsed syntax trees, used by the scripts that opt into caching
+CACHE_DIR = Path(os.environ.get("WHATTHELOG_CACHE_DIR", Path.home().joinpath(".cache", "whatthelog")))
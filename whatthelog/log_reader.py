@@ -0,0 +1,99 @@
+# ****************************************************************************************************
+# Imports
+# ****************************************************************************************************
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+import bz2
+import gzip
+import lzma
+import mmap
+import os
+from typing import Iterator, Union
+
+
+# ****************************************************************************************************
+# Log Reader
+# ****************************************************************************************************
+
+class LogReader:
+    """
+    Streaming reader for log files, shared by all the components that read traces.
+    Plain files are memory-mapped, while gzip, bz2 and xz files are decompressed as a stream,
+    so that a file is never materialised as a whole.
+    While iterating, `offset` holds the number of bytes of the file consumed so far,
+    which can be compared to `size` to report progress without a separate counting pass.
+    For compressed files both values refer to the compressed file.
+
+    Each iteration opens the file and closes it once exhausted, so the reader can be used directly
+    as an iterable of lines: `for line in LogReader(path): ...`.
+    """
+
+    # Stream constructors wrapping an open binary file, by file extension
+    decompressors = {
+        '.gz': lambda raw: gzip.GzipFile(fileobj=raw, mode='rb'),
+        '.bz2': lambda raw: bz2.BZ2File(raw, mode='rb'),
+        '.xz': lambda raw: lzma.LZMAFile(raw, mode='rb'),
+        '.lzma': lambda raw: lzma.LZMAFile(raw, mode='rb')
+    }
+
+    def __init__(self, filepath: Union[str, os.PathLike], encoding: str = 'utf-8', errors: str = 'strict'):
+        """
+        Log reader constructor.
+        :param filepath: the path to the log file
+        :param encoding: the encoding used to decode lines
+        :param errors: the error handling scheme used to decode lines
+        """
+
+        if not os.path.isfile(filepath):
+            raise FileNotFoundError(f"Log file '{filepath}' not found!")
+
+        self.filepath = filepath
+        self.encoding = encoding
+        self.errors = errors
+        self.size = os.path.getsize(filepath)
+        self.offset = 0
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Iterates over the decoded lines of the file, line endings included.
+        Windows line endings are translated to '\\n', as in text mode.
+        """
+
+        encoding = self.encoding
+        errors = self.errors
+        for line in self.raw_lines():
+            if line.endswith(b'\r\n'):
+                line = line[:-2] + b'\n'
+            yield line.decode(encoding, errors)
+
+    def raw_lines(self) -> Iterator[bytes]:
+        """
+        Iterates over the undecoded lines of the file, line endings included.
+        """
+
+        self.offset = 0
+        decompressor = self.decompressors.get(os.path.splitext(str(self.filepath))[1].lower())
+
+        with open(self.filepath, 'rb') as raw:
+
+            if decompressor is not None:
+                with decompressor(raw) as stream:
+                    for line in stream:
+                        self.offset = raw.tell()
+                        yield line
+                return
+
+            # Empty files cannot be memory-mapped
+            if self.size == 0:
+                return
+
+            with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                readline = mapped.readline
+                line = readline()
+                while line:
+                    self.offset = mapped.tell()
+                    yield line
+                    line = readline()
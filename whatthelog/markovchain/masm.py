@@ -10,17 +10,21 @@ import shutil
 import sys
 from copy import deepcopy
 from datetime import timedelta
+from itertools import islice
 from time import time
 from typing import List, Dict, Tuple
 
 import numpy as np
 
 from scripts.log_scrambler import produce_false_trace
-from whatthelog.definitions import PROJECT_ROOT
+from whatthelog.definitions import PROJECT_ROOT, CACHE_DIR
+from whatthelog.exceptions import UnidentifiedLogException
+from whatthelog.log_reader import LogReader
 from whatthelog.prefixtree.edge_properties import EdgeProperties
 from whatthelog.prefixtree.graph import Graph
 from whatthelog.prefixtree.prefix_tree_factory import PrefixTreeFactory
 from whatthelog.prefixtree.state import State
+from whatthelog.prefixtree.trace_deduplicator import TraceDeduplicator
 from whatthelog.syntaxtree.syntax_tree import SyntaxTree
 from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
 
@@ -31,7 +35,8 @@ class MarkovChain:
     """
 
     def __init__(self, traces_dir: str, config_file: str = "resources/config.json", weight_size: float = 0.5,
-                 weight_accuracy: float = 0.5, eval_file: str = None, random_candidates: bool = False):
+                 weight_accuracy: float = 0.5, eval_file: str = None, random_candidates: bool = False,
+                 cache_dir: str = None):
         self.maxLength = 0
         self.traces_dir = traces_dir
         self.config_file = config_file
@@ -49,7 +54,8 @@ class MarkovChain:
         self.weight_accuracy = weight_accuracy
 
         # Parse the syntax_tree from the config file.
-        self.syntax_tree: SyntaxTree = SyntaxTreeFactory().parse_file(self.config_file)
+        self.cache_dir = cache_dir
+        self.syntax_tree: SyntaxTree = SyntaxTreeFactory(cache_dir).parse_file(self.config_file)
         all_states: List[str] = self.get_all_states(self.syntax_tree)
         self.pt = None
 
@@ -77,7 +83,7 @@ class MarkovChain:
         :param amount: Specifies the amount of negative/false traces to produce
         :param false_dir: Specifies the directory in which the false traces should temporarily be stored.
         """
-        self.pt = PrefixTreeFactory.get_prefix_tree(self.traces_dir, self.config_file)
+        self.pt = PrefixTreeFactory.get_prefix_tree(self.traces_dir, self.config_file, cache_dir=self.cache_dir)
         print('[ masm.py ] - Generating false traces...')
         self.generate_false_traces(false_dir, amount)
         print('[ masm.py ] - False traces generated')
@@ -100,13 +106,7 @@ class MarkovChain:
         This method retrieves all the states from a SyntaxTree.
         :param syntax_tree: Specifies the tree of which the states should be retrieved.
         """
-        res = []
-        if len(syntax_tree.get_children()) > 0:
-            for c in syntax_tree.get_children():
-                res += self.get_all_states(c)
-        else:
-            return [syntax_tree.name]
-        return res
+        return syntax_tree.get_vocabulary()
 
     def remove(self, new: int, to_delete: int, matrix=None, states=None) -> None:
         """
@@ -145,22 +145,41 @@ class MarkovChain:
         This method is used for parallel training of the transition matrix.
         :param files: Specifies the files this process should train the matrix on.
         """
-        for file in files:
-            with open(self.traces_dir + file, 'r') as open_file:
-                current = 'root'
-                for line in open_file.readlines():
-                    try:
-                        next_node = self.syntax_tree.search(line).name
-                    except AttributeError as e:
-                        print(line)
-                        raise e
-                    if next_node not in self.states:
-                        raise Exception('Node not found in self.states')
-                    self.transitionMatrix[self.states[current]][self.states[next_node]] += 1
-                    current = next_node
-                self.transitionMatrix[self.states[current]][self.states['terminal']] += 1
+        counts, _ = self.count_transitions(files)
+        for r, c in zip(*np.nonzero(counts)):
+            self.transitionMatrix[r][c] += int(counts[r, c])
         return self.transitionMatrix
 
+    def count_transitions(self, files: List[str]) -> Tuple[np.ndarray, TraceDeduplicator]:
+        """
+        Counts the transitions of a set of log files.
+        Traces with the same template sequence are only counted once, weighted by their number of occurrences.
+        :param files: Specifies the files to count the transitions of.
+        :return: The matrix of transition counts, and the deduplicator counting the template sequences.
+        """
+        # Maps the template ids of the syntax tree to the indices of the transition matrix.
+        indices = np.array([self.states[name] for name in self.syntax_tree.get_vocabulary()], dtype=np.int64)
+        counts = np.zeros((len(self.transitionMatrix), len(self.transitionMatrix)), dtype=np.int64)
+
+        deduplicator = TraceDeduplicator()
+        # Path through the transition matrix of each distinct template sequence
+        paths: Dict[bytes, np.ndarray] = dict()
+
+        for file in files:
+            reader = LogReader(self.traces_dir + file)
+            template_ids = self.syntax_tree.search_many(reader)
+            if (template_ids < 0).any():
+                line = next(islice(reader, int(np.argmax(template_ids < 0)), None))
+                raise UnidentifiedLogException(line + " was not identified as a valid log.")
+
+            key = deduplicator.add(template_ids)
+            if key not in paths:
+                paths[key] = np.concatenate(([self.states['root']], indices[template_ids], [self.states['terminal']]))
+
+        for key, path in paths.items():
+            np.add.at(counts, (path[:-1], path[1:]), deduplicator.counts[key])
+        return counts, deduplicator
+
     def delete_unreachable(self) -> None:
         """
         Removes any unreachable states from the transition matrix as a form of initial compression.
@@ -192,18 +211,17 @@ class MarkovChain:
         print('[ masm.py ] - Start training using multiprocessing...')
 
         a_pool = multiprocessing.Pool()
-        matrix = None
-        for result in a_pool.map(self.parallel, np.array_split(os.listdir(self.traces_dir), 12)):
-            if matrix is None:
-                matrix = result
-            else:
-                for r in range(len(result)):
-                    for c in range(len(result)):
-                        matrix[r][c] += result[r][c]
+        counts = np.zeros((len(self.transitionMatrix), len(self.transitionMatrix)), dtype=np.int64)
+        deduplicator = TraceDeduplicator()
+        for result, result_deduplicator in a_pool.map(self.count_transitions,
+                                                      np.array_split(os.listdir(self.traces_dir), 12)):
+            counts += result
+            deduplicator.update(result_deduplicator)
         a_pool.close()
         a_pool.join()
-        self.transitionMatrix = matrix
-        print('[ masm.py ] - Training done.')
+        for r, c in zip(*np.nonzero(counts)):
+            self.transitionMatrix[r][c] += int(counts[r, c])
+        print('[ masm.py ] - Training done, ' + deduplicator.report() + '.')
 
         print('[ masm.py ] - Start Normalizing...')
         for i in range(len(self.transitionMatrix)):
@@ -534,15 +552,14 @@ class MarkovChain:
         for file in os.listdir(directory):
             new_lines = []
 
-            with open(os.path.join(directory, file), 'r') as f:
-                previous = None
-                for line in f.readlines():
-                    current = self.syntax_tree.search(line).name
-                    if previous != current:
-                        previous = None
-                        new_lines.append(current.strip())
-                        if len(new_lines) >= 2 and new_lines[len(new_lines) - 2] == current:
-                            previous = current
+            previous = None
+            for line in LogReader(os.path.join(directory, file)):
+                current = self.syntax_tree.search(line).name
+                if previous != current:
+                    previous = None
+                    new_lines.append(current.strip())
+                    if len(new_lines) >= 2 and new_lines[len(new_lines) - 2] == current:
+                        previous = current
 
             os.remove(os.path.join(directory, file))
             if len(new_lines) >= 1:  # It is possible to that the only line was deleted due to mutations.
@@ -620,7 +637,8 @@ if __name__ == '__main__':
                     start_time = time()
                     chain = MarkovChain(os.path.join(PROJECT_ROOT, 'resources/train_files/'),
                                         eval_file=os.path.join(PROJECT_ROOT, 'out/eval/accuracy_results'),
-                                        config_file=os.path.join(PROJECT_ROOT, 'resources/config.json'))
+                                        config_file=os.path.join(PROJECT_ROOT, 'resources/config.json'),
+                                        cache_dir=CACHE_DIR)
                     chain.run_test(true_test_dir=os.path.join(PROJECT_ROOT, 'resources/test_files/'),
                                    false_dir=os.path.join(PROJECT_ROOT, 'out/false_traces/'),
                                    store_intermediate=True)
@@ -659,7 +677,8 @@ if __name__ == '__main__':
                     start_time = time()
                     chain = MarkovChain(os.path.join(PROJECT_ROOT, 'resources/train_files/'),
                                         eval_file=os.path.join(PROJECT_ROOT, 'out/eval/runtime_results'),
-                                        config_file=os.path.join(PROJECT_ROOT, 'resources/config.json'))
+                                        config_file=os.path.join(PROJECT_ROOT, 'resources/config.json'),
+                                        cache_dir=CACHE_DIR)
                     chain.run_test(true_test_dir=os.path.join(PROJECT_ROOT, 'resources/test_files/'),
                                    false_dir=os.path.join(PROJECT_ROOT, 'out/false_traces/'))
     elif sys.argv[1].split('=')[1] == 'random':
@@ -678,7 +697,7 @@ if __name__ == '__main__':
                     chain = MarkovChain(os.path.join(PROJECT_ROOT, 'resources/train_files/'),
                                         eval_file=os.path.join(PROJECT_ROOT, 'out/eval/random_results'),
                                         config_file=os.path.join(PROJECT_ROOT, 'resources/config.json'),
-                                        random_candidates=True)
+                                        random_candidates=True, cache_dir=CACHE_DIR)
 
                     chain.run_test(true_test_dir=os.path.join(PROJECT_ROOT, 'resources/test_files/'),
                                    false_dir=os.path.join(PROJECT_ROOT, 'out/false_traces/'),
@@ -0,0 +1,109 @@
+# ****************************************************************************************************
+# Imports
+# ****************************************************************************************************
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from dataclasses import dataclass
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Internal
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from whatthelog.prefixtree.template_vocabulary import TemplateVocabulary
+from whatthelog.syntaxtree.syntax_tree import SyntaxTree
+
+
+# ****************************************************************************************************
+# Compiled Graph
+# ****************************************************************************************************
+
+@dataclass
+class CompiledGraph:
+    """
+    Dense transition table of a deterministic graph, produced by Graph.compile.
+    Rows are states and columns are template ids of the TemplateVocabulary, -1 marks a missing transition.
+    A trace is accepted if it is not empty, every line has a transition,
+    and the last state reached has a terminal child, as in Graph.match_trace.
+    """
+
+    # Transition table of shape [n_states, n_templates]
+    table: np.ndarray
+    # Whether each state has a terminal child
+    accepting: np.ndarray
+    # Row of the start node
+    start: int
+    # Index in the graph of the state of each row
+    state_indices: np.ndarray
+
+    @staticmethod
+    def encode(templates: Iterable[str]) -> np.ndarray:
+        """
+        Encodes a trace of template names into template ids, -1 for templates never seen before.
+        :param templates: the names of the templates of the trace
+        :return: the int32 array of template ids
+        """
+        return np.fromiter((TemplateVocabulary.find_id(template) for template in templates), dtype=np.int32)
+
+    @staticmethod
+    def encode_lines(lines: Iterable[str], syntax_tree: SyntaxTree) -> np.ndarray:
+        """
+        Encodes a trace of log lines into template ids, -1 for unmatched lines and templates never seen before.
+        :param lines: the log lines of the trace
+        :param syntax_tree: the syntax tree used to get the template of each line
+        :return: the int32 array of template ids
+        """
+
+        # Template ids of the syntax tree vocabulary, with a trailing -1 for unmatched lines
+        ids = np.array([TemplateVocabulary.find_id(name) for name in syntax_tree.get_vocabulary()] + [-1],
+                       dtype=np.int32)
+        return ids[syntax_tree.search_many(lines)]
+
+    def match(self, trace: Sequence[int]) -> bool:
+        """
+        Checks if a template id encoded trace is accepted.
+        :param trace: the template ids of the trace
+        :return: True if the trace is accepted, False otherwise
+        """
+        return bool(self.match_many([trace])[0])
+
+    def match_many(self, traces: List[Sequence[int]]) -> np.ndarray:
+        """
+        Checks a batch of template id encoded traces at once,
+        advancing all of them by one position per step with a single table lookup.
+        :param traces: the template ids of each trace
+        :return: a boolean array telling whether each trace is accepted
+        """
+
+        n_templates = self.table.shape[1]
+        lengths = np.fromiter((len(trace) for trace in traces), dtype=np.int64, count=len(traces))
+        max_length = int(lengths.max()) if len(traces) > 0 else 0
+
+        # Pad the traces into a matrix, padding and unknown templates are -1
+        ids = np.full((len(traces), max_length), -1, dtype=np.int32)
+        for i, trace in enumerate(traces):
+            ids[i, :lengths[i]] = trace
+
+        states = np.full(len(traces), self.start, dtype=np.int32)
+        for position in range(max_length):
+            active = np.flatnonzero((lengths > position) & (states >= 0))
+            if len(active) == 0:
+                break
+
+            current = states[active]
+            templates = ids[active, position]
+            known = (templates >= 0) & (templates < n_templates)
+
+            next_states = np.full(len(active), -1, dtype=np.int32)
+            next_states[known] = self.table[current[known], templates[known]]
+            states[active] = next_states
+
+        reached = states >= 0
+        accepted = np.zeros(len(traces), dtype=bool)
+        accepted[reached] = self.accepting[states[reached]]
+        return accepted & (lengths > 0)
@@ -0,0 +1,102 @@
+# ****************************************************************************************************
+# Imports
+# ****************************************************************************************************
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from typing import Dict, Iterator
+
+
+# ****************************************************************************************************
+# Disjoint Set
+# ****************************************************************************************************
+
+class DisjointSet:
+    """
+    Disjoint-set forest over integers, with union by rank and path compression.
+    Besides its root, each set has a leader: the element the set is named after,
+    which is kept by unions regardless of the shape of the forest.
+    Elements are added implicitly the first time they are used.
+    """
+
+    __slots__ = ['parents', 'ranks', 'leaders']
+
+    def __init__(self):
+        self.parents: Dict[int, int] = {}
+        self.ranks: Dict[int, int] = {}
+        self.leaders: Dict[int, int] = {}
+
+    def find(self, item: int) -> int:
+        """
+        Finds the root of the set holding an item, compressing the path to it.
+        :param item: the item to look up
+        :return: the root of the set
+        """
+
+        parents = self.parents
+        if item not in parents:
+            parents[item] = item
+            self.ranks[item] = 0
+            self.leaders[item] = item
+            return item
+
+        root = item
+        while parents[root] != root:
+            root = parents[root]
+
+        while parents[item] != root:
+            parents[item], item = root, parents[item]
+
+        return root
+
+    def leader(self, item: int) -> int:
+        """
+        Retrieves the leader of the set holding an item.
+        :param item: the item to look up
+        :return: the leader of the set
+        """
+        return self.leaders[self.find(item)]
+
+    def union(self, item1: int, item2: int) -> int:
+        """
+        Merges the sets of two items, the leader of the first set becomes the leader of the merged set.
+        :param item1: an item of the set whose leader is kept
+        :param item2: an item of the set merged into it
+        :return: the leader of the merged set
+        """
+
+        root1 = self.find(item1)
+        root2 = self.find(item2)
+        leader = self.leaders[root1]
+        if root1 == root2:
+            return leader
+
+        if self.ranks[root1] < self.ranks[root2]:
+            root1, root2 = root2, root1
+        elif self.ranks[root1] == self.ranks[root2]:
+            self.ranks[root1] += 1
+
+        self.parents[root2] = root1
+        self.leaders[root1] = leader
+        del self.leaders[root2]
+        return leader
+
+    def clear(self) -> None:
+        """
+        Removes all the items.
+        """
+
+        self.parents.clear()
+        self.ranks.clear()
+        self.leaders.clear()
+
+    def __contains__(self, item: int) -> bool:
+        return item in self.parents
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.parents)
+
+    def __len__(self):
+        return len(self.parents)
@@ -1,12 +1,17 @@
-from typing import List, Union, Dict, Tuple
+from typing import List, Union, Dict, Set, Tuple, Iterable
+
+import numpy as np
 
 from whatthelog.auto_printer import AutoPrinter
 from whatthelog.exceptions import StateAlreadyExistsException, \
     StateDoesNotExistException, NonDeterminismException
+from whatthelog.prefixtree.compiled_graph import CompiledGraph
+from whatthelog.prefixtree.disjoint_set import DisjointSet
 from whatthelog.prefixtree.edge_properties import EdgeProperties
 from whatthelog.prefixtree.sparse_matrix import SparseMatrix
 from whatthelog.prefixtree.state import State
 from whatthelog.prefixtree.state_properties import StateProperties
+from whatthelog.prefixtree.template_vocabulary import TemplateVocabulary
 from whatthelog.syntaxtree.syntax_tree import SyntaxTree
 
 
@@ -16,21 +21,37 @@ class Graph(AutoPrinter):
     """
 
     __slots__ = ['edges', 'states', 'state_indices_by_id', 'prop_by_hash',
-                 'start_node', 'terminal_node']
+                 'start_node', 'terminal_node', 'pending_merges', 'transitions', 'accepting', 'next_index']
+
+    # Transition index entry of a template leading to more than one state
+    nondeterministic = -1
 
     def __getstate__(self):
-        return {slot: getattr(self, slot) for slot in self.__slots__}
+        self.compact()
+        # The transition index is derived data, it is rebuilt on demand after loading
+        return {slot: getattr(self, slot) for slot in self.__slots__ if slot not in ('transitions', 'accepting')}
 
     def __setstate__(self, state):
 
+        self.pending_merges = DisjointSet()
+        self.transitions = None
+        self.accepting = None
         for slot in state:
             setattr(self, slot, state[slot])
+        if 'next_index' not in state:
+            # Graphs pickled before indices were allocated from a counter
+            self.next_index = max(self.states, default=-1) + 1
 
         # --- Rebuild state indices table ---
         self.state_indices_by_id = {}
         for index, s in self.states.items():
             self.state_indices_by_id[id(s)] = index
 
+        # --- Rebuild properties table, as template ids are re-interned on load ---
+        self.prop_by_hash = {}
+        for properties in state['prop_by_hash'].values():
+            self.prop_by_hash[properties.get_prop_hash()] = properties
+
     def __init__(self, start_node: State = None, terminal_node: State = None):
         self.edges = SparseMatrix()
         self.states: Dict[int, State] = {}
@@ -38,6 +59,14 @@ class Graph(AutoPrinter):
         self.prop_by_hash: Dict[int, StateProperties] = {}
         self.start_node = start_node
         self.terminal_node = terminal_node
+        # Merges recorded by lazy_merge_states, between state indices, not yet applied
+        self.pending_merges = DisjointSet()
+        # Index from state index to a dictionary from template id to next state index, built on demand
+        self.transitions: Union[Dict[int, Dict[int, int]], None] = None
+        # Indices of the states having a terminal child, built and dropped along with the transition index
+        self.accepting: Union[Set[int], None] = None
+        # Index of the next added state, indices of removed states are never reused
+        self.next_index = 0
         if start_node is not None:
             self.add_state(start_node)
         if terminal_node is not None:
@@ -64,16 +93,12 @@ class Graph(AutoPrinter):
         if state in self:
             raise StateAlreadyExistsException()
 
-        curr_index = len(self.states)
+        curr_index = self.next_index
+        self.next_index += 1
         self.states[curr_index] = state
         self.state_indices_by_id[id(state)] = curr_index
 
-        if state.properties.get_prop_hash() in self.prop_by_hash:
-            state.properties = self.prop_by_hash[
-                state.properties.get_prop_hash()]
-        else:
-            self.prop_by_hash[
-                state.properties.get_prop_hash()] = state.properties
+        self.__share_properties(state)
 
     def add_edge(self, start: State, end: State,
                  props: EdgeProperties = EdgeProperties()) -> bool:
@@ -87,6 +112,7 @@ class Graph(AutoPrinter):
         edge does not exist or edge already exists returns False else True.
         """
 
+        self.compact()
         if id(start) not in self.state_indices_by_id or id(
                 end) not in self.state_indices_by_id:
             return False
@@ -95,6 +121,17 @@ class Graph(AutoPrinter):
         end_index = self.state_indices_by_id[id(end)]
         if not (start_index, end_index) in self.edges:
             self.edges[start_index, end_index] = str(props)
+
+            # Keep the transition index up to date, so that graphs can be built incrementally using it
+            if self.transitions is not None:
+                next_by_template = self.transitions.setdefault(start_index, {})
+                for template_id in end.properties.template_ids:
+                    if next_by_template.get(template_id, end_index) != end_index:
+                        next_by_template[template_id] = self.nondeterministic
+                    else:
+                        next_by_template[template_id] = end_index
+                if end.is_terminal:
+                    self.accepting.add(start_index)
             return True
         return False
 
@@ -104,6 +141,7 @@ class Graph(AutoPrinter):
 
         :return: Number of states
         """
+        self.compact()
         return len(self.states)
 
     def get_outgoing_props(self, state: State) -> List[EdgeProperties]:
@@ -114,6 +152,7 @@ class Graph(AutoPrinter):
         :return: List of outgoing edges from state.
         If state does not exist raises StateDoesNotExistException.
         """
+        self.compact()
         if state in self:
             results = self.edges.find_children(
                 self.state_indices_by_id[id(state)])
@@ -129,6 +168,7 @@ class Graph(AutoPrinter):
         :return: List of outgoing edges from state.
         If state does not exist raises StateDoesNotExistException.
         """
+        self.compact()
         if state in self:
             results = self.edges.find_children(
                 self.state_indices_by_id[id(state)])
@@ -158,6 +198,7 @@ class Graph(AutoPrinter):
         :return: List of outgoing edges from state.
         If state does not exist raises StateDoesNotExistException.
         """
+        self.compact()
         if state in self:
             results = self.edges.get_parents(
                 self.state_indices_by_id[id(state)])
@@ -200,9 +241,9 @@ class Graph(AutoPrinter):
         for i, outgoing in enumerate(outgoing_states):
             if children_indices is not None:
                 if i in children_indices and outgoing.is_terminal is False:
-                    self.merge_states(state, outgoing)
+                    self.lazy_merge_states(state, outgoing)
             else:
-                self.merge_states(state, outgoing)
+                self.lazy_merge_states(state, outgoing)
 
         # Remove non-determinism in the merged state's children by merging them.
         new_state = self.determinize(state)
@@ -215,25 +256,10 @@ class Graph(AutoPrinter):
         :param state1: The new 'merged' state
         :param state2: The state that will be deleted and which properties will be passed to state 1
         """
-        props = state1.properties.log_templates.copy()
-
-        for temp in state2.properties.log_templates:
-            if temp not in state1.properties.log_templates:
-                props.append(temp)
-        state1.properties = StateProperties(props)
-
-        if state2.is_terminal:
-            state1.is_terminal = True
-
-        if state2 is self.start_node:
-            self.start_node = state1
-
-        if state1.properties.get_prop_hash() in self.prop_by_hash:
-            state1.properties = self.prop_by_hash[
-                state1.properties.get_prop_hash()]
-        else:
-            self.prop_by_hash[
-                state1.properties.get_prop_hash()] = state1.properties
+        self.compact()
+        self.transitions = None
+        self.__merge_properties(state1, state2)
+        self.__share_properties(state1)
 
         self.edges.change_parent_of_children(
             self.state_indices_by_id[id(state1)],
@@ -247,19 +273,129 @@ class Graph(AutoPrinter):
         del self.state_indices_by_id[id(state2)]
         del state2
 
+    def merge_many_states(self, merges: Iterable[Tuple[State, State]]) -> None:
+        """
+        Merges many pairs of states at once, with the same result as calling merge_states on each pair in order.
+        Pairs may refer to states merged by an earlier pair, e.g. (a, b) followed by (b, c) merges c into a.
+        All the edges are rewired in a single pass once the merged properties have been computed.
+        :param merges: pairs of states (state1, state2), where state2 is merged into state1
+        """
+
+        self.compact()
+
+        # Index of each removed state, to the index of the state it was merged into
+        targets: Dict[int, int] = {}
+
+        def find(index: int) -> int:
+            while index in targets:
+                index = targets[index]
+            return index
+
+        for state1, state2 in merges:
+            if state1 not in self or state2 not in self:
+                raise StateDoesNotExistException()
+
+            index1 = find(self.state_indices_by_id[id(state1)])
+            index2 = find(self.state_indices_by_id[id(state2)])
+            if index1 == index2:
+                continue
+
+            self.__merge_properties(self.states[index1], self.states[index2])
+            targets[index2] = index1
+
+        if len(targets) == 0:
+            return
+
+        self.transitions = None
+        redirects = {index: find(index) for index in targets}
+        for index in set(redirects.values()):
+            self.__share_properties(self.states[index])
+
+        self.edges.redirect(redirects)
+
+        for index in redirects:
+            del self.state_indices_by_id[id(self.states[index])]
+            del self.states[index]
+
+    def lazy_merge_states(self, state1: State, state2: State) -> None:
+        """
+        Records that a state is to be merged into another, without touching the edges.
+        Recorded merges are kept in a disjoint-set forest and applied together by compact,
+        which is called on demand by any method querying or changing the edges.
+        Until then both states remain in the graph, and `states` should not be accessed directly.
+        :param state1: The new 'merged' state
+        :param state2: The state that will be deleted and which properties will be passed to state 1
+        """
+        if state1 not in self or state2 not in self:
+            raise StateDoesNotExistException()
+
+        self.pending_merges.union(self.state_indices_by_id[id(state1)],
+                                  self.state_indices_by_id[id(state2)])
+
+    def compact(self) -> None:
+        """
+        Applies all the merges recorded by lazy_merge_states,
+        unifying the properties and rewiring the edges in a single pass.
+        """
+        merges = self.pending_merges
+        if len(merges) == 0:
+            return
+
+        pairs = [(self.states[merges.leader(index)], self.states[index])
+                 for index in merges if merges.leader(index) != index]
+        merges.clear()
+        self.merge_many_states(pairs)
+
+    def __merge_properties(self, state1: State, state2: State) -> None:
+        """
+        Passes the templates and flags of a state to the state it is merged into.
+        :param state1: The new 'merged' state
+        :param state2: The state whose properties are passed to state 1
+        """
+
+        props = state1.properties
+        state1.properties = StateProperties.from_ids(
+            props.template_ids + tuple(template_id for template_id in state2.properties.template_ids
+                                       if template_id not in props.template_set))
+
+        if state2.is_terminal:
+            state1.is_terminal = True
+
+        if state2 is self.start_node:
+            self.start_node = state1
+
+    def __share_properties(self, state: State) -> None:
+        """
+        Replaces the properties of a state with the equal instance already held by the graph, if any.
+        """
+
+        prop_hash = state.properties.get_prop_hash()
+        if prop_hash in self.prop_by_hash:
+            state.properties = self.prop_by_hash[prop_hash]
+        else:
+            self.prop_by_hash[prop_hash] = state.properties
+
     def determinize(self, state: State) -> State:
+        """
+        Removes non-determinism around a state, typically after it was merged:
+        equivalent children of the state are merged, then those of its parents,
+        and whenever the children of a parent change, those of its own parents in turn.
+        :param state: The state to start from
+        :return: The last state whose children changed, or the state the input state was merged into
+        """
+
         new_state, changed = self.merge_equivalent_children(state)
 
-        # Get the current state's parent
+        # Parents are processed from a worklist rather than recursively, so that long chains are supported
         parents = self.get_incoming_states(new_state)
-
-        # For each parent
-        # TODO: Dont include self in parents in case of self loops
         while len(parents) > 0:
-            # Remove non-determinism in the parent
-            current, changed = self.merge_equivalent_children(parents.pop())
+            parent = parents.pop()
+
+            # The parent was merged away while processing another state
+            if parent not in self:
+                continue
 
-            # If a change occurred, update the list of parents
+            current, changed = self.merge_equivalent_children(parent)
             if changed:
                 new_state = current
                 parents = self.get_incoming_states(current)
@@ -269,145 +405,257 @@ class Graph(AutoPrinter):
     def merge_equivalent_children(self, current: State) -> Tuple[State, bool]:
         """
         Merge all equivalent children, such that the resulting automaton remains deterministic while merging.
+        If any children were merged, the children of the state are then processed in the same way, depth first,
+        using an explicit stack rather than recursion.
         :param current: The state of which we want to merge the children
+        :return: The state the input state was eventually merged into, and whether any of its children were merged
         """
-        merged: bool = False
 
-        # Get all the children of the current node
-        # TODO: Refactor duplicate lines
-        children = self.get_outgoing_states(current)
+        current, merged = self.__merge_equivalent_children_once(current)
+        if not merged:
+            return current, False
+
+        stack = list(reversed(self.get_outgoing_states_not_self(current)))
+        while len(stack) > 0:
+            state = stack.pop()
 
-        # Get the log templates
-        children_templates: List[List[str]] = list(
-            map(lambda x: x.properties.log_templates, children))
+            # The state was merged away while processing a previous one
+            if state not in self:
+                continue
 
-        # Get a list of duplicate states
-        # Two states are duplicates if they have any template in common
-        duplicates = []
-        for i, x in enumerate(children_templates):
-            j = self.__equivalence_index(children_templates, x)
-            if i != j:
-                duplicates.append((children[i], children[j]))
-        has_nondeterminism = len(duplicates) > 0
+            state, state_merged = self.__merge_equivalent_children_once(state)
+            if state_merged:
+                stack.extend(reversed(self.get_outgoing_states_not_self(state)))
 
-        # While there are still duplicates left
-        while len(duplicates) > 0:
+        return current, True
 
-            s1, s2 = duplicates.pop()
+    def __merge_equivalent_children_once(self, current: State) -> Tuple[State, bool]:
+        """
+        Merges the equivalent children of a single state, i.e. children having any template in common.
+        Of all the children having an equivalent child before them, the last one is merged into the first child
+        it is equivalent to, and so on until no two children are equivalent.
+        Since merging a child never gives an equivalent to a later child, the children are swept once from last
+        to first, keeping a map from template to the first child holding it up to date across merges.
+        The sweep only starts over when the state itself is merged, as its children then change.
+        :param current: The state of which we want to merge the children
+        :return: The state the input state was eventually merged into, and whether any merge took place
+        """
 
-            if s1 is current:
-                current = s2
-            self.merge_states(s2, s1)
-            merged = True
+        merged = False
+        restart = True
 
-            # Update the children and duplicates list
+        while restart:
+            restart = False
             children = self.get_outgoing_states(current)
-            children_templates: List[List[str]] = list(
-                map(lambda x: x.properties.log_templates, children))
-
-            # TODO Make this more time efficient ie dont recalculate children but add new ones
-            duplicates = []
-            for i, x in enumerate(children_templates):
-                j = self.__equivalence_index(children_templates, x)
-                if i != j:
-                    duplicates.append((children[i], children[j]))
 
-        if has_nondeterminism:
-            children = self.get_outgoing_states_not_self(current)
-            for child in children:
-                self.merge_equivalent_children(child)
+            first_by_template: Dict[int, int] = {}
+            for i, child in enumerate(children):
+                for template_id in child.properties.template_ids:
+                    first_by_template.setdefault(template_id, i)
+
+            for i in range(len(children) - 1, 0, -1):
+                template_ids = children[i].properties.template_ids
+                j = min((first_by_template[template_id] for template_id in template_ids), default=i)
+                if j == i:
+                    continue
+
+                s1, s2 = children[i], children[j]
+                for template_id in template_ids:
+                    first_by_template[template_id] = j
+                restart = s1 is current or s2 is current
+                if s1 is current:
+                    current = s2
+                self.merge_states(s2, s1)
+                merged = True
+
+                if restart:
+                    break
 
         return current, merged
 
-    def match_log_template_trace(self, trace: List[str]) -> bool:
-        node = self.start_node
+    def get_transitions(self) -> Dict[int, Dict[int, int]]:
+        """
+        Transition index getter, mapping each state index to a dictionary from template id to next state index.
+        A template leading to more than one state maps to Graph.nondeterministic.
+        The index is built on first use and kept up to date when edges are added,
+        while merging states drops it until it is used again.
+        :return: the transition index
+        """
+        self.compact()
+        if self.transitions is None:
+            transitions: Dict[int, Dict[int, int]] = {}
+            accepting: Set[int] = set()
+            for start, row in self.edges.rows.items():
+                next_by_template: Dict[int, int] = {}
+                for end in row:
+                    if self.states[end].is_terminal:
+                        accepting.add(start)
+                    for template_id in self.states[end].properties.template_ids:
+                        if template_id in next_by_template and next_by_template[template_id] != end:
+                            next_by_template[template_id] = self.nondeterministic
+                        else:
+                            next_by_template[template_id] = end
+                transitions[start] = next_by_template
+            self.transitions = transitions
+            self.accepting = accepting
+        return self.transitions
+
+    def compile(self) -> CompiledGraph:
+        """
+        Compiles the graph into a dense transition table, to match batches of traces at once.
+        The table covers all the templates interned so far, and is not updated by later changes to the graph.
+        :return: the compiled graph.
+        If the graph is not deterministic raises NonDeterminismException.
+        """
 
-        for name in trace:
-            if node.is_terminal:
-                return False
+        transitions = self.get_transitions()
+        state_indices = np.array(sorted(self.states), dtype=np.int32)
+        rows = {index: row for row, index in enumerate(state_indices.tolist())}
 
-            outgoing = self.get_outgoing_states(node)
-            outgoing = list(filter(lambda x: self.template_matches_state(name, x), outgoing))
+        table = np.full((len(state_indices), TemplateVocabulary.size()), -1, dtype=np.int32)
+        accepting = np.zeros(len(state_indices), dtype=bool)
+        for start, next_by_template in transitions.items():
+            for template_id, end in next_by_template.items():
+                if end == self.nondeterministic:
+                    raise NonDeterminismException()
+                table[rows[start], template_id] = rows[end]
 
-            if len(outgoing) > 1:
-                raise NonDeterminismException()
-            elif len(outgoing) == 0:
-                return False
-            else:
-                node = outgoing[0]
-        return True
+        for start in self.accepting:
+            accepting[rows[start]] = True
+
+        return CompiledGraph(table, accepting, rows[self.state_indices_by_id[id(self.start_node)]], state_indices)
 
-    def match_trace(self, trace: List[str], syntax_tree: SyntaxTree) -> bool:
+    def find_path(self, templates: Iterable[str], start: State = None) -> Union[List[State], None]:
+        """
+        Simulates the graph as a non-deterministic automaton on a trace of templates.
+        The set of states reachable after each template is advanced one template at a time,
+        together with the predecessor of each reached state, so that a witness path can be rebuilt at the end.
+        When several paths are possible, the one through the states with the lowest indices is returned.
+        :param templates: the names of the templates of the trace, None for lines without a template
+        :param start: the state to start from, the start node if None
+        :return: the states reached for each template, if the last one has a terminal child.
+        If no such path exists None is returned.
         """
-        Checks if a given trace matches a path in the graph.
-        First, the first line is checked against the start node of the graph.
-        If it fits, a successor that matches the next line is picked and the list
-        is traversed recursively.
 
-        :param trace: The lines to be matched against the tree.
-        :return: If the trace corresponds to a sequence of states in the graph,
-                 those states are returned in order. If no match is found, None is returned.
+        self.compact()
+        frontier: List[int] = [self.state_indices_by_id[id(start if start is not None else self.start_node)]]
+        # For each template, the dictionary from each reached state to its predecessor
+        steps: List[Dict[int, int]] = []
+
+        for template in templates:
+            predecessors = self.advance(frontier, template)
+            if len(predecessors) == 0:
+                return None
+            steps.append(predecessors)
+            frontier = sorted(predecessors)
+
+        for state in frontier:
+            if self.is_accepting(state):
+                path = [state]
+                for predecessors in reversed(steps[1:]):
+                    path.append(predecessors[path[-1]])
+                return [self.states[index] for index in reversed(path)] if len(steps) > 0 else []
+        return None
+
+    def advance(self, frontier: Iterable[int], template: Union[str, None]) -> Dict[int, int]:
+        """
+        Advances a set of states by one template, as a non-deterministic automaton.
+        :param frontier: the indices of the current states, in the order in which predecessors are preferred
+        :param template: the name of the template, None for a line without a template
+        :return: a dictionary from the index of each state reached to the index of its first predecessor
         """
-        if len(trace) == 0:
-            # If the trace is empty, then it has been fully parsed
-            return False
 
-        # Check which state the current line belongs to
-        template = syntax_tree.search(trace[0])
+        transitions = self.get_transitions()
+        template_id = TemplateVocabulary.find_id(template) if template is not None else -1
+        predecessors: Dict[int, int] = {}
 
-        # If no state is found, return false
-        if template is None:
-            return False
+        for state in frontier:
+            next_by_template = transitions.get(state)
+            next_index = next_by_template.get(template_id) if next_by_template is not None else None
+            if next_index is None:
+                continue
 
-        # Get the root's children
-        root_children_matching = list(
-            filter(lambda s: self.template_matches_state(template.name, s),
-                   self.get_outgoing_states(self.start_node)))
+            if next_index == self.nondeterministic:
+                for child in self.edges.rows[state]:
+                    if self.states[child].properties.has_template_id(template_id):
+                        predecessors.setdefault(child, state)
+            else:
+                predecessors.setdefault(next_index, state)
 
-        # If no suitable option, return
-        if len(root_children_matching) == 0:
-            return False
+        return predecessors
 
-        if len(root_children_matching) > 1:
+    def is_accepting(self, state_index: int) -> bool:
+        """
+        Checks if a trace may end in a state, i.e. if the state has a terminal child.
+        The accepting states are indexed along with the transitions, so the check does not scan the edges.
+        :param state_index: the index of the state
+        """
+        self.get_transitions()
+        return state_index in self.accepting
+
+    def __next_state_index(self, state_index: int, template: str) -> Union[int, None]:
+        """
+        Looks up the transition index for the state reached from a state through a template.
+        :param state_index: the index of the current state
+        :param template: the name of the template
+        :return: the index of the next state, or None if there is no such state.
+        If the template leads to more than one state raises NonDeterminismException.
+        """
+        next_by_template = self.get_transitions().get(state_index)
+        if next_by_template is None:
+            return None
+
+        next_index = next_by_template.get(TemplateVocabulary.find_id(template))
+        if next_index == self.nondeterministic:
             raise NonDeterminismException()
+        return next_index
 
-        # Randomly pick first suitable state
-        current_state: State = root_children_matching[0]
+    def match_log_template_trace(self, trace: Iterable[str]) -> bool:
+        self.compact()
+        index = self.state_indices_by_id[id(self.start_node)]
 
-        if self.template_matches_state(template.name, current_state):
-            trace[:] = trace[1:]
+        for name in trace:
+            if self.states[index].is_terminal:
+                return False
 
-            while len(trace) > 0:
-                # Find the template of the first line in the syntax tree
-                template = syntax_tree.search(trace[0])
+            index = self.__next_state_index(index, name)
+            if index is None:
+                return False
+        return True
 
-                # If no state is found, raise an exception
-                if template is None:
-                    return False
+    def match_trace(self, trace: Iterable[str], syntax_tree: SyntaxTree) -> bool:
+        """
+        Checks if a given trace matches a path in the graph.
+        The lines are consumed one at a time, starting from the start node of the graph,
+        so any iterable can be matched, e.g. a LogReader. The input is never modified.
 
-                # Check if any of the children of current node contain the template in their state
-                children: List[State] = self.get_outgoing_states(current_state)
-                successor: List[State] = list(
-                    filter(lambda next_state: self.template_matches_state(
-                        template.name, next_state), children))
+        :param trace: The lines to be matched against the tree.
+        :param syntax_tree: The syntax tree used to get the template of each line.
+        :return: True if the trace is not empty, matches a path in the graph,
+                 and the last state of the path has a terminal child. False otherwise.
+        """
 
-                if len(successor) == 0:
-                    # If none found, the trace cannot be matched
-                    return False
-                elif len(successor) > 1:
-                    raise NonDeterminismException()
-                else:
-                    # Pick next node
-                    current_state = successor[0]
-                    # Remove first trace
-                    trace = trace[1:]
-
-            if [state for state in self.get_outgoing_states(current_state) if state.is_terminal]:
-                return True
-            else:
+        self.compact()
+        current = self.state_indices_by_id[id(self.start_node)]
+        matched = False
+
+        for line in trace:
+            # Find the template of the line in the syntax tree
+            template = syntax_tree.search(line)
+
+            # If no state is found, the trace cannot be matched
+            if template is None:
                 return False
-        else:
-            return False
+
+            # Pick the child of the current node containing the template in its state
+            current = self.__next_state_index(current, template.name)
+
+            # If none found, the trace cannot be matched
+            if current is None:
+                return False
+            matched = True
+
+        return matched and self.is_accepting(current)
 
     def __remove_singular_loops(self) -> None:
         """
@@ -465,20 +713,7 @@ class Graph(AutoPrinter):
     @staticmethod
     def template_matches_state(template: str,
                                state: State) -> bool:
-        return template in state.properties.log_templates
-
-    @staticmethod
-    def __equivalence_index(target_list: List[List[str]],
-                            target_items: List[str]) -> Union[int, None]:
-        """
-        For a given template, find the first index within a list that has a weakly equivalent template.
-        Weak equivalence implies that at least one template is common.
-        """
-        for i, l in enumerate(target_list):
-            for item in target_items:
-                if item in l:
-                    return i
-        return None
+        return state.properties.has_template(template)
 
     def __str__(self):
         return str(self.states)
@@ -487,4 +722,5 @@ class Graph(AutoPrinter):
         return id(item) in self.state_indices_by_id
 
     def __len__(self):
+        self.compact()
         return len(self.states)
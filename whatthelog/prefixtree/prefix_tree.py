@@ -7,7 +7,8 @@
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
 from __future__ import annotations
-from typing import List, Union
+from collections import deque
+from typing import Dict, FrozenSet, List, Union
 
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 # Internal
@@ -55,6 +56,22 @@ class PrefixTree(Graph):
         """
         return self.get_outgoing_states(state)
 
+    def get_child(self, state: State, template_id: int) -> Union[State, None]:
+        """
+        Method to get the child of a state holding a template, using the transition index of the graph.
+
+        :param state: State to get the child of
+        :param template_id: the interned id of the template
+        :return: The child holding the template, the first one in case of several. None if there is no such child.
+        """
+
+        index = self.get_transitions().get(self.state_indices_by_id[id(state)], {}).get(template_id)
+        if index is None:
+            return None
+        if index == self.nondeterministic:
+            return next(child for child in self.get_children(state) if child.properties.has_template_id(template_id))
+        return self.states[index]
+
     def add_child(self, state: State, parent: State, props: EdgeProperties = EdgeProperties([])):
         """
         Method to add a child in the tree.
@@ -70,12 +87,46 @@ class PrefixTree(Graph):
         self.add_state(state)
         self.add_edge(parent, state, props)
 
+    def add_trace_end(self, state: State, count: int = 1) -> None:
+        """
+        Records traces ending at a state, as the weight of its edge to the terminal node.
+        Requires that the state be in the current tree, and that the tree have a terminal node.
+
+        :param state: the last state of the traces
+        :param count: the number of traces
+        """
+
+        assert state in self, "State is not in the tree!"
+
+        key = (self.state_indices_by_id[id(state)], self.state_indices_by_id[id(self.get_terminal())])
+        if not self.add_edge(state, self.get_terminal(), EdgeProperties([str(count)])):
+            self.edges[key] = str(EdgeProperties([str(self.get_trace_count(state) + count)]))
+
+    def get_trace_count(self, state: State) -> int:
+        """
+        Retrieves the number of traces ending at a state, the weight of its edge to the terminal node.
+        Edges to the terminal node without a weight count as a single trace.
+
+        :param state: State to get the number of traces of
+        :return: The number of traces ending at the state, 0 if it has no edge to the terminal node.
+        """
+
+        self.compact()
+        value = self.edges.find_edge((self.state_indices_by_id[id(state)],
+                                      self.state_indices_by_id[id(self.get_terminal())]))
+        if value is None:
+            return 0
+        props = EdgeProperties.parse(value).props
+        return int(props[0]) if len(props) > 0 else 1
+
     def add_branch(self, state: State, tree: PrefixTree, parent: State):
         """
         Appends a branch from the input tree starting at the given state
         to the current tree under the given parent.
         Requires that the parent be in the current tree,
         and that the branch must not contain nodes already in the current tree.
+        Edges to the terminal node of the input tree are linked to the terminal node of this tree, if any,
+        keeping their number of traces, and self loops are preserved.
         :param state: the root of the branch to add
         :param tree: the tree where the branch originates from
         :param parent: the node in the current tree to append the branch to
@@ -83,21 +134,28 @@ class PrefixTree(Graph):
 
         assert parent in self, "Parent is not in the tree!"
 
-        queue = [(state, parent)]
+        queue = deque([(state, parent)])
         while queue:
 
-            current, parent = queue.pop(0)
+            current, parent = queue.popleft()
+
+            if current is tree.get_terminal() and self.get_terminal() is not None:
+                self.add_trace_end(parent, tree.get_trace_count(parent) if parent in tree else 1)
+                continue
+
             assert current not in self, "Branch state is already in current tree!"
 
             self.add_child(current, parent)
 
             for child in tree.get_children(current):
-                queue.append((child, current))
+                if child is current:
+                    self.add_edge(current, current)
+                else:
+                    queue.append((child, current))
 
     def get_parent(self, state: State) -> Union[State, None]:
         """
         Method to get the parent of a state.
-        WARNING: This method is O(n) were n is the number of edges in the tree!
 
         :param state: State to get parent of
         :return: Parent of state. If None state is the root.
@@ -115,7 +173,8 @@ class PrefixTree(Graph):
     def merge(self, other: PrefixTree):
         """
         Merges another tree into the current one.
-        The tree's children are appended to this one's, the tree's parent is discarded.
+        The tree's children are appended to this one's, the tree's parent is discarded,
+        and the numbers of traces ending at equivalent states are summed.
         Requires the input tree to have the same root as this one.
         Assumes the tree is coherent: there are no duplicated children in any node.
 
@@ -126,23 +185,29 @@ class PrefixTree(Graph):
             raise InvalidTreeException("Merge failed: source tree does not have same root as destination tree!")
 
         stack = [(self.get_root(), other.get_root())]
-        while True:
+        while stack:
 
             this_state, that_state = stack.pop()
 
+            # Equivalent states hold the same set of templates
+            this_children: Dict[FrozenSet[int], State] = {
+                child.properties.template_set: child for child in self.get_children(this_state)}
+
             for that_child in other.get_children(that_state):
-                conflict = False
-                for this_child in self.get_children(this_state):
-                    if that_child.is_equivalent(this_child):
+                if that_child is that_state:
+                    self.add_edge(this_state, this_state)
+                    continue
+                if that_child is other.get_terminal() and self.get_terminal() is not None:
+                    self.add_trace_end(this_state, other.get_trace_count(that_state))
+                    continue
+
+                this_child = this_children.get(that_child.properties.template_set)
+                if this_child is not None:
+                    if that_child is not other.get_terminal():
                         stack.append((this_child, that_child))
-                        conflict = True
-
-                if not conflict:
+                else:
                     self.add_branch(that_child, other, this_state)
 
-            if not stack:
-                break
-
 
 #****************************************************************************************************
 # Prefix Tree Iterator
@@ -156,14 +221,14 @@ class TreeIterator:
 
     def __init__(self, tree: PrefixTree):
         self.tree = tree
-        self.queue = [tree.get_root()]
+        self.queue = deque([tree.get_root()])
 
     def __next__(self):
 
         if not self.queue:
             raise StopIteration
 
-        current = self.queue.pop(0)
+        current = self.queue.popleft()
         for child in self.tree.get_children(current):
             self.queue.append(child)
 
@@ -6,21 +6,30 @@
 # External
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
+import hashlib
+import json
+from multiprocessing import Pool
 import os
 import sys
 from pathlib import Path
 import pickle
+import time
 from tqdm import tqdm
+from typing import Dict, Iterator, List, Tuple, Union
 
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 # Internal
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
+from whatthelog.log_reader import LogReader
 from whatthelog.prefixtree.edge_properties import EdgeProperties
 from whatthelog.prefixtree.prefix_tree import PrefixTree
+from whatthelog.prefixtree.radix_prefix_tree import RadixPrefixTree
 from whatthelog.prefixtree.state import State
+from whatthelog.prefixtree.template_vocabulary import TemplateVocabulary
+from whatthelog.prefixtree.trace_deduplicator import TraceDeduplicator
 from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
-from whatthelog.exceptions import UnidentifiedLogException
+from whatthelog.exceptions import InvalidTreeException, UnidentifiedLogException
 from whatthelog.syntaxtree.syntax_tree import SyntaxTree
 from whatthelog.auto_printer import AutoPrinter
 
@@ -31,6 +40,24 @@ from whatthelog.auto_printer import AutoPrinter
 
 def print(msg): AutoPrinter.static_print(msg)
 
+# Syntax tree and options of the current worker process, set once by the pool initializer
+worker_tree: Union[SyntaxTree, None] = None
+worker_remove_trivial_loops: bool = False
+
+
+def init_worker(tree: SyntaxTree, remove_trivial_loops: bool) -> None:
+    global worker_tree, worker_remove_trivial_loops
+    worker_tree = tree
+    worker_remove_trivial_loops = remove_trivial_loops
+
+
+def parse_shard_worker(filepaths: List[str]) -> Tuple[PrefixTree, TraceDeduplicator]:
+    deduplicator = TraceDeduplicator()
+    tree = PrefixTreeFactory.parse_traces(filepaths, worker_tree, worker_remove_trivial_loops,
+                                          deduplicator=deduplicator)
+    return tree, deduplicator
+
+
 # ****************************************************************************************************
 # Prefix Tree Factory
 # ****************************************************************************************************
@@ -42,7 +69,8 @@ class PrefixTreeFactory(AutoPrinter):
     """
 
     @staticmethod
-    def get_prefix_tree(traces_dir: str, config_file_path: str, remove_trivial_loops: bool = False) -> PrefixTree:
+    def get_prefix_tree(traces_dir: str, config_file_path: str, remove_trivial_loops: bool = False,
+                        processes: int = 1, cache_dir: str = None) -> PrefixTree:
         """
         Parses a full tree from a set of log traces in a common directory,
         using a user-supplied syntax tree from an input configuration file.
@@ -50,10 +78,200 @@ class PrefixTreeFactory(AutoPrinter):
         :param traces_dir: the directory containing the log files to be parsed
         :param config_file_path: the configuration file describing the syntax tree
         :param remove_trivial_loops: Indicates whether trivial loops (subsequent states) should be merged.
+        :param processes: the number of processes parsing the traces, each one building the tree of a shard
+                          of the traces, which are then merged
+        :param cache_dir: the directory holding cached syntax trees, or None to disable caching
         :return: the full prefix tree
         """
 
-        return PrefixTreeFactory.__generate_prefix_tree(traces_dir, config_file_path, remove_trivial_loops)
+        return PrefixTreeFactory.__generate_prefix_tree(traces_dir, config_file_path, remove_trivial_loops, processes,
+                                                        cache_dir)
+
+    @staticmethod
+    def parse_traces(filepaths: List[str], syntax_tree: SyntaxTree, remove_trivial_loops: bool = False,
+                     progress: bool = False, deduplicator: TraceDeduplicator = None) -> PrefixTree:
+        """
+        Parses a prefix tree from a list of log traces.
+        Traces with the same template sequence are only inserted once,
+        the number of traces ending at each state being the weight of its edge to the terminal node.
+        :param filepaths: the paths to the trace files
+        :param syntax_tree: The syntax tree used to get the log template from the log
+        :param remove_trivial_loops: Indicates whether trivial loops (subsequent states) should be merged.
+        :param progress: whether to show a progress bar
+        :param deduplicator: the deduplicator counting the template sequences of the traces, if any
+        :return: the prefix tree
+        """
+
+        prefix_tree = PrefixTree(State([""]), State(["end"], is_terminal=True))
+        if deduplicator is None:
+            deduplicator = TraceDeduplicator()
+        # Last state of each distinct template sequence inserted so far
+        ends: Dict[bytes, State] = {}
+
+        for filepath in tqdm(filepaths, file=sys.stdout, leave=False, disable=not progress):
+            templates = list(PrefixTreeFactory.__get_templates(filepath, syntax_tree))
+            # Syntax tree template ids are hashed, as they are the same in every process
+            key = deduplicator.add([syntax_tree.get_template_id(template) for template in templates])
+
+            end = ends.get(key)
+            if end is None:
+                ends[key] = PrefixTreeFactory.__parse_trace(templates, prefix_tree, remove_trivial_loops)
+            else:
+                prefix_tree.add_trace_end(end)
+
+        return prefix_tree
+
+    @staticmethod
+    def get_radix_prefix_tree(traces_dir: str, config_file_path: str,
+                              remove_trivial_loops: bool = False, cache_dir: str = None) -> RadixPrefixTree:
+        """
+        Parses a path-compressed tree from a set of log traces in a common directory,
+        using a user-supplied syntax tree from an input configuration file.
+        The tree expands to the same tree as get_prefix_tree, including the number of traces ending at each state.
+        :param traces_dir: the directory containing the log files to be parsed
+        :param config_file_path: the configuration file describing the syntax tree
+        :param remove_trivial_loops: Indicates whether trivial loops (subsequent states) should be merged.
+        :param cache_dir: the directory holding cached syntax trees, or None to disable caching
+        :return: the radix prefix tree
+        """
+
+        if not os.path.isdir(traces_dir):
+            raise NotADirectoryError("Log directory not found!")
+        if not os.path.isfile(config_file_path):
+            raise FileNotFoundError("Config file not found!")
+
+        syntax_tree = SyntaxTreeFactory(cache_dir).parse_file(config_file_path)
+        filepaths = [str(Path(traces_dir).joinpath(filename)).strip() for filename in os.listdir(traces_dir)]
+
+        radix_tree = RadixPrefixTree("", "end")
+        for filepath in tqdm(filepaths, file=sys.stdout, leave=False):
+            radix_tree.add_trace(PrefixTreeFactory.__get_templates(filepath, syntax_tree), remove_trivial_loops)
+
+        return radix_tree
+
+    @staticmethod
+    def update_prefix_tree(tree_file: str, traces_dir: str, config_file_path: str,
+                           remove_trivial_loops: bool = False, processes: int = 1,
+                           manifest_file: str = None, cache_dir: str = None,
+                           settle_time: float = 60.0) -> PrefixTree:
+        """
+        Updates a pickled prefix tree with the log traces of a directory that were not inserted yet,
+        and persists the updated tree.
+        The trace files inserted into the tree are recorded with their size and modification time in a manifest,
+        so that each update only parses the new files.
+        Files modified less than settle_time seconds ago may still be written, e.g. a live log,
+        so they are left for a later update rather than inserted as a truncated trace.
+        As a trace cannot be removed from a tree, the tree is rebuilt from all the traces of the directory
+        if an inserted file was rewritten since, once it settled.
+        The manifest also records the hash of the configuration file, and updating a tree with
+        a different configuration fails, as well as the digest of the tree file, so that a tree
+        that does not match its manifest, e.g. after an interrupted update, is rebuilt.
+        If the tree file does not exist, the tree is built from all the traces.
+        :param tree_file: the pickle file of the tree, overwritten by the updated tree
+        :param traces_dir: the directory containing the log files to be parsed
+        :param config_file_path: the configuration file describing the syntax tree
+        :param remove_trivial_loops: Indicates whether trivial loops (subsequent states) should be merged.
+                                     Must be the same for every update of a tree.
+        :param processes: the number of processes parsing the new traces
+        :param manifest_file: the JSON file recording the inserted trace files,
+                              defaults to the tree file with a '.manifest.json' suffix
+        :param cache_dir: the directory holding cached syntax trees, or None to disable caching
+        :param settle_time: the time in seconds since the last modification of a file before it is inserted
+        :return: the updated prefix tree
+        """
+
+        if not os.path.isdir(traces_dir):
+            raise NotADirectoryError("Log directory not found!")
+        if not os.path.isfile(config_file_path):
+            raise FileNotFoundError("Config file not found!")
+        if manifest_file is None:
+            manifest_file = str(tree_file) + ".manifest.json"
+
+        config_hash = PrefixTreeFactory.__file_digest(config_file_path)
+
+        prefix_tree = None
+        inserted: Dict[str, List[int]] = {}
+        if os.path.isfile(tree_file):
+            if not os.path.isfile(manifest_file):
+                raise FileNotFoundError("Manifest file not found!")
+
+            with open(manifest_file, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get("config") != config_hash:
+                raise InvalidTreeException("Update failed: tree was built with a different configuration file!")
+            if manifest["remove_trivial_loops"] != remove_trivial_loops:
+                raise InvalidTreeException("Update failed: tree was built with remove_trivial_loops="
+                                           f"{manifest['remove_trivial_loops']}!")
+
+            if manifest.get("tree", None) not in (None, PrefixTreeFactory.__file_digest(tree_file)):
+                print("Tree file does not match its manifest, rebuilding the tree...")
+            else:
+                inserted = manifest["files"]
+                prefix_tree = PrefixTreeFactory.unpickle_tree(tree_file)
+
+        # Size and modification time of each trace file, keyed on its absolute path
+        files: Dict[str, List[int]] = {}
+        for filename in os.listdir(traces_dir):
+            filepath = os.path.abspath(Path(traces_dir).joinpath(filename))
+            stat = os.stat(filepath)
+            files[filepath] = [stat.st_size, stat.st_mtime_ns]
+
+        # Files modified recently are left for a later update, whether new or rewritten
+        settled_before = time.time_ns() - int(settle_time * 1e9)
+        new_filepaths = [filepath for filepath, signature in files.items()
+                         if inserted.get(filepath) != signature and signature[1] <= settled_before]
+        deferred = sum(1 for filepath, signature in files.items()
+                       if inserted.get(filepath) != signature and signature[1] > settled_before)
+        if deferred > 0:
+            print(f"{deferred} trace files are still being written, deferring them.")
+
+        changed = sum(1 for filepath in new_filepaths if filepath in inserted)
+        if changed > 0:
+            print(f"{changed} trace files were rewritten since they were inserted, rebuilding the tree...")
+            prefix_tree = None
+            # Deferred files are not inserted into the rebuilt tree, not even in their former version
+            new_filepaths = [filepath for filepath, signature in files.items() if signature[1] <= settled_before]
+        else:
+            print(f"{len(new_filepaths)} new trace files.")
+            if len(new_filepaths) == 0 and prefix_tree is not None:
+                return prefix_tree
+
+        syntax_tree = SyntaxTreeFactory(cache_dir).parse_file(config_file_path)
+        new_tree = PrefixTreeFactory.__parse_files(new_filepaths, syntax_tree, remove_trivial_loops, processes)
+
+        if prefix_tree is None:
+            prefix_tree = new_tree
+            inserted = {}
+        else:
+            print("Merging new traces...")
+            prefix_tree.merge(new_tree)
+
+        # Both files are written aside and the manifest replaced first, along with the digest of the tree,
+        # so that an update interrupted before the tree is replaced is detected by the next one
+        inserted.update((filepath, files[filepath]) for filepath in new_filepaths)
+        PrefixTreeFactory.pickle_tree(prefix_tree, str(tree_file) + ".tmp")
+        manifest = {"config": config_hash, "remove_trivial_loops": remove_trivial_loops,
+                    "tree": PrefixTreeFactory.__file_digest(str(tree_file) + ".tmp"), "files": inserted}
+        with open(str(manifest_file) + ".tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(str(manifest_file) + ".tmp", manifest_file)
+        os.replace(str(tree_file) + ".tmp", tree_file)
+
+        return prefix_tree
+
+    @staticmethod
+    def __file_digest(filepath: str) -> str:
+        """
+        Computes the SHA-256 digest of the content of a file.
+        :param filepath: the path to the file
+        :return: the hexadecimal digest
+        """
+
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
 
     @staticmethod
     def pickle_tree(tree: PrefixTree, file: str) -> None:
@@ -84,13 +302,16 @@ class PrefixTreeFactory(AutoPrinter):
         return tree
 
     @staticmethod
-    def __generate_prefix_tree(log_dir: str, config_file: str, remove_trivial_loops: bool) -> PrefixTree:
+    def __generate_prefix_tree(log_dir: str, config_file: str, remove_trivial_loops: bool,
+                               processes: int, cache_dir: Union[str, None]) -> PrefixTree:
         """
         Script to parse log file into prefix tree.
 
         :param log_dir: Path to directory containing traces.
         :param config_file: Path to configuration file for syntax tree
         :param remove_trivial_loops: Indicates whether trivial loops (subsequent states) should be merged.
+        :param processes: the number of processes parsing the traces.
+        :param cache_dir: the directory holding cached syntax trees, or None to disable caching.
         :return: Prefix tree along with a dictionary mapping log templates
          to unique ids.
         """
@@ -102,70 +323,99 @@ class PrefixTreeFactory(AutoPrinter):
 
         print("Parsing syntax tree...")
 
-        syntax_tree = SyntaxTreeFactory().parse_file(config_file)
-        prefix_tree = PrefixTree(State([""]), State(["end"], is_terminal=True))
+        syntax_tree = SyntaxTreeFactory(cache_dir).parse_file(config_file)
+        filepaths = [str(Path(log_dir).joinpath(filename)).strip() for filename in os.listdir(log_dir)]
+
+        return PrefixTreeFactory.__parse_files(filepaths, syntax_tree, remove_trivial_loops, processes)
+
+    @staticmethod
+    def __parse_files(filepaths: List[str], syntax_tree: SyntaxTree, remove_trivial_loops: bool,
+                      processes: int) -> PrefixTree:
+        """
+        Parses a prefix tree from a list of log traces, sharding them over several processes if requested.
+
+        :param filepaths: the paths to the trace files
+        :param syntax_tree: The syntax tree used to get the log template from the log
+        :param remove_trivial_loops: Indicates whether trivial loops (subsequent states) should be merged.
+        :param processes: the number of processes parsing the traces.
+        :return: the prefix tree
+        """
 
         print("Parsing traces...")
 
-        pbar = tqdm(os.listdir(log_dir), file=sys.stdout, leave=False)
-        for filename in pbar:
-            filepath = str(Path(log_dir).joinpath(filename)).strip()
-            PrefixTreeFactory.__parse_trace(filepath, syntax_tree, prefix_tree, remove_trivial_loops)
+        deduplicator = TraceDeduplicator()
+
+        if processes <= 1 or len(filepaths) <= 1:
+            prefix_tree = PrefixTreeFactory.parse_traces(filepaths, syntax_tree, remove_trivial_loops,
+                                                         progress=True, deduplicator=deduplicator)
+            print(deduplicator.report())
+            return prefix_tree
+
+        # Contiguous shards, so that the merged tree lists children in the same order as a sequential parse
+        shard_size = -(-len(filepaths) // processes)
+        shards = [filepaths[i:i + shard_size] for i in range(0, len(filepaths), shard_size)]
+
+        with Pool(len(shards), initializer=init_worker, initargs=(syntax_tree, remove_trivial_loops)) as pool:
+            results = pool.imap(parse_shard_worker, shards)
+            prefix_tree, shard_deduplicator = next(results)
+            deduplicator.update(shard_deduplicator)
 
+            print("Merging shards...")
+            for tree, shard_deduplicator in tqdm(results, total=len(shards) - 1, file=sys.stdout, leave=False):
+                prefix_tree.merge(tree)
+                deduplicator.update(shard_deduplicator)
+
+        print(deduplicator.report())
         return prefix_tree
 
     @staticmethod
-    def __parse_trace(tracepath: str,
-                      syntax_tree: SyntaxTree,
+    def __parse_trace(templates: List[str],
                       prefix_tree: PrefixTree,
-                      remove_trivial_loops: bool) -> PrefixTree:
+                      remove_trivial_loops: bool) -> State:
         """
-        Function that parses a trace file and modifies the given
-        prefix tree to include it.
+        Function that inserts the templates of a trace into the given prefix tree.
 
-        :param tracepath: The path to the trace file to parse
-        :param syntax_tree: The syntax tree used to get the log template from the log
+        :param templates: The names of the templates of the trace
         :param prefix_tree: The current prefix tree to be used
         :param remove_trivial_loops: Indicates whether trivial loops (subsequent states) should be merged.
-        :return: PrefixTree
+        :return: The last state of the trace
         """
 
         parent = prefix_tree.get_root()
-        nodes = prefix_tree.get_children(parent)
-
-        with open(tracepath, 'r') as file:
-            for log in file:
-
-                tree = syntax_tree.search(log)
-                if tree is None:
-                    raise UnidentifiedLogException(
-                        log + " was not identified as a valid log.")
-                template = tree.name
-
-                exists = False
-
-                if remove_trivial_loops and parent.properties.log_templates[0] == template:
-                    # There will only be 1 template per state initially
-                    if parent not in nodes:
-                        prefix_tree.add_edge(parent, parent, EdgeProperties([]))
-                else:
-                    for node in nodes:
-                        if template in node.properties.log_templates:
-                            parent = node
-                            nodes = prefix_tree.get_children(parent)
-                            exists = True
-                            break
-
-                    if not exists:
-                        child = State([template])
-                        prefix_tree.add_child(child, parent)
-
-                        parent = child
-                        nodes = prefix_tree.get_children(parent)
-
-        if remove_trivial_loops:
-            for n in nodes:
-                if n.properties.log_templates[0] == 'terminal':
-                    return prefix_tree
-        prefix_tree.add_edge(parent, prefix_tree.get_terminal(), EdgeProperties())
-        return prefix_tree
+
+        for template in templates:
+
+            template_id = TemplateVocabulary.get_id(template)
+
+            if remove_trivial_loops and parent.properties.template_ids[0] == template_id:
+                # There will only be 1 template per state initially
+                prefix_tree.add_edge(parent, parent, EdgeProperties([]))
+            else:
+                child = prefix_tree.get_child(parent, template_id)
+
+                if child is None:
+                    child = State([template])
+                    prefix_tree.add_child(child, parent)
+
+                parent = child
+
+        prefix_tree.add_trace_end(parent)
+        return parent
+
+    @staticmethod
+    def __get_templates(tracepath: str, syntax_tree: SyntaxTree) -> Iterator[str]:
+        """
+        Lazily retrieves the template of each log in a trace file.
+
+        :param tracepath: The path to the trace file to parse
+        :param syntax_tree: The syntax tree used to get the log template from the log
+        :return: An iterator over the names of the templates
+        """
+
+        for log in LogReader(tracepath):
+
+            tree = syntax_tree.search(log)
+            if tree is None:
+                raise UnidentifiedLogException(
+                    log + " was not identified as a valid log.")
+            yield tree.name
@@ -0,0 +1,296 @@
+# ****************************************************************************************************
+# Imports
+# ****************************************************************************************************
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from __future__ import annotations
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Set, Union
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Internal
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from whatthelog.prefixtree.prefix_tree import PrefixTree
+from whatthelog.prefixtree.state import State
+from whatthelog.prefixtree.template_vocabulary import TemplateVocabulary
+
+
+# ****************************************************************************************************
+# Radix Node
+# ****************************************************************************************************
+
+class RadixNode:
+    """
+    Node of a radix prefix tree, standing for a chain of states without branches.
+    The templates of the chain are packed into an array of template ids,
+    and only the last state of the chain can have several children or end a trace.
+    """
+
+    __slots__ = ['templates', 'loops', 'children', 'parent', 'trace_count']
+
+    def __init__(self, templates: Iterable[int], parent: Union[RadixNode, None] = None):
+        """
+        Radix node constructor.
+        :param templates: the template ids of the states of the chain
+        :param parent: the parent node, None for the root
+        """
+
+        self.templates = array('i', templates)
+        # Positions in the chain of the states having a self loop, None if there are none
+        self.loops: Union[Set[int], None] = None
+        # Children by the template id of their first state
+        self.children: Dict[int, RadixNode] = {}
+        self.parent = parent
+        # Number of traces ending at the last state of the chain
+        self.trace_count = 0
+
+    @property
+    def is_final(self) -> bool:
+        """
+        Checks if a trace ends at the last state of the chain.
+        """
+        return self.trace_count > 0
+
+    def get_log_templates(self) -> List[str]:
+        """
+        Retrieves the names of the templates of the chain.
+        """
+        return [TemplateVocabulary.get_name(template_id) for template_id in self.templates]
+
+    def has_loop(self, position: int) -> bool:
+        """
+        Checks if the state at a position in the chain has a self loop.
+        """
+        return self.loops is not None and position in self.loops
+
+    def __len__(self):
+        return len(self.templates)
+
+    def __str__(self):
+        return str(self.get_log_templates())
+
+    def __repr__(self):
+        return self.__str__()
+
+
+# ****************************************************************************************************
+# Radix Prefix Tree
+# ****************************************************************************************************
+
+class RadixPrefixTree:
+    """
+    Path-compressed variant of the prefix tree, for traces sharing long prefixes before diverging into long tails.
+    Chains of states without branches are stored as a single RadixNode rather than a State per log line,
+    and are split lazily when a trace diverges or ends in the middle of a chain.
+    Trace ends are counts on the nodes rather than weighted edges to a terminal state,
+    so children never include a terminal node.
+
+    The tree offers the traversal methods of PrefixTree, so that a TreeIterator walks its nodes,
+    and is expanded to a PrefixTree on demand.
+    """
+
+    def __init__(self, root_template: str = "", terminal_template: str = "end"):
+        """
+        Radix prefix tree constructor.
+        :param root_template: the template of the root state
+        :param terminal_template: the template of the terminal state of the expanded tree
+        """
+
+        self.root = RadixNode([TemplateVocabulary.get_id(root_template)])
+        self.terminal_template = terminal_template
+
+    def get_root(self) -> RadixNode:
+        """
+        Root getter.
+
+        :return: the root of the tree
+        """
+        return self.root
+
+    def get_children(self, node: RadixNode) -> List[RadixNode]:
+        """
+        Method to get the children of a node, in order of insertion.
+
+        :param node: Node to get children of
+        :return: List of children. If empty this node is a leaf.
+        """
+        return list(node.children.values())
+
+    def get_parent(self, node: RadixNode) -> Union[RadixNode, None]:
+        """
+        Method to get the parent of a node.
+
+        :param node: Node to get parent of
+        :return: Parent of node. If None node is the root.
+        """
+        return node.parent
+
+    def add_trace(self, templates: Iterable[str], remove_trivial_loops: bool = False) -> None:
+        """
+        Adds the templates of a trace to the tree.
+
+        :param templates: the names of the templates of the trace
+        :param remove_trivial_loops: whether repeated templates are merged into a self loop
+        """
+        self.add_template_ids((TemplateVocabulary.get_id(template) for template in templates), remove_trivial_loops)
+
+    def add_template_ids(self, template_ids: Iterable[int], remove_trivial_loops: bool = False) -> None:
+        """
+        Adds the template ids of a trace to the tree.
+
+        :param template_ids: the interned ids of the templates of the trace
+        :param remove_trivial_loops: whether repeated templates are merged into a self loop
+        """
+
+        # The current state is at a position in the chain of a node
+        node, position = self.root, 0
+
+        for template_id in template_ids:
+
+            if remove_trivial_loops and node.templates[position] == template_id:
+                if node.loops is None:
+                    node.loops = set()
+                node.loops.add(position)
+                continue
+
+            if position + 1 < len(node.templates):
+                if node.templates[position + 1] == template_id:
+                    position += 1
+                    continue
+                # The trace diverges in the middle of the chain
+                self.__split(node, position + 1)
+
+            if not node.children and not node.is_final and node is not self.root:
+                # Only the chain being added has neither children nor a trace end, so it is extended in place
+                node.templates.append(template_id)
+                position += 1
+                continue
+
+            child = node.children.get(template_id)
+            if child is None:
+                child = RadixNode([template_id], node)
+                node.children[template_id] = child
+            node, position = child, 0
+
+        if position + 1 < len(node.templates):
+            # The trace ends in the middle of the chain
+            self.__split(node, position + 1)
+        node.trace_count += 1
+
+    @staticmethod
+    def __split(node: RadixNode, position: int) -> None:
+        """
+        Splits the chain of a node, moving the states from the given position onwards to a new child.
+        :param node: the node to split
+        :param position: the position of the first state of the new child
+        """
+
+        tail = RadixNode(node.templates[position:], node)
+        tail.children = node.children
+        tail.trace_count = node.trace_count
+        for child in tail.children.values():
+            child.parent = tail
+
+        if node.loops is not None:
+            tail_loops = {loop - position for loop in node.loops if loop >= position}
+            tail.loops = tail_loops if tail_loops else None
+            head_loops = {loop for loop in node.loops if loop < position}
+            node.loops = head_loops if head_loops else None
+
+        del node.templates[position:]
+        node.children = {tail.templates[0]: tail}
+        node.trace_count = 0
+
+    def size(self) -> int:
+        """
+        Retrieves the number of nodes of the tree.
+        """
+        return sum(1 for _ in self.__nodes())
+
+    def expanded_size(self) -> int:
+        """
+        Retrieves the number of states of the expanded tree, including its terminal state.
+        """
+        return sum(len(node.templates) for node in self.__nodes()) + 1
+
+    def expand(self) -> PrefixTree:
+        """
+        Expands the tree to the classic form, with a state per position in each chain.
+
+        :return: the equivalent prefix tree
+        """
+
+        tree = PrefixTree(State(self.root.get_log_templates()), State([self.terminal_template], is_terminal=True))
+
+        queue = deque([(self.root, None)])
+        while queue:
+
+            node, parent = queue.popleft()
+
+            for position, template in enumerate(node.get_log_templates()):
+                if parent is None:
+                    state = tree.get_root()
+                else:
+                    state = State([template])
+                    tree.add_child(state, parent)
+
+                if node.has_loop(position):
+                    tree.add_edge(state, state)
+                parent = state
+
+            if node.is_final:
+                tree.add_trace_end(parent, node.trace_count)
+
+            for child in node.children.values():
+                queue.append((child, parent))
+
+        return tree
+
+    def __nodes(self) -> Iterable[RadixNode]:
+        """
+        Iterates over the nodes of the tree, depth first.
+        """
+
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.children.values())
+
+    def __getstate__(self):
+        # Template ids are only valid within a process, so templates are pickled by name,
+        # and the nodes are flattened in breadth-first order with the position of their parent
+        nodes = []
+        positions: Dict[int, int] = {}
+        queue = deque([self.root])
+        while queue:
+            node = queue.popleft()
+            positions[id(node)] = len(nodes)
+            nodes.append((positions[id(node.parent)] if node.parent is not None else -1,
+                          node.get_log_templates(),
+                          sorted(node.loops) if node.loops is not None else None,
+                          node.trace_count))
+            queue.extend(node.children.values())
+
+        return self.terminal_template, nodes
+
+    def __setstate__(self, state):
+        self.terminal_template, nodes = state
+
+        radix_nodes: List[RadixNode] = []
+        for parent_position, templates, loops, trace_count in nodes:
+            parent = radix_nodes[parent_position] if parent_position >= 0 else None
+            node = RadixNode((TemplateVocabulary.get_id(template) for template in templates), parent)
+            node.loops = set(loops) if loops is not None else None
+            # Trees pickled before trace counts were kept store whether a trace ends at the node
+            node.trace_count = int(trace_count)
+            if parent is not None:
+                parent.children[node.templates[0]] = node
+            radix_nodes.append(node)
+
+        self.root = radix_nodes[0]
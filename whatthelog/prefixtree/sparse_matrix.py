@@ -1,32 +1,59 @@
-import bisect
-from whatthelog.exceptions import StateDoesNotExistException
-from typing import Union, Tuple, Any, List
+from typing import Tuple, Any, List, Dict, Set, Union
 
 
 class SparseMatrix:
     """
     As we had no efficient way to store the edges, we implemented our own approach to achieve this.
+    Edges are stored as a dictionary of dictionaries mapping a start index to its end indices,
+    each holding the id of the edge value in a side table, so that equal values are stored only once.
+    A reverse index from end index to start indices is kept up to date on every change,
+    so that parents can be retrieved in O(in-degree).
     """
 
     separator = '.'
 
     def __init__(self):
-        # The list in which the sparse matrix is stored
-        self.list: List[str] = list()
+        # Outgoing edges, mapping a start index to a dictionary from end index to value id
+        self.rows: Dict[int, Dict[int, int]] = {}
+        # Incoming edges, mapping an end index to the set of its start indices
+        self.columns: Dict[int, Set[int]] = {}
+        # Side table of the distinct edge values, and their ids
+        self.values: List[str] = []
+        self.value_ids: Dict[str, int] = {}
+
+    @property
+    def list(self) -> List[str]:
+        """
+        Legacy view of the matrix, as a sorted list of entries in the form 'start.end.value'.
+        """
+        return sorted(str(start) + self.separator + str(end) + self.separator + self.values[value]
+                      for start, row in self.rows.items()
+                      for end, value in row.items())
 
     def __setitem__(self, key: Tuple[int, int], value: Any) -> None:
         """
-        Set item in SparseMatrix using insertion sort.
+        Set item in SparseMatrix.
         """
-        index = self.find_index(key)
-        if index is None:
-            bisect.insort_right(self.list, str(key[0]) + self.separator + str(key[1]) + self.separator + str(value))
-        else:
-            self.list[index] = str(key[0]) + self.separator + str(key[1]) + self.separator + str(value)
+        value = str(value)
+        value_id = self.value_ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.value_ids[value] = value_id
+            self.values.append(value)
+
+        row = self.rows.get(key[0])
+        if row is None:
+            row = self.rows[key[0]] = {}
+        row[key[1]] = value_id
+
+        column = self.columns.get(key[1])
+        if column is None:
+            column = self.columns[key[1]] = set()
+        column.add(key[0])
 
     def __getitem__(self, key: Tuple[int, int]) -> str:
         """
-        Get item from SparseMatrix using binary search.
+        Get item from SparseMatrix.
         """
         value: str = self.find_edge(key)
         if value is None:
@@ -37,178 +64,110 @@ class SparseMatrix:
         """
         Checks if an edge exists.
         """
-        index: int = self.bisearch(self.list, str(item[0]) + self.separator + str(item[1]))
-        if index != len(self.list):
-            return True
-        return False
-
-    def __find_index(self, search_list: List[str], item: Tuple[int, int]) -> Union[int, None]:
-        """
-        Use binary search to search for a specific entry in the list of the SparseMatrix.
-        """
-        index: int = self.bisearch(search_list, str(item[0]) + self.separator + str(item[1]) + self.separator)
-        if index != len(self.list):
-            return index
-        else:
-            return None
-
-    def find_index(self, coordinates: Tuple[int, int]) -> Union[int, None]:
-        """
-        Use binary search to search for a specific entry in the given list.
-        Return the index of the entry in the entry list, or None if no entry found.
-        :param coordinates: the coordinates of the entry to find.
-        :return the index of the input entry, or None if no entry found.
-        """
-        return self.__find_index(self.list, coordinates)
+        row = self.rows.get(item[0])
+        return row is not None and item[1] in row
 
     def find_edge(self, coordinates: Tuple[int, int]) -> Union[str, None]:
         """
-        Use binary search to search for a specific entry value in the given list.
+        Search for a specific entry value.
         Return the value of the entry, or None if no entry found.
         :param coordinates: the coordinates of the entry to find.
         :return the value of the input entry, or None if no entry found.
         """
-        return self.get_values(self.find_index(coordinates))[2]
-
-    def __find_children(self, search_list: List[str], item: int, new_parent: int = -1) -> Union[
-        List[Tuple[int, str]], None]:
-        """
-        Use binary search to search for all children of the given entry in an input list.
-        Return a list of tuples in the form (child_number, value), or None if no child found.
-        :param search_list: the list of entries to search for matches.
-        :param item: the item to match on.
-        :return a list of tuples (child_number, value), or None if no child found.
-        """
-        index: int = self.bisearch(search_list, str(item) + self.separator)
-        to_delete = []
-        to_change = []
-
-        if index != len(search_list):
-            current = self.get_values(search_list, index)
-
-            if new_parent >= 0:
-                if (new_parent, current[1]) in self:
-                    to_delete.append(index)
-                else:
-                    # search_list[index] = str(new_parent) + self.separator + str(current[1]) + self.separator + current[2]
-                    to_change.append((index, str(new_parent) + self.separator + str(current[1]) + self.separator + current[2]))
-
-            result = [(current[1], current[2])]
-            idx = index - 1
-            while idx >= 0 and search_list[idx].startswith(str(item) + self.separator):
-                current = self.get_values(search_list, idx)
-                if new_parent >= 0:
-                    if (new_parent, current[1]) in self:
-                        to_delete.append(idx)
-                    else:
-                        to_change.append((idx, str(new_parent) + self.separator + str(current[1]) + self.separator + current[2]))
-                        # search_list[idx] = str(new_parent) + self.separator + str(current[1]) + self.separator + current[
-                        # 2]
-                result.append((current[1], current[2]))
-                idx -= 1
-            idx = index + 1
-            while idx < len(search_list) and search_list[idx].startswith(str(item) + self.separator):
-                current = self.get_values(search_list, idx)
-                if new_parent >= 0:
-                    if (new_parent, current[1]) in self:
-                        to_delete.append(idx)
-                    else:
-                        # search_list[idx] = str(new_parent) + self.separator + str(current[1]) + self.separator + current[2]
-                        to_change.append((idx, str(new_parent) + self.separator + str(current[1]) + self.separator + current[2]))
-                result.append((current[1], current[2]))
-                idx += 1
-
-            for i, new_v in to_change:
-                search_list[i] = new_v
-
-            to_delete.sort(reverse=True)
-            for i in to_delete:
-                del search_list[i]
-
-            return result
-        else:
+        row = self.rows.get(coordinates[0])
+        if row is None or coordinates[1] not in row:
             return None
+        return self.values[row[coordinates[1]]]
 
     def find_children(self, item: int) -> Union[List[Tuple[int, str]], None]:
         """
-        Use binary search to search for all children of the given entry in the main list.
+        Search for all children of the given entry, ordered by child number.
         Return a list of tuples in the form (child_number, value), or None if no child found.
         :param item: the item to match on.
         :return a list of tuples (child_number, value), or None if no child found.
         """
-        return self.__find_children(self.list, item)
-
-    @staticmethod
-    def bisearch(arr: List[str], target: str) -> int:
-        """
-        Perform a binary search on the prefix (of unspecified length) of the elements
-        """
-        low: int = 0
-        high: int = len(arr) - 1
-        while high >= low:
-            ix = (low + high) // 2
-            if arr[ix].startswith(target):  # todo make this more efficient maybe?
-                return ix
-            elif target < arr[ix]:
-                high = ix - 1
-            else:
-                low = ix + 1
-        return len(arr)
-
-    @staticmethod
-    def get_values(array: List[str], index: int) -> Tuple[int, int, str]:
-        """
-        Retrieves the tuple of coordinates and value for the given index.
-        Raises an exception if the index is out of bounds.
-        :param array: The sparse matrix list
-        :param index: the index of the tuple to fetch.
-        :return a tuple in the form(start_node, end_node, edge_value)
-        """
-        if index < 0 or index >= len(array):
-            raise IndexError
-
-        value: str = array[index]
-        strings = value.split('.', 2)
-        return int(strings[0]), int(strings[1]), strings[2]
+        row = self.rows.get(item)
+        if not row:
+            return None
+        values = self.values
+        return [(child, values[value]) for child, value in sorted(row.items())]
 
-    def __get_parents(self, i: int, new_child: int=-1) -> List[int]:
+    def get_parents(self, i: int) -> List[int]:
         """
-        Return all the entries which are linked to the input entry.
+        Return all the entries which are linked to the input entry, in ascending order.
         :param i: the input entry
         :return: the list of parent entries
         """
-
-        result: List[int] = []
-        to_delete: List[int] = []
-        for index, item in enumerate(self.list):
-            keys = item.split('.', 2)
-
-            if int(keys[1]) == i:
-                if new_child >= 0:
-                    if (int(keys[0]), new_child) in self:
-                        to_delete.append(index)
-                    else:
-                        self.list[index] = keys[0] + self.separator + str(new_child) + self.separator + keys[2]
-                result.append(int(keys[0]))
-
-        for i in reversed(to_delete):
-            del self.list[i]
-
-        return result
-
-    def get_parents(self, i: int):
-        return self.__get_parents(i)
+        column = self.columns.get(i)
+        return sorted(column) if column else []
 
     def change_children_of_parents(self, i: int, new_child: int):
-        self.__get_parents(i, new_child)
-        self.list.sort()
+        """
+        Redirects all the edges ending in an entry to a new entry.
+        Edges that would duplicate an existing edge are removed.
+        :param i: the current end entry of the edges
+        :param new_child: the new end entry of the edges
+        """
+        column = self.columns.pop(i, None)
+        if not column:
+            return
+
+        new_column = self.columns.get(new_child)
+        if new_column is None:
+            new_column = self.columns[new_child] = set()
+        for start in column:
+            row = self.rows[start]
+            value = row.pop(i)
+            if new_child not in row:
+                row[new_child] = value
+                new_column.add(start)
 
     def change_parent_of_children(self, new_parent: int, parent_old: int):
-        self.__find_children(self.list, parent_old, new_parent)
-        self.list.sort()
+        """
+        Moves all the edges starting in an entry to a new entry.
+        Edges that would duplicate an existing edge are removed.
+        :param new_parent: the new start entry of the edges
+        :param parent_old: the current start entry of the edges
+        """
+        old_row = self.rows.pop(parent_old, None)
+        if not old_row:
+            return
+
+        new_row = self.rows.get(new_parent)
+        if new_row is None:
+            new_row = self.rows[new_parent] = {}
+        for child, value in old_row.items():
+            column = self.columns[child]
+            column.discard(parent_old)
+            if child not in new_row:
+                new_row[child] = value
+                column.add(new_parent)
+
+    def redirect(self, redirects: Dict[int, int]) -> None:
+        """
+        Redirects all the edges of many entries to new entries in a single pass,
+        both the edges starting and the edges ending in each entry.
+        Edges that would duplicate an existing edge are removed.
+        :param redirects: a dictionary from current entry to new entry,
+                          new entries must not be redirected themselves.
+        """
+        for old, new in redirects.items():
+            self.change_parent_of_children(new, old)
+            self.change_children_of_parents(old, new)
+
+    def __setstate__(self, state):
+        if 'list' not in state:
+            self.__dict__.update(state)
+            return
+
+        # Pickled by the former implementation, as a sorted list of entries in the form 'start.end.value'
+        self.__init__()
+        for entry in state['list']:
+            start, end, value = entry.split(self.separator, 2)
+            self[int(start), int(end)] = value
 
     def __len__(self):
-        return len(self.list)
+        return sum(len(row) for row in self.rows.values())
 
     def __str__(self):
         return str(self.list)
@@ -52,8 +52,7 @@ class State:
         """
         Checks if two states have any templates in common.
         """
-        other_templates: List[str] = other.get_properties().log_templates
-        return any(map(lambda template: template in other_templates, self.get_properties().log_templates))
+        return not self.get_properties().template_set.isdisjoint(other.get_properties().template_set)
 
     def get_properties(self):
         return self.properties
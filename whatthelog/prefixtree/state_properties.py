@@ -13,42 +13,97 @@ Email: tommaso.brandirali@gmail.com
 # External
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
-from dataclasses import dataclass
-from typing import List
+from __future__ import annotations
+from typing import FrozenSet, Iterable, List, Tuple
 
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 # Internal
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
 from whatthelog.auto_printer import AutoPrinter
+from whatthelog.prefixtree.template_vocabulary import TemplateVocabulary
 
 
 #****************************************************************************************************
 # State Properties
 #****************************************************************************************************
 
-@dataclass
 class StateProperties(AutoPrinter):
     """
-    Data class holding the properties of a state node.
+    Class holding the properties of a state node.
     Multiple nodes can share the same properties, in that case they are considered 'equivalent.
+    Log templates are stored as ids interned in the global TemplateVocabulary,
+    both in insertion order and as a set for constant time membership checks.
     """
 
-    __slots__ = ['log_templates']
-
-    log_templates: List[str]
+    __slots__ = ['template_ids', 'template_set', '__hash']
+
+    def __init__(self, log_templates: List[str]):
+        """
+        State properties constructor.
+        :param log_templates: the names of the log templates
+        """
+        self.__set_ids(tuple(TemplateVocabulary.get_id(template) for template in log_templates))
+
+    @staticmethod
+    def from_ids(template_ids: Iterable[int]) -> StateProperties:
+        """
+        Builds state properties directly from interned template ids.
+        :param template_ids: the ids of the log templates
+        :return: the state properties instance
+        """
+
+        properties = StateProperties.__new__(StateProperties)
+        properties.__set_ids(tuple(template_ids))
+        return properties
+
+    def __set_ids(self, template_ids: Tuple[int, ...]) -> None:
+        self.template_ids: Tuple[int, ...] = template_ids
+        self.template_set: FrozenSet[int] = frozenset(template_ids)
+        self.__hash = hash(template_ids)
+
+    @property
+    def log_templates(self) -> List[str]:
+        """
+        Log template names getter.
+        """
+        return [TemplateVocabulary.get_name(template_id) for template_id in self.template_ids]
+
+    def has_template(self, template: str) -> bool:
+        """
+        Checks whether these properties hold a log template.
+        :param template: the name of the log template
+        """
+        return TemplateVocabulary.find_id(template) in self.template_set
+
+    def has_template_id(self, template_id: int) -> bool:
+        """
+        Checks whether these properties hold a log template.
+        :param template_id: the interned id of the log template
+        """
+        return template_id in self.template_set
 
     def get_prop_hash(self) -> int:
-        return hash(tuple(self.log_templates))
+        return self.__hash
 
     def __hash__(self):
-        return self.get_prop_hash()
+        return self.__hash
 
     def __eq__(self, other):
-        return set(self.log_templates) == set(other.log_templates)
+        return self.template_set == other.template_set
+
+    def __getstate__(self):
+        # Template ids are only valid within a process, so templates are pickled by name
+        return self.log_templates
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # Pickled by the former dataclass, as the slots state (None, {'log_templates': [...]})
+            state = state[1]['log_templates']
+        self.__set_ids(tuple(TemplateVocabulary.get_id(template) for template in state))
 
     def __len__(self):
-        return len(self.log_templates)
+        return len(self.template_ids)
 
     def __str__(self):
         return str(self.log_templates)
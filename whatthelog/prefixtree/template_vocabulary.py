@@ -0,0 +1,64 @@
+# ****************************************************************************************************
+# Imports
+# ****************************************************************************************************
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from typing import Dict, List
+
+
+# ****************************************************************************************************
+# Template Vocabulary
+# ****************************************************************************************************
+
+class TemplateVocabulary:
+    """
+    Global interning table mapping log template names to small integer ids.
+    Ids are assigned in order of first appearance and are only valid within the current process,
+    therefore anything that is pickled should store template names rather than ids.
+    """
+
+    __ids: Dict[str, int] = {}
+    __names: List[str] = []
+
+    @classmethod
+    def get_id(cls, name: str) -> int:
+        """
+        Retrieves the id of a template, assigning a new id if the template was never seen before.
+        :param name: the name of the template
+        :return: the id of the template
+        """
+
+        template_id = cls.__ids.get(name)
+        if template_id is None:
+            template_id = len(cls.__names)
+            cls.__ids[name] = template_id
+            cls.__names.append(name)
+        return template_id
+
+    @classmethod
+    def find_id(cls, name: str) -> int:
+        """
+        Retrieves the id of a template without assigning new ids.
+        :param name: the name of the template
+        :return: the id of the template, or -1 if the template was never seen before
+        """
+        return cls.__ids.get(name, -1)
+
+    @classmethod
+    def get_name(cls, template_id: int) -> str:
+        """
+        Retrieves the name of a template from its id.
+        :param template_id: the id of the template
+        :return: the name of the template
+        """
+        return cls.__names[template_id]
+
+    @classmethod
+    def size(cls) -> int:
+        """
+        Retrieves the number of templates interned so far.
+        """
+        return len(cls.__names)
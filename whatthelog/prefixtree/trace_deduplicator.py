@@ -0,0 +1,80 @@
+# ****************************************************************************************************
+# Imports
+# ****************************************************************************************************
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from __future__ import annotations
+from hashlib import blake2b
+from typing import Dict, Sequence
+
+import numpy as np
+
+
+# ****************************************************************************************************
+# Trace Deduplicator
+# ****************************************************************************************************
+
+class TraceDeduplicator:
+    """
+    Counter of the distinct template sequences among a set of traces.
+    Traces are identified by a 128-bit BLAKE2b digest of their template ids,
+    so that only the digest of each distinct trace is kept, along with the number of traces having it.
+    Template ids are hashed as given, so all traces must be encoded with the same vocabulary.
+    """
+
+    def __init__(self):
+        # Number of traces by digest, in order of first appearance
+        self.counts: Dict[bytes, int] = {}
+        self.traces = 0
+
+    @staticmethod
+    def digest(template_ids: Sequence[int]) -> bytes:
+        """
+        Hashes the template sequence of a trace.
+        :param template_ids: the template ids of the trace
+        :return: the 16 bytes digest of the trace
+        """
+        return blake2b(np.asarray(template_ids, dtype=np.int32).tobytes(), digest_size=16).digest()
+
+    def add(self, template_ids: Sequence[int]) -> bytes:
+        """
+        Counts a trace.
+        :param template_ids: the template ids of the trace
+        :return: the digest of the trace
+        """
+
+        key = self.digest(template_ids)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.traces += 1
+        return key
+
+    def update(self, other: TraceDeduplicator) -> None:
+        """
+        Adds the counts of another deduplicator, e.g. one of another process using the same vocabulary.
+        :param other: the deduplicator to add the counts of
+        """
+
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.traces += other.traces
+
+    def ratio(self) -> float:
+        """
+        Retrieves the average number of traces per distinct template sequence, 1 if no trace was counted.
+        """
+        return self.traces / len(self.counts) if self.counts else 1.0
+
+    def report(self) -> str:
+        """
+        Describes the deduplication of the counted traces.
+        """
+
+        redundant = 1 - len(self.counts) / self.traces if self.traces > 0 else 0.0
+        return f"{self.traces} traces, {len(self.counts)} distinct template sequences " \
+               f"(dedup ratio {self.ratio():.2f}, {redundant:.1%} redundant)"
+
+    def __len__(self):
+        return len(self.counts)
@@ -0,0 +1,122 @@
+# ****************************************************************************************************
+# Imports
+# ****************************************************************************************************
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from enum import Enum
+from typing import List, Union
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Internal
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from whatthelog.auto_printer import AutoPrinter
+from whatthelog.prefixtree.graph import Graph
+from whatthelog.prefixtree.state import State
+from whatthelog.syntaxtree.syntax_tree import SyntaxTree
+
+
+# ****************************************************************************************************
+# Trace Monitor
+# ****************************************************************************************************
+
+class MonitorStatus(Enum):
+    """
+    Status of a trace being monitored.
+    """
+
+    # The lines so far match a path, but the trace cannot end here
+    MATCHING = "matching"
+    # The lines so far match a path, and the trace may end here
+    TERMINAL = "terminal"
+    # A line did not match any path
+    REJECTED = "rejected"
+
+
+class TraceMonitor(AutoPrinter):
+    """
+    Incremental matcher of a trace against a model, fed one log line at a time, e.g. from a live log tail.
+    The monitor holds the set of states the lines so far can lead to, so that non-deterministic models
+    are supported, and each line costs a transition lookup per state in the set.
+    Once a line is rejected the monitor ignores the following lines until it is reset.
+    """
+
+    def __init__(self, model: Graph, syntax_tree: SyntaxTree):
+        """
+        Trace monitor constructor.
+        :param model: the model the trace is matched against
+        :param syntax_tree: the syntax tree used to get the template of each line
+        """
+
+        self.model = model
+        self.syntax_tree = syntax_tree
+
+        self.frontier: List[int] = []
+        self.status = MonitorStatus.MATCHING
+        self.line_number = 0
+        self.rejected_at: Union[int, None] = None
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Starts monitoring a new trace from the start node of the model.
+        """
+
+        # Pending merges may remove the start node, so they are applied before looking up its index
+        self.model.compact()
+        self.frontier = [self.model.state_indices_by_id[id(self.model.start_node)]]
+        self.status = MonitorStatus.MATCHING
+        self.line_number = 0
+        self.rejected_at = None
+
+    def feed(self, line: str) -> MonitorStatus:
+        """
+        Consumes the next line of the trace.
+        :param line: the log line
+        :return: the status of the trace after the line
+        """
+
+        template = self.syntax_tree.search(line)
+        return self.feed_template(template.name if template is not None else None)
+
+    def feed_template(self, template: Union[str, None]) -> MonitorStatus:
+        """
+        Consumes the template of the next line of the trace.
+        :param template: the name of the template, None for a line without a template
+        :return: the status of the trace after the line
+        """
+
+        self.line_number += 1
+        if self.status is MonitorStatus.REJECTED:
+            return self.status
+
+        reached = self.model.advance(self.frontier, template)
+
+        if len(reached) == 0:
+            self.status = MonitorStatus.REJECTED
+            self.rejected_at = self.line_number
+        else:
+            self.frontier = sorted(reached)
+            self.status = MonitorStatus.TERMINAL \
+                if any(self.model.is_accepting(state) for state in self.frontier) else MonitorStatus.MATCHING
+
+        return self.status
+
+    def is_accepted(self) -> bool:
+        """
+        Checks if the trace would be accepted if it ended now.
+        """
+        return self.status is MonitorStatus.TERMINAL
+
+    def get_states(self) -> List[State]:
+        """
+        Retrieves the states the lines so far can lead to.
+        :return: the current states, empty if the trace was rejected
+        """
+
+        if self.status is MonitorStatus.REJECTED:
+            return []
+        return [self.model.states[index] for index in self.frontier]
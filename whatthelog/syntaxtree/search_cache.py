@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sunday 10/18/2026
+Author: Tommaso Brandirali
+Email: tommaso.brandirali@gmail.com
+"""
+
+#****************************************************************************************************
+# Imports
+#****************************************************************************************************
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, Union
+import re
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Internal
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from whatthelog.auto_printer import AutoPrinter
+from whatthelog.syntaxtree.syntax_tree import SyntaxTree
+
+
+#****************************************************************************************************
+# Search Cache
+#****************************************************************************************************
+
+class SearchCache(AutoPrinter):
+    """
+    A bounded LRU cache in front of `SyntaxTree.search`.
+    Lines are normalised into a skeleton by masking every run of hex characters containing a digit,
+    such as timestamps, hashes and counters, and the search result is cached per skeleton.
+    The cache exposes the same `search` method as the syntax tree, so it can be used in its place.
+
+    Two lines with the same skeleton are assumed to match the same template.
+    This does not hold for every syntax tree, e.g. when a template matches a fixed number of digits,
+    so a verification mode is provided to check cached answers against the full tree search.
+    """
+
+    # Matches only start at the beginning of a run, so that runs of hex letters without a digit
+    # are rejected in linear time rather than retried from each of their characters
+    skeleton_pattern = re.compile(r"(?<![0-9A-Fa-f])[A-Fa-f]*[0-9][0-9A-Fa-f]*")
+    skeleton_mask = "#"
+
+    def __init__(self, tree: SyntaxTree, max_size: int = 4096, verify: bool = False):
+        """
+        Search cache constructor.
+        :param tree: the syntax tree to search on cache misses
+        :param max_size: the maximum number of skeletons held in the cache
+        :param verify: whether cached answers should be checked against the full tree search
+        """
+
+        assert max_size > 0, "Cache size must be positive!"
+
+        self.tree = tree
+        self.max_size = max_size
+        self.verify = verify
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.mismatches = 0
+
+        self.__entries: OrderedDict[str, Union[SyntaxTree, None]] = OrderedDict()
+
+    #================================================================================
+    # Search
+    #================================================================================
+
+    def search(self, input: str) -> Union[SyntaxTree, None]:
+        """
+        Search the syntax tree for the leaf matching the input string,
+        using the cached result for the skeleton of the input if available.
+        :param input: the string to match
+        :return: the syntax tree node representing the best match, or None if no match found
+        """
+
+        skeleton = self.skeleton(input)
+
+        if skeleton in self.__entries:
+            self.hits += 1
+            self.__entries.move_to_end(skeleton)
+            result = self.__entries[skeleton]
+
+            if self.verify:
+                expected = self.tree.search(input)
+                if expected is not result:
+                    self.mismatches += 1
+                    self.print(f"WARNING: Cached template for skeleton '{skeleton.strip()}' does not match search")
+                    self.__entries[skeleton] = expected
+                    return expected
+
+            return result
+
+        self.misses += 1
+        result = self.tree.search(input)
+        self.__entries[skeleton] = result
+
+        if len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+            self.evictions += 1
+
+        return result
+
+    @classmethod
+    def skeleton(cls, input: str) -> str:
+        """
+        Normalises a line by masking every run of hex characters containing a digit.
+        :param input: the line to normalise
+        :return: the skeleton of the line
+        """
+        return cls.skeleton_pattern.sub(cls.skeleton_mask, input)
+
+    #================================================================================
+    # Statistics
+    #================================================================================
+
+    def get_statistics(self) -> Dict[str, int]:
+        """
+        Cache statistics getter.
+        :return: a dictionary holding the hit, miss, eviction and mismatch counters and the current size
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "mismatches": self.mismatches,
+            "size": len(self.__entries)
+        }
+
+    def clear(self) -> None:
+        """
+        Removes all entries from the cache and resets its counters.
+        """
+
+        self.__entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.mismatches = 0
+
+    def __len__(self):
+        return len(self.__entries)
@@ -15,8 +15,16 @@ Email: tommaso.brandirali@gmail.com
 
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import List, Union
+from time import perf_counter
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
+import json
 import re
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+import numpy as np
 
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 # Internal
@@ -42,12 +50,51 @@ class SyntaxTree(AutoPrinter):
 
     def __post_init__(self):
         try:
-            prefix = re.escape(self.prefix) if not self.isRegex else self.prefix
-            self.__pattern = re.compile(prefix)
+            self.__pattern: Union[re.Pattern, None] = re.compile(self.__pattern_source())
         except re.error:
             self.print(f"ERROR: Invalid pattern given for Node '{self.name}'")
             raise ValueError
 
+        # Backreferences cannot be used in the combined pattern, as it renumbers the groups of every node
+        self.__backreferences: bool = self.isRegex and self.__has_backreferences(self.prefix)
+        # Global inline flags cannot be used in the combined pattern either, as they would apply to every node
+        self.__global_flags: bool = self.isRegex and self.__has_global_flags(self.prefix)
+        # Patterns looking behind their start are matched against the stem, as if it were a separate string
+        self.__looks_behind_start: bool = self.isRegex and self.__looks_behind(self.prefix)
+
+        self.__parent: Union[SyntaxTree, None] = None
+        self.__matcher: Union[re.Pattern, None] = None
+        self.__leaves_by_group: Dict[int, SyntaxTree] = {}
+        self.__leaves: Union[List[SyntaxTree], None] = None
+        self.__leaf_ids: Dict[int, int] = {}
+        self.__ids_by_name: Dict[str, int] = {}
+
+        # Children indexed by the first character of their literal prefix
+        self.__dispatch: Dict[str, List[SyntaxTree]] = {}
+        # Children that cannot be indexed, tried in order for any other first character
+        self.__fallback: List[SyntaxTree] = []
+        for child in self.__children:
+            self.__index_child(child)
+
+        # Hit-frequency statistics, only recorded by the tree walk when enabled
+        self.__statistics: bool = False
+        self.__reached: int = 0
+        self.__matched: int = 0
+        self.__match_time: float = 0.0
+
+    def __getstate__(self):
+        # Node patterns are only needed by the tree walk, they are recompiled lazily after unpickling
+        state = self.__dict__.copy()
+        state['_SyntaxTree__pattern'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        # Leaf ids are keyed by object identity, which is not preserved by pickling
+        if self.__leaves is not None:
+            self.__leaf_ids = {id(leaf): index for index, leaf in enumerate(self.__leaves)}
+
     #================================================================================
     # Class Methods
     #================================================================================
@@ -62,6 +109,8 @@ class SyntaxTree(AutoPrinter):
         """
         Syntax tree pattern getter.
         """
+        if self.__pattern is None:
+            self.__pattern = re.compile(self.__pattern_source())
         return self.__pattern
 
     def insert(self, child: SyntaxTree) -> None:
@@ -70,29 +119,395 @@ class SyntaxTree(AutoPrinter):
         """
 
         self.__children.append(child)
+        self.__index_child(child)
+        child.__parent = self
+        if self.__statistics:
+            child.enable_statistics()
+        self.__invalidate()
+
+    def compile(self) -> None:
+        """
+        Compiles the whole tree rooted at this node into a single combined pattern,
+        so that a line can be classified with one call to the regex engine.
+        Every node pattern is wrapped in an atomic group, and the children of a node
+        are tried as an ordered alternation, which mirrors the first-match-wins
+        semantics of the recursive tree walk.
+        If the combined pattern cannot be compiled, the tree falls back to the tree walk.
+        It also does if a node pattern holds backreferences, which would refer to different groups
+        in the combined pattern, or global inline flags such as (?i), which would apply to the whole
+        combined pattern, or if a node below this one uses start anchors, word boundaries or lookbehinds,
+        which would see the text matched by its ancestors rather than the start of its stem.
+        """
+
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.__backreferences or node.__global_flags or (node.__looks_behind_start and node is not self):
+                self.print(f"WARNING: Node '{node.name}' uses backreferences, global flags, anchors or lookbehinds, "
+                           f"using tree walk for Node '{self.name}'")
+                self.__matcher = None
+                self.__leaves_by_group = {}
+                return
+            stack.extend(node.__children)
+
+        group_names: Dict[str, SyntaxTree] = {}
+        try:
+            matcher = re.compile(self.__combined_pattern(group_names))
+        except re.error:
+            self.print(f"WARNING: Could not compile combined pattern for Node '{self.name}', using tree walk")
+            self.__matcher = None
+            self.__leaves_by_group = {}
+            return
+
+        self.__matcher = matcher
+        self.__leaves_by_group = {matcher.groupindex[group]: node
+                                  for group, node in group_names.items() if len(node.get_children()) == 0}
+
+    def is_compiled(self) -> bool:
+        """
+        Checks whether a combined pattern is currently available for this tree.
+        """
+        return self.__matcher is not None
 
     def search(self, input: str) -> Union[SyntaxTree, None]:
         """
-        Recursively search the syntax tree for Nodes matching the
+        Search the syntax tree for the leaf matching the input string.
+        Uses the combined pattern if the tree was compiled, and the recursive tree walk otherwise.
+        The tree walk is always used while statistics are enabled.
         :param input: the string to match
         :return: the syntax tree node representing the best match, or None if no match found
         """
 
-        # Syntax match found at the beginning of the string
-        position = re.search(self.__pattern, input)
-        if position and position.start() == 0:
+        if self.__matcher is not None and not self.__statistics:
+            match = self.__matcher.match(input)
+            return self.__leaves_by_group[match.lastindex] if match else None
+
+        return self.__search(input, 0)
+
+    def search_many(self, lines: Iterable[str]) -> np.ndarray:
+        """
+        Classifies a batch of lines into template ids.
+        Template ids are the indices of the matched leaves in the vocabulary of this tree,
+        as returned by `get_vocabulary`.
+        :param lines: the lines to classify
+        :return: an int32 array holding the template id of each line, or -1 for unmatched lines
+        """
+
+        self.__build_vocabulary()
+        leaf_ids = self.__leaf_ids
+
+        ids = (leaf_ids[id(leaf)] if leaf is not None else -1 for leaf in map(self.search, lines))
+        if isinstance(lines, list):
+            return np.fromiter(ids, dtype=np.int32, count=len(lines))
+        return np.fromiter(ids, dtype=np.int32)
+
+    def get_vocabulary(self) -> List[str]:
+        """
+        Template vocabulary getter.
+        The vocabulary holds the names of the leaves of this tree in depth-first order,
+        the index of a name is its template id.
+        :return: the list of template names indexed by template id
+        """
+
+        self.__build_vocabulary()
+        return [leaf.name for leaf in self.__leaves]
+
+    def get_template_id(self, name: str) -> int:
+        """
+        Retrieves the template id of a leaf from its name.
+        :param name: the name of the leaf
+        :return: the template id of the leaf, or -1 if no leaf has the given name
+        """
+
+        self.__build_vocabulary()
+        return self.__ids_by_name.get(name, -1)
+
+    #================================================================================
+    # Statistics
+    #================================================================================
+
+    def enable_statistics(self, enabled: bool = True) -> None:
+        """
+        Enables or disables the recording of hit-frequency statistics for every node of this tree.
+        For each node, the statistics count how many lines reached the node, how many matched it,
+        and the cumulative time spent matching its pattern.
+        :param enabled: whether statistics should be recorded
+        """
+
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node.__statistics = enabled
+            stack.extend(node.__children)
+
+    def reset_statistics(self) -> None:
+        """
+        Resets the statistics of every node of this tree.
+        """
+
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node.__reached = 0
+            node.__matched = 0
+            node.__match_time = 0.0
+            stack.extend(node.__children)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        Statistics getter.
+        :return: a nested dictionary mirroring the structure of the tree,
+                 holding the number of lines that reached and matched each node and the cumulative match time
+        """
+
+        return {
+            "name": self.name,
+            "reached": self.__reached,
+            "matched": self.__matched,
+            "time": self.__match_time,
+            "children": [child.get_statistics() for child in self.__children]
+        }
+
+    def dump_statistics(self, filepath: str) -> None:
+        """
+        Dumps the statistics of this tree to a file in JSON format.
+        :param filepath: the path to the output file
+        """
+
+        with open(filepath, 'w+') as f:
+            json.dump(self.get_statistics(), f, indent=2)
+
+    def reorder_children(self) -> None:
+        """
+        Recursively sorts the children of every node by the number of lines that matched them,
+        so that the most common templates are tried first.
+        Since the first matching child wins, children are only moved within runs of consecutive
+        literal children where no prefix is a prefix of another, as no line can match two of them.
+        Template ids are kept, so that traces encoded before the reordering remain valid,
+        and only the combined pattern is discarded, it is recompiled if the tree was compiled.
+        """
 
-            stem = re.sub(self.__pattern, '', input, 1)
+        was_compiled = self.is_compiled()
+        self.__build_vocabulary()
+
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node.__reorder()
+            stack.extend(node.__children)
+
+        self.__invalidate(vocabulary=False)
+        if was_compiled:
+            self.compile()
+
+    def __reorder(self) -> None:
+        """
+        Sorts the disjoint runs of children of this node by their number of matches,
+        and rebuilds the dispatch table accordingly.
+        """
+
+        runs: List[List[SyntaxTree]] = []
+        for child in self.__children:
+            run = runs[-1] if runs else None
+            if run is not None and not child.isRegex and all(
+                    not other.isRegex and
+                    not other.prefix.startswith(child.prefix) and
+                    not child.prefix.startswith(other.prefix) for other in run):
+                run.append(child)
+            else:
+                runs.append([child])
+
+        self.__children[:] = [child for run in runs
+                              for child in sorted(run, key=lambda c: c.__matched, reverse=True)]
+
+        self.__dispatch = {}
+        self.__fallback = []
+        for child in self.__children:
+            self.__index_child(child)
+
+    def __search(self, input: str, pos: int) -> Union[SyntaxTree, None]:
+        """
+        Recursively search the syntax tree for Nodes matching the input string from the given position.
+        The position is passed down the tree instead of slicing the string,
+        and node patterns are matched anchored at that position.
+        Patterns using start anchors, word boundaries or lookbehinds are matched against the sliced stem instead,
+        so that they see the start of the stem as the start of the string, as they always did.
+        :param input: the string to match
+        :param pos: the index in the input string where this node's pattern should match
+        :return: the syntax tree node representing the best match, or None if no match found
+        """
+
+        # Syntax match found at the current position of the string
+        pattern = self.__pattern
+        if pattern is None:
+            pattern = self.get_pattern()
+
+        if self.__looks_behind_start and pos > 0:
+            subject, start = input[pos:], 0
+        else:
+            subject, start = input, pos
+
+        if self.__statistics:
+            self.__reached += 1
+            timer = perf_counter()
+            match = pattern.match(subject, start)
+            self.__match_time += perf_counter() - timer
+            if match:
+                self.__matched += 1
+        else:
+            match = pattern.match(subject, start)
+
+        if match:
 
             if len(self.__children) == 0:
                 return self
 
-            for child in self.__children:
+            end = pos + match.end() - start
+            for child in self.__dispatch.get(input[end:end + 1], self.__fallback):
 
-                result = child.search(stem)
+                result = child.__search(input, end)
 
                 # Child match found
                 if result:
                     return result
 
         return None
+
+    def __combined_pattern(self, group_names: Dict[str, SyntaxTree]) -> str:
+        """
+        Recursively builds the combined pattern for the subtree rooted at this node.
+        The node pattern is emulated as an atomic group through a lookahead and a backreference,
+        so that the regex engine never backtracks into it, just like the tree walk.
+        The group of a leaf is the last group closed in a successful match,
+        which allows retrieving the matched leaf through the match's `lastindex`.
+        :param group_names: the mapping from group names to nodes, filled in place
+        :return: the combined pattern
+        """
+
+        group = f"_node{len(group_names)}"
+        group_names[group] = self
+        pattern = f"(?=(?P<{group}>{self.__pattern_source()}))(?P={group})"
+
+        if len(self.__children) == 0:
+            return pattern
+
+        alternatives = [child.__combined_pattern(group_names) for child in self.__children]
+        return pattern + "(?:" + "|".join(alternatives) + ")"
+
+    @staticmethod
+    def __parse_operations(pattern: str) -> Iterator[Tuple[Any, Any]]:
+        """
+        Parses a regex pattern with sre_parse and iterates over its operations, at any nesting depth.
+        :param pattern: the regex source
+        :return: an iterator over the (opcode, argument) pairs of the pattern
+        """
+
+        stack: List[Any] = [sre_parse.parse(pattern)]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, sre_parse.SubPattern):
+                for op, av in item:
+                    yield op, av
+                    stack.append(av)
+            elif isinstance(item, (list, tuple)):
+                stack.extend(item)
+
+    @staticmethod
+    def __has_backreferences(pattern: str) -> bool:
+        """
+        Checks whether a regex pattern refers to its own groups, through backreferences or conditional groups.
+        :param pattern: the regex source
+        :return: True if the pattern holds any group reference, False otherwise
+        """
+        return any(op == sre_parse.GROUPREF or op == sre_parse.GROUPREF_EXISTS
+                   for op, _ in SyntaxTree.__parse_operations(pattern))
+
+    @staticmethod
+    def __has_global_flags(pattern: str) -> bool:
+        """
+        Checks whether a regex pattern sets inline flags for the whole pattern, e.g. (?i) rather than (?i:...).
+        The unicode flag is ignored, as it is the default for string patterns.
+        :param pattern: the regex source
+        :return: True if the pattern sets any global flag, False otherwise
+        """
+        return sre_parse.parse(pattern).state.flags & ~sre_parse.SRE_FLAG_UNICODE != 0
+
+    @staticmethod
+    def __looks_behind(pattern: str) -> bool:
+        """
+        Checks whether a regex pattern depends on the text before its starting position,
+        through start anchors, word boundaries or lookbehinds.
+        :param pattern: the regex source
+        :return: True if the pattern looks behind its starting position, False otherwise
+        """
+
+        anchors = (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_LINE, sre_parse.AT_BEGINNING_STRING,
+                   sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY)
+        return any((op == sre_parse.AT and av in anchors) or
+                   ((op == sre_parse.ASSERT or op == sre_parse.ASSERT_NOT) and av[0] < 0)
+                   for op, av in SyntaxTree.__parse_operations(pattern))
+
+    def __pattern_source(self) -> str:
+        """
+        Builds the regex source of this node's prefix.
+        """
+        return re.escape(self.prefix) if not self.isRegex else self.prefix
+
+    def __index_child(self, child: SyntaxTree) -> None:
+        """
+        Adds a child to the dispatch table of this node.
+        Literal children are only candidates for stems starting with their first character,
+        while regex children are candidates for any stem.
+        Every candidate list preserves the insertion order of the children.
+        :param child: the child to index
+        """
+
+        if child.isRegex or len(child.prefix) == 0:
+            self.__fallback.append(child)
+            for candidates in self.__dispatch.values():
+                candidates.append(child)
+        else:
+            key = child.prefix[0]
+            if key not in self.__dispatch:
+                self.__dispatch[key] = list(self.__fallback)
+            self.__dispatch[key].append(child)
+
+    def __build_vocabulary(self) -> None:
+        """
+        Collects the leaves of this tree in depth-first order and assigns them template ids,
+        unless a vocabulary is already available.
+        """
+
+        if self.__leaves is not None:
+            return
+
+        leaves = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if len(node.__children) == 0:
+                leaves.append(node)
+            else:
+                stack.extend(reversed(node.__children))
+
+        self.__leaves = leaves
+        self.__leaf_ids = {id(leaf): index for index, leaf in enumerate(leaves)}
+        self.__ids_by_name = {}
+        for index, leaf in enumerate(leaves):
+            self.__ids_by_name.setdefault(leaf.name, index)
+
+    def __invalidate(self, vocabulary: bool = True) -> None:
+        """
+        Discards the combined patterns and vocabularies of this node and all its ancestors,
+        as they no longer reflect the structure of the tree.
+        :param vocabulary: whether the vocabularies are discarded as well,
+                           which is not needed when children are only reordered
+        """
+
+        node = self
+        while node is not None:
+            node.__matcher = None
+            node.__leaves_by_group = {}
+            if vocabulary:
+                node.__leaves = None
+            node = node.__parent
@@ -13,13 +13,18 @@ Email: tommaso.brandirali@gmail.com
 # External
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
+import hashlib
 import json
+import os
+import pickle
+from typing import Union
 
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 # Internal
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
 from whatthelog.auto_printer import AutoPrinter
+from whatthelog.syntaxtree import syntax_tree
 from whatthelog.syntaxtree.syntax_tree import SyntaxTree
 
 
@@ -30,8 +35,20 @@ from whatthelog.syntaxtree.syntax_tree import SyntaxTree
 class SyntaxTreeFactory(AutoPrinter):
     """
     A factory class for parsing a configuration file into a compiled Prefix Tree.
+    Parsed trees can be cached on disk, keyed by the content hash of the configuration file,
+    so that repeated runs and worker processes skip parsing and compiling the configuration.
     """
 
+    # Bump this whenever the pickled layout of SyntaxTree changes, to invalidate existing caches
+    cache_version = 2
+
+    def __init__(self, cache_dir: Union[str, os.PathLike, None] = None):
+        """
+        Syntax tree factory constructor.
+        :param cache_dir: the directory holding cached syntax trees, or None to disable caching
+        """
+        self.cache_dir = cache_dir
+
     #================================================================================
     # Parse input
     #================================================================================
@@ -45,14 +62,76 @@ class SyntaxTreeFactory(AutoPrinter):
             prefix: string (possibly regex pattern)
             children: [...]
         }.
+        The parsed tree is compiled into a single combined pattern before being returned.
+        If a cache directory is set, the compiled tree is loaded from the cache when available,
+        and stored in it otherwise.
         :param filepath: the path to the configuration JSON file
         :return: a compiled instance of PrefixTree
         """
 
-        with open(filepath, 'r') as f:
-            configs = json.load(f)
-            assert isinstance(configs, dict), f"Invalid configuration file: expected 'dict' but got '{configs.__class__}'"
-            return self.__parse(configs)
+        with open(filepath, 'rb') as f:
+            content = f.read()
+
+        cache_file = self.__get_cache_file(content)
+        if cache_file is not None and os.path.isfile(cache_file):
+            try:
+                with open(cache_file, 'rb') as f:
+                    return pickle.load(f)
+            except Exception:
+                # Stale caches may fail in many ways, e.g. ImportError or ValueError, the tree is parsed again
+                self.print(f"WARNING: Discarding unreadable syntax tree cache '{cache_file}'")
+
+        configs = json.loads(content)
+        assert isinstance(configs, dict), f"Invalid configuration file: expected 'dict' but got '{configs.__class__}'"
+        tree = self.__parse(configs)
+
+        tree.compile()
+        tree.get_vocabulary()
+
+        if cache_file is not None:
+            self.__store(tree, cache_file)
+
+        return tree
+
+    def __get_cache_file(self, content: bytes) -> Union[str, None]:
+        """
+        Computes the path of the cache file for a configuration, based on the hash of its content.
+        The source of the SyntaxTree module is hashed as well, so that caches pickled by
+        a different version of the class are never loaded.
+        :param content: the content of the configuration file
+        :return: the path of the cache file, or None if caching is disabled
+        """
+
+        if self.cache_dir is None:
+            return None
+
+        digest = hashlib.sha256(content)
+        try:
+            with open(syntax_tree.__file__, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+        digest = digest.hexdigest()
+        return os.path.join(self.cache_dir, f"syntax_tree_v{self.cache_version}_{digest}.pickle")
+
+    def __store(self, tree: SyntaxTree, cache_file: str) -> None:
+        """
+        Pickles a compiled tree into the cache.
+        The tree is written to a temporary file first, so that concurrent readers never see a partial file.
+        :param tree: the compiled tree to store
+        :param cache_file: the path of the cache file
+        """
+
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_file, 'wb') as f:
+                pickle.dump(tree, f)
+            os.replace(temp_file, cache_file)
+        except OSError:
+            self.print(f"WARNING: Could not write syntax tree cache '{cache_file}'")
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
 
     def __parse(self, configs: dict) -> SyntaxTree:
 
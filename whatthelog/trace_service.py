@@ -0,0 +1,269 @@
+# ****************************************************************************************************
+# Imports
+# ****************************************************************************************************
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# External
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from __future__ import annotations
+import asyncio
+from dataclasses import dataclass
+import os
+from typing import AsyncIterator, Union
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Internal
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+from whatthelog.auto_printer import AutoPrinter
+from whatthelog.prefixtree.graph import Graph
+from whatthelog.prefixtree.prefix_tree_factory import PrefixTreeFactory
+from whatthelog.prefixtree.trace_monitor import TraceMonitor
+from whatthelog.syntaxtree.syntax_tree import SyntaxTree
+from whatthelog.syntaxtree.syntax_tree_factory import SyntaxTreeFactory
+
+
+# ****************************************************************************************************
+# Trace Event
+# ****************************************************************************************************
+
+@dataclass
+class TraceEvent:
+    """
+    Outcome of a completed trace.
+    """
+
+    # The file, or socket and connection number, the trace was read from
+    source: str
+    # The number of the trace within its source, starting from 0
+    trace: int
+    accepted: bool
+    # The number of lines of the trace
+    lines: int
+    # The line at which the trace was rejected, None if it did not deviate from the model
+    rejected_at: Union[int, None] = None
+
+    def __str__(self):
+        if self.accepted:
+            return f"{self.source} #{self.trace}: accepted ({self.lines} lines)"
+        if self.rejected_at is None:
+            return f"{self.source} #{self.trace}: rejected, incomplete ({self.lines} lines)"
+        return f"{self.source} #{self.trace}: rejected at line {self.rejected_at} ({self.lines} lines)"
+
+
+# ****************************************************************************************************
+# Trace Service
+# ****************************************************************************************************
+
+class TraceService(AutoPrinter):
+    """
+    Long-lived asyncio service matching many concurrent log streams against a model loaded once.
+    Each file or socket connection is a session, read line by line into a TraceMonitor,
+    so a session only holds the current states of its trace and at most one line.
+    A trace ends with a blank line or with the end of its stream, and emits a TraceEvent.
+
+    Events are put into a bounded queue: when it is full, sessions stop reading until events are consumed,
+    which in turn stops socket clients through the transport flow control.
+    Socket clients also receive one line per completed trace, the string form of its event.
+    """
+
+    def __init__(self, model: Graph, syntax_tree: SyntaxTree,
+                 max_events: int = 1024, line_limit: int = 2 ** 16, poll_interval: float = 0.1):
+        """
+        Trace service constructor.
+        :param model: the model traces are matched against
+        :param syntax_tree: the syntax tree used to get the template of each line
+        :param max_events: the maximum number of events waiting to be consumed
+        :param line_limit: the maximum length of a line in bytes, longer lines are discarded and rejected
+        :param poll_interval: the time in seconds between two reads of a followed file at its end
+        """
+
+        self.model = model
+        self.syntax_tree = syntax_tree
+        self.max_events = max_events
+        self.line_limit = line_limit
+        self.poll_interval = poll_interval
+
+        # Created on first use, so that it belongs to the running event loop
+        self.__events: Union[asyncio.Queue, None] = None
+        self.__connections = 0
+
+        # Build the transition index once, rather than in the first session
+        model.get_transitions()
+
+    @staticmethod
+    def load(model_file: str, config_file: str, cache_dir: str = None, **kwargs) -> TraceService:
+        """
+        Builds a service from a pickled model and a syntax tree configuration file.
+        :param model_file: the pickle file of the model
+        :param config_file: the configuration file describing the syntax tree
+        :param cache_dir: the directory holding cached syntax trees, or None to disable caching
+        :return: the trace service
+        """
+
+        model = PrefixTreeFactory.unpickle_tree(model_file)
+        syntax_tree = SyntaxTreeFactory(cache_dir).parse_file(config_file)
+        return TraceService(model, syntax_tree, **kwargs)
+
+    @property
+    def events(self) -> asyncio.Queue:
+        """
+        Queue of the events of the completed traces.
+        """
+
+        if self.__events is None:
+            self.__events = asyncio.Queue(self.max_events)
+        return self.__events
+
+    async def tail_file(self, filepath: str, follow: bool = False) -> None:
+        """
+        Matches the traces written to a file.
+        :param filepath: the path to the file
+        :param follow: whether to keep waiting for new lines at the end of the file, as `tail -f` does
+        """
+        await self.__run_session(str(filepath), self.__file_lines(filepath, follow))
+
+    async def serve_unix(self, socket_path: str) -> asyncio.AbstractServer:
+        """
+        Starts accepting connections on a Unix socket, each connection being a session.
+        :param socket_path: the path to the socket
+        :return: the server, which should be closed to stop accepting connections
+        """
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return await asyncio.start_unix_server(self.__handle_connection, socket_path, limit=self.line_limit)
+
+    async def __handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Runs the session of a socket connection, answering each completed trace.
+        """
+
+        source = f"{writer.get_extra_info('sockname')}:{self.__connections}"
+        self.__connections += 1
+        try:
+            await self.__run_session(source, self.__stream_lines(reader), writer)
+        finally:
+            writer.close()
+
+    async def __run_session(self, source: str, lines: AsyncIterator[Union[bytes, None]],
+                            writer: asyncio.StreamWriter = None) -> None:
+        """
+        Matches the traces of a stream of lines, emitting an event per completed trace.
+        :param source: the name of the stream
+        :param lines: the lines of the stream, None for lines that were too long
+        :param writer: the stream to answer to, if any
+        """
+
+        monitor = TraceMonitor(self.model, self.syntax_tree)
+        trace = 0
+
+        async for line in lines:
+            if line is None:
+                monitor.feed_template(None)
+                continue
+
+            if line.endswith(b'\r\n'):
+                line = line[:-2] + b'\n'
+
+            # A blank line ends the current trace
+            if line.strip() == b'':
+                if monitor.line_number > 0:
+                    await self.__complete(source, trace, monitor, writer)
+                    trace += 1
+                continue
+
+            monitor.feed(line.decode('utf-8', 'replace'))
+
+        if monitor.line_number > 0:
+            await self.__complete(source, trace, monitor, writer)
+
+    async def __complete(self, source: str, trace: int, monitor: TraceMonitor,
+                         writer: Union[asyncio.StreamWriter, None]) -> None:
+        """
+        Emits the event of a completed trace and resets the monitor.
+        """
+
+        event = TraceEvent(source, trace, monitor.is_accepted(), monitor.line_number, monitor.rejected_at)
+        monitor.reset()
+
+        await self.events.put(event)
+        if writer is not None:
+            writer.write(str(event).encode() + b'\n')
+            await writer.drain()
+
+    async def __file_lines(self, filepath: str, follow: bool) -> AsyncIterator[Union[bytes, None]]:
+        """
+        Reads the lines of a file, waiting for new lines at its end if following it.
+        Reads run in the default executor, so that a slow file never blocks the other sessions.
+        """
+
+        loop = asyncio.get_running_loop()
+        file = await loop.run_in_executor(None, open, filepath, 'rb')
+        try:
+            partial = b''
+            too_long = False
+
+            while True:
+                line = await loop.run_in_executor(None, file.readline, self.line_limit + 1)
+
+                if not line:
+                    if follow:
+                        await asyncio.sleep(self.poll_interval)
+                        continue
+                    if partial or too_long:
+                        yield None if too_long else partial
+                    return
+
+                # Lines may be read in several parts, while being written or when too long
+                if not too_long:
+                    partial += line
+                    if len(partial) > self.line_limit:
+                        too_long = True
+                        partial = b''
+
+                if line.endswith(b'\n'):
+                    yield None if too_long else partial
+                    partial = b''
+                    too_long = False
+        finally:
+            file.close()
+
+    @staticmethod
+    async def __stream_lines(reader: asyncio.StreamReader) -> AsyncIterator[Union[bytes, None]]:
+        """
+        Reads the lines of a socket connection until it is closed.
+        """
+
+        while True:
+            try:
+                line = await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                # The connection was closed, possibly in the middle of a line
+                if e.partial:
+                    yield e.partial
+                return
+            except asyncio.LimitOverrunError:
+                # The line exceeded the limit, it is discarded up to its end so that its tail is not read as a line
+                await TraceService.__discard_line(reader)
+                yield None
+                continue
+
+            yield line
+
+    @staticmethod
+    async def __discard_line(reader: asyncio.StreamReader) -> None:
+        """
+        Discards the data of a socket connection up to and including the next newline, or until it is closed.
+        """
+
+        while True:
+            try:
+                await reader.readuntil(b'\n')
+                return
+            except asyncio.IncompleteReadError:
+                return
+            except asyncio.LimitOverrunError as e:
+                # The data examined so far holds no newline within the limit, it is consumed without being kept
+                await reader.readexactly(e.consumed)